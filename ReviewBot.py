@@ -1,10 +1,13 @@
 #!/usr/bin/python3
 
+from concurrent.futures import ThreadPoolExecutor
 from enum import Enum, unique
 import os
 import sys
 import re
 import logging
+import threading
+import traceback
 from typing import Generator, List, Optional, Tuple, Union
 import cmdln
 from collections import namedtuple
@@ -19,6 +22,10 @@ from osclib.core import maintainers_get
 from osclib.core import package_role_expand
 from osclib.core import request_action_key
 from osclib.core import request_age
+from osclib.core import request_cache_invalidate
+from osclib.core import requests_get
+from osclib.core import requests_search
+from osclib.core import REQUEST_STATS
 from osclib.memoize import memoize
 from osclib.memoize import memoize_session_reset
 from osclib.stagingapi import StagingAPI
@@ -78,6 +85,25 @@ class ReviewChoices(Enum):
     FALLBACK_ALWAYS = 'fallback-always'
 
 
+class ReviewContext(object):
+    """
+    State of the request being checked, which is kept per thread by ReviewBot
+    so that several requests can be checked concurrently.
+    """
+
+    def __init__(self, request=None, review_messages=None, comment_handler=False):
+        self.request: Optional[osc.core.Request] = request
+        self.action: Optional[osc.core.Action] = None
+        self.review_messages = review_messages
+        self.multiple_actions = False
+        self.comment_handler = comment_handler
+
+    def fork(self, request):
+        """Context for checking request in another thread, starting from this one."""
+        comment_handler = self.comment_handler is not False
+        return ReviewContext(request, dict(self.review_messages), comment_handler)
+
+
 class ReviewBot(object):
     """
     A generic obs request reviewer
@@ -85,8 +111,18 @@ class ReviewBot(object):
 
     def check_action_<type>(self, req, action):
         return (None|True|False)
+
+    The request, action, review_messages, multiple_actions and
+    comment_handler attributes belong to the request being checked by the
+    current thread (see ReviewContext). Setting workers above 1 checks that
+    many requests concurrently, but only for subclasses which set
+    concurrent_safe after making sure they keep any further per-request
+    state in their ReviewContext as well.
     """
 
+    # Whether requests may be checked concurrently, see workers.
+    concurrent_safe = False
+
     DEFAULT_REVIEW_MESSAGES = {'accepted': 'ok', 'declined': 'review failed'}
     REVIEW_CHOICES: Tuple[ReviewChoices, ...] = (
         ReviewChoices.NORMAL, ReviewChoices.NO, ReviewChoices.ACCEPT,
@@ -112,6 +148,9 @@ class ReviewBot(object):
         self.review_user = user
         self.review_group = group
         self.requests: List[osc.core.Request] = []
+        self.context_main = ReviewContext()
+        self.local = threading.local()
+        self.workers = 1
         self.review_messages = ReviewBot.DEFAULT_REVIEW_MESSAGES
         self._review_mode: ReviewChoices = ReviewChoices.NORMAL
         self.fallback_user = None
@@ -171,6 +210,50 @@ class ReviewBot(object):
 
         return self.staging_apis[project]
 
+    @property
+    def context(self) -> ReviewContext:
+        return getattr(self.local, 'context', self.context_main)
+
+    @property
+    def request(self) -> osc.core.Request:
+        return self.context.request
+
+    @request.setter
+    def request(self, value: osc.core.Request) -> None:
+        self.context.request = value
+
+    @property
+    def action(self) -> osc.core.Action:
+        return self.context.action
+
+    @action.setter
+    def action(self, value: osc.core.Action) -> None:
+        self.context.action = value
+
+    @property
+    def review_messages(self) -> dict:
+        return self.context.review_messages
+
+    @review_messages.setter
+    def review_messages(self, value: dict) -> None:
+        self.context.review_messages = value
+
+    @property
+    def multiple_actions(self) -> bool:
+        return self.context.multiple_actions
+
+    @multiple_actions.setter
+    def multiple_actions(self, value: bool) -> None:
+        self.context.multiple_actions = value
+
+    @property
+    def comment_handler(self):
+        return self.context.comment_handler
+
+    @comment_handler.setter
+    def comment_handler(self, value) -> None:
+        self.context.comment_handler = value
+
     @property
     def review_mode(self) -> ReviewChoices:
         return self._review_mode
@@ -183,13 +266,11 @@ class ReviewBot(object):
         self._review_mode = val
 
     def set_request_ids(self, ids):
-        for rqid in ids:
-            u = osc.core.makeurl(self.apiurl, ['request', rqid], {'withfullhistory': '1'})
-            r = osc.core.http_GET(u)
-            root = ET.parse(r).getroot()
-            req = osc.core.Request()
-            req.read(root)
-            self.requests.append(req)
+        requests = requests_get(self.apiurl, ids)
+        missing = set(map(str, ids)) - set(req.reqid for req in requests)
+        if missing:
+            self.logger.error(f"requests not found: {', '.join(sorted(missing))}")
+        self.requests.extend(requests)
 
     # function called before requests are reviewed
     def prepare_review(self):
@@ -200,46 +281,88 @@ class ReviewBot(object):
 
         # give implementations a chance to do something before single requests
         self.prepare_review()
-        return_value = 0
 
-        for req in self.requests:
-            self.logger.info(f"checking {req.reqid}")
-            self.request = req
-
-            # XXX: this is a hack. Annotating the request with staging_project.
-            # OBS itself should provide an API for that but that's currently not the case
-            # https://github.com/openSUSE/openSUSE-release-tools/pull/2377
-            if not hasattr(req, 'staging_project'):
-                staging_project = None
-                for r in req.reviews:
-                    if r.state == 'new' and r.by_project and ":Staging:" in r.by_project:
-                        staging_project = r.by_project
-                        break
-                setattr(req, 'staging_project', staging_project)
+        if self.workers > 1 and self.concurrent_safe:
+            return_value = self.check_requests_concurrent()
+        else:
+            return_value = 0
+            for req in self.requests:
+                good, failed = self.check_request(req)
+                if failed:
+                    return_value = 1
+                self.review_set(req, good)
+
+        self.logger.debug('requests fetched in {calls} calls, {avoided} calls avoided'.format(**REQUEST_STATS))
+        return return_value
 
+    def check_requests_concurrent(self):
+        """
+        Check the requests in a pool of self.workers threads, each request with
+        its own ReviewContext. The reviews are set by the calling thread alone
+        and in the order of self.requests, so that the changes to OBS are made
+        in the same order as when checking one request after the other.
+        """
+        def check(req):
+            self.local.context = self.context_main.fork(req)
             try:
-                good = self.check_one_request(req)
-            except Exception:
-                good = None
-
-                import traceback
-                traceback.print_exc()
-                return_value = 1
-
-            if self.review_mode == ReviewChoices.NO:
-                good = None
-            elif self.review_mode == ReviewChoices.ACCEPT:
-                good = True
-
-            if good is None:
-                self.logger.info(f"{req.reqid} ignored")
-            elif good:
-                self._set_review(req, 'accepted')
-            elif self.review_mode != ReviewChoices.ACCEPT_ONPASS:
-                self._set_review(req, 'declined')
+                return (self.local.context,) + self.check_request(req)
+            finally:
+                del self.local.context
+
+        return_value = 0
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            for context, good, failed in executor.map(check, self.requests):
+                if failed:
+                    return_value = 1
+
+                self.local.context = context
+                try:
+                    self.review_set(context.request, good)
+                finally:
+                    del self.local.context
 
         return return_value
 
+    def check_request(self, req: osc.core.Request) -> Tuple[Optional[bool], bool]:
+        """Check a single request and return the result and whether the check failed."""
+        self.logger.info(f"checking {req.reqid}")
+        self.request = req
+
+        # XXX: this is a hack. Annotating the request with staging_project.
+        # OBS itself should provide an API for that but that's currently not the case
+        # https://github.com/openSUSE/openSUSE-release-tools/pull/2377
+        if not hasattr(req, 'staging_project'):
+            staging_project = None
+            for r in req.reviews:
+                if r.state == 'new' and r.by_project and ":Staging:" in r.by_project:
+                    staging_project = r.by_project
+                    break
+            setattr(req, 'staging_project', staging_project)
+
+        failed = False
+        try:
+            good = self.check_one_request(req)
+        except Exception:
+            good = None
+
+            traceback.print_exc()
+            failed = True
+
+        if self.review_mode == ReviewChoices.NO:
+            good = None
+        elif self.review_mode == ReviewChoices.ACCEPT:
+            good = True
+
+        return good, failed
+
+    def review_set(self, req: osc.core.Request, good: Optional[bool]) -> None:
+        if good is None:
+            self.logger.info(f"{req.reqid} ignored")
+        elif good:
+            self._set_review(req, 'accepted')
+        elif self.review_mode != ReviewChoices.ACCEPT_ONPASS:
+            self._set_review(req, 'declined')
+
     @memoize(session=True)
     def request_override_check_users(self, project: str) -> List[str]:
         """Determine users allowed to override review in a comment command."""
@@ -325,6 +448,7 @@ class ReviewBot(object):
                     if e.code != 403:
                         raise e
                     self.logger.info('unable to change review state (likely superseded or revoked)')
+                request_cache_invalidate(self.apiurl, req.reqid)
         else:
             self.logger.debug(f"{req.reqid} review not changed")
 
@@ -389,6 +513,7 @@ class ReviewBot(object):
         code = ET.parse(r).getroot().attrib['code']
         if code != 'ok':
             raise Exception(f'non-ok return code: {code}')
+        request_cache_invalidate(self.apiurl, req.reqid)
 
     def devel_project_review_add(self, request, project, package, message='adding devel project review'):
         devel_project, devel_package = devel_project_fallback(self.apiurl, project, package)
@@ -660,41 +785,29 @@ class ReviewBot(object):
             print(f'ERROR in URL {url} [{e}]')
         return False
 
-    def set_request_ids_search_review(self):
+    @staticmethod
+    def ids_xpath(xpath, ids=None):
+        """Restrict the request search xpath to the given request ids."""
+        if ids:
+            xpath = f"({xpath}) and ({' or '.join(f'@id={rqid}' for rqid in ids)})"
+        return xpath
+
+    def set_request_ids_search_review(self, ids=None):
         review = None
         if self.review_user:
             review = f"@by_user='{self.review_user}' and @state='new'"
         if self.review_group:
             review = osc.core.xpath_join(review, f"@by_group='{self.review_group}' and @state='new'")
-        url = osc.core.makeurl(self.apiurl, ('search', 'request'), {
-                               'match': f"state/@name='review' and review[{review}]", 'withfullhistory': 1})
-        root = ET.parse(osc.core.http_GET(url)).getroot()
-
-        self.requests = []
-
-        for request in root.findall('request'):
-            req = osc.core.Request()
-            req.read(request)
-            self.requests.append(req)
+        xpath = self.ids_xpath(f"state/@name='review' and review[{review}]", ids)
+        self.requests = requests_search(self.apiurl, xpath)
 
     # also used by openqabot
-    def ids_project(self, project, typename):
+    def ids_project(self, project, typename, ids=None):
         xpath = f"(state/@name='review' or state/@name='new') and (action/target/@project='{project}' and action/@type='{typename}')"
-        url = osc.core.makeurl(self.apiurl, ('search', 'request'),
-                               {'match': xpath,
-                                'withfullhistory': 1})
-        root = ET.parse(osc.core.http_GET(url)).getroot()
-
-        ret = []
-
-        for request in root.findall('request'):
-            req = osc.core.Request()
-            req.read(request)
-            ret.append(req)
-        return ret
+        return requests_search(self.apiurl, self.ids_xpath(xpath, ids))
 
-    def set_request_ids_project(self, project, typename):
-        self.requests = self.ids_project(project, typename)
+    def set_request_ids_project(self, project, typename, ids=None):
+        self.requests = self.ids_project(project, typename, ids)
 
     def comment_handler_add(self, level=logging.INFO):
         """Add handler to start recording log messages for comment."""
@@ -876,9 +989,12 @@ class CommentFromLogHandler(logging.Handler):
     def __init__(self, level=logging.INFO):
         super(CommentFromLogHandler, self).__init__(level)
         self.lines = []
+        # Only collect the messages about the request checked by this thread.
+        self.thread = threading.get_ident()
 
     def emit(self, record):
-        self.lines.append(record.getMessage())
+        if record.thread == self.thread:
+            self.lines.append(record.getMessage())
 
 
 class CommandLineInterface(cmdln.Cmdln):
@@ -900,6 +1016,8 @@ class CommandLineInterface(cmdln.Cmdln):
         parser.add_option("--fallback-user", dest='fallback_user', metavar='USER', help="fallback review user")
         parser.add_option("--fallback-group", dest='fallback_group', metavar='GROUP', help="fallback review group")
         parser.add_option('-c', '--config', dest='config', metavar='FILE', help='read config file FILE')
+        parser.add_option('--workers', type='int', default=1, metavar='N',
+                          help='check up to N requests concurrently (bot must support it)')
 
         return parser
 
@@ -931,6 +1049,11 @@ class CommandLineInterface(cmdln.Cmdln):
         if self.options.fallback_group:
             self.checker.fallback_group = self.options.fallback_group
 
+        if self.options.workers > 1 and not self.checker.concurrent_safe:
+            self.logger.warning(f'{self.checker.bot_name} does not support --workers, checking one request at a time')
+        else:
+            self.checker.workers = self.options.workers
+
     def setup_checker(self):
         """ reimplement this """
         apiurl = conf.config['apiurl']
@@ -958,6 +1081,8 @@ class CommandLineInterface(cmdln.Cmdln):
         return self.checker.check_requests()
 
     @cmdln.option('-n', '--interval', metavar="minutes", type="int", help="periodic interval in minutes")
+    @cmdln.option('--listen', action='store_true',
+                  help='check requests on their events from the AMQP bus and all of them every interval')
     def do_review(self, subcmd, opts, *args):
         """${cmd_name}: check requests that have the specified user or group as reviewer
 
@@ -967,13 +1092,18 @@ class CommandLineInterface(cmdln.Cmdln):
         if self.checker.review_user is None and self.checker.review_group is None:
             raise osc.oscerr.WrongArgs("missing reviewer (user or group)")
 
-        def work():
-            self.checker.set_request_ids_search_review()
+        def work(ids=None):
+            self.checker.set_request_ids_search_review(ids)
             return self.checker.check_requests()
 
+        if opts.listen:
+            return self.listener(work, opts.interval)
+
         return self.runner(work, opts.interval)
 
     @cmdln.option('-n', '--interval', metavar="minutes", type="int", help="periodic interval in minutes")
+    @cmdln.option('--listen', action='store_true',
+                  help='check requests on their events from the AMQP bus and all of them every interval')
     def do_project(self, subcmd, opts, project, typename):
         """${cmd_name}: check all requests of specified type to specified
 
@@ -981,10 +1111,13 @@ class CommandLineInterface(cmdln.Cmdln):
         ${cmd_option_list}
         """
 
-        def work():
-            self.checker.set_request_ids_project(project, typename)
+        def work(ids=None):
+            self.checker.set_request_ids_project(project, typename, ids)
             return self.checker.check_requests()
 
+        if opts.listen:
+            return self.listener(work, opts.interval)
+
         return self.runner(work, opts.interval)
 
     def runner(self, workfunc, interval):
@@ -1028,6 +1161,27 @@ class CommandLineInterface(cmdln.Cmdln):
             # or caches they may contain.
             self.postoptparse()
 
+    def listener(self, workfunc, interval):
+        """ runs the specified callback for the requests changed according to
+        the AMQP bus and for all requests every <interval> minutes (default 60)
+        """
+        # Only required when listening.
+        from osclib.request_listener import RequestListener
+
+        def work(ids=None):
+            if not ids:
+                # Unlike the runner the caches are kept between the events
+                # and only reset before checking all requests.
+                memoize_session_reset()
+            return workfunc(ids)
+
+        amqp_prefix = 'suse' if self.checker.apiurl.endswith('suse.de') else 'opensuse'
+        listener = RequestListener(amqp_prefix, self.logger, work, (interval or 60) * 60)
+        try:
+            listener.run()
+        except KeyboardInterrupt:
+            listener.stop()
+
 
 if __name__ == "__main__":
     app = CommandLineInterface()
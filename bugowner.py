@@ -27,6 +27,7 @@ import sys
 import cmdln
 import logging
 import osc.core
+from osclib.core import request_get
 
 import ToolBase
 
@@ -106,8 +107,8 @@ class BugownerTool(ToolBase.ToolBase):
         project = self.project
         srcrev = osc.core.get_source_rev(self.apiurl, project, package)
 
-        if 'requestid' in srcrev:
-            r = osc.core.get_request(self.apiurl, srcrev['requestid'])
+        r = request_get(self.apiurl, srcrev['requestid']) if 'requestid' in srcrev else None
+        if r is not None:
             user = r.statehistory[0].who
         else:
             user = srcrev['user']
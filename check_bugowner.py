@@ -15,6 +15,8 @@ http_GET = osc.core.http_GET
 
 
 class CheckerBugowner(ReviewBot.ReviewBot):
+    # Only per-request state is the request and its review messages.
+    concurrent_safe = True
 
     def __init__(self, *args, **kwargs):
         ReviewBot.ReviewBot.__init__(self, *args, **kwargs)
@@ -148,6 +148,9 @@ class TagChecker(ReviewBot.ReviewBot):
     """ simple bot that checks that a submit request has corrrect tags specified
     """
 
+    # Only per-request state is the request and its review messages.
+    concurrent_safe = True
+
     def __init__(self, *args, **kwargs):
         super(TagChecker, self).__init__(*args, **kwargs)
         self.factory = ["openSUSE:Factory"]
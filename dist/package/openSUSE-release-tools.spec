@@ -428,6 +428,7 @@ exit 0
 %exclude %{_datadir}/%{source_dir}/metrics
 %exclude %{_datadir}/%{source_dir}/metrics.py
 %exclude %{_datadir}/%{source_dir}/metrics_release.py
+%exclude %{_datadir}/%{source_dir}/metrics_requests.py
 %exclude %{_datadir}/%{source_dir}/origin-manager.py
 %exclude %{_bindir}/osrt-staging-report
 %exclude %{_datadir}/%{source_dir}/pkglistgen
@@ -514,6 +515,7 @@ exit 0
 %exclude %{_datadir}/%{source_dir}/metrics.py
 %endif
 %{_datadir}/%{source_dir}/metrics_release.py
+%{_datadir}/%{source_dir}/metrics_requests.py
 # To avoid adding grafana as BuildRequires since it does not live in same repo.
 %dir %{_sysconfdir}/grafana
 %dir %{_sysconfdir}/grafana/provisioning
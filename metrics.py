@@ -1,11 +1,15 @@
 #!/usr/bin/python3
 
 import argparse
+import heapq
 import os
+import pickle
 import subprocess
 import sys
+import tempfile
 from collections import namedtuple
-from datetime import datetime
+from datetime import datetime, timedelta
+from operator import attrgetter
 
 import osc.conf
 import osc.core
@@ -17,15 +21,23 @@ from lxml import etree as ET
 from osc.core import HTTPError, get_commitlog
 
 import metrics_release
+from metrics_requests import RequestStore
 import osclib.conf
 from osclib.cache import Cache
 from osclib.conf import Config
-from osclib.core import (get_request_list_with_history,
-                         project_pseudometa_package)
+from osclib.cache_manager import CacheManager
+from osclib.core import project_pseudometa_package
 from osclib.stagingapi import StagingAPI
 
 SOURCE_DIR = os.path.dirname(os.path.realpath(__file__))
 Point = namedtuple('Point', ['measurement', 'tags', 'fields', 'time', 'delta'])
+# Number of points sorted in memory before spilled to disk and read back in chunks.
+POINTS_RUN_SIZE = 1000000
+POINTS_SPILL_CHUNK = 10000
+# Requests are parsed once into records from which all points are derived.
+RequestRecord = namedtuple('RequestRecord', ['id', 'type', 'state_when', 'reviews', 'history', 'priority'])
+ReviewRecord = namedtuple('ReviewRecord', ['attributes', 'history'])
+HistoryRecord = namedtuple('HistoryRecord', ['when', 'who', 'comment', 'description'])
 
 # Duplicate Leap config to handle 13.2 without issue.
 osclib.conf.DEFAULT[
@@ -74,7 +86,9 @@ def search_paginated_generator(apiurl, queries=None, **kwargs):
     queries['request']['limit'] = 1000
     queries['request']['offset'] = 0
     while True:
-        collection = osc.core.search(apiurl, queries, **kwargs)['request']
+        # Parsed using lxml ET to perform complex xpaths.
+        url = osc.core.makeurl(apiurl, ['search', 'request'], dict(queries['request'], match=kwargs['request']))
+        collection = ET.parse(osc.core.http_GET(url)).getroot()
         if not request_count:
             print(f"processing {int(collection.get('matches')):,} requests")
 
@@ -104,199 +118,357 @@ def timestamp(datetime):
     return int(datetime.strftime('%s'))
 
 
-def ingest_requests(client, api, project):
-    requests = get_request_list_with_history(
-        api.apiurl, project, req_state=('accepted', 'revoked', 'superseded'))
+def ingest_requests(client, api, project, store):
+    # Only fetch the requests above the highest ingested id or finalized since
+    # the previous run, with a margin for the timezone of OBS, unless none
+    # have been ingested yet.
+    fetched = (datetime.utcnow() - timedelta(days=1)).strftime('%Y-%m-%dT%H:%M:%S')
+    xpath = ''
+    for state in ('accepted', 'revoked', 'superseded'):
+        xpath = osc.core.xpath_join(xpath, f"state/@name='{state}'", inner=True)
+    xpath = osc.core.xpath_join(xpath, f"action/target/@project='{project}'", op='and', nexpr_parentheses=True)
+    high_water = store.high_water()
+    fetched_previous = store.meta_get('fetched')
+    if high_water and fetched_previous:
+        xpath = osc.core.xpath_join(
+            xpath, f"@id>{high_water} or state/@when>='{fetched_previous}'", op='and', nexpr_parentheses=True)
+
+    # Time of the earliest point not yet written.
+    since = store.meta_get('unwritten')
+    since = int(since) if since is not None else None
+    changed = 0
+    requests = search_paginated_generator(api.apiurl, {'request': {'withfullhistory': '1'}}, request=xpath)
     for request in requests:
-        if request.find('action').get('type') not in ('submit', 'delete'):
-            # TODO Handle non-stageable requests via different flow.
+        request_id = int(request.get('id'))
+        state_when = request.find('state').get('when')
+        if not store.changed(request_id, state_when):
             continue
 
-        created_at = date_parse(request.find('history').get('when'))
-        final_at = date_parse(request.find('state').get('when'))
-        final_at_history = date_parse(request.find('history[last()]').get('when'))
-        if final_at_history > final_at:
-            # Workaround for invalid dates: openSUSE/open-build-service#3858.
-            final_at = final_at_history
-
-        # TODO Track requests in psuedo-ignore state.
-        point('total', {'backlog': 1, 'open': 1}, created_at, {'event': 'create'}, True)
-        point('total', {'backlog': -1, 'open': -1}, final_at, {'event': 'close'}, True)
-
-        request_tags = {}
-        request_fields = {
-            'total': (final_at - created_at).total_seconds(),
-            'staged_count': len(request.findall('review[@by_group="factory-staging"]/history')),
+        since = ingest_request_store(api, project, store, request_id, request, since)
+        changed += 1
+
+    for request_id, request in store.outdated():
+        since = ingest_request_store(api, project, store, request_id, request, since)
+        changed += 1
+
+    print(f'ingested {changed:,} new or changed requests')
+    if not high_water:
+        # Nothing was ingested before so rewrite all points.
+        since = 0
+    if since is not None:
+        # Committed along with the requests to complete the write if interrupted.
+        store.meta_set('unwritten', str(since))
+    store.commit()
+    store.meta_set('fetched', fetched)
+    if since is None:
+        return 0
+
+    print('finalizing points')
+    wrote = walk_points(client, points_sorted(Point(*p) for p in store.points()), project, since)
+    store.meta_set('unwritten', None)
+    return wrote
+
+
+def ingest_request_store(api, project, store, request_id, request, since):
+    "Store the points of request and return the earliest time of since and the points."
+    del points[:]
+    ingest_request(api, project, request_record(request))
+    store.put(request_id, request.find('state').get('when'), request, [list(p) for p in points])
+    for p in points:
+        if since is None or p.time < since:
+            since = p.time
+    return since
+
+
+def request_record(request):
+    "Turn the request XML into a RequestRecord in a single pass."
+    action_type = state_when = priority = None
+    reviews = []
+    history = []
+    for element in request:
+        if element.tag == 'action':
+            if action_type is None:
+                action_type = element.get('type')
+        elif element.tag == 'state':
+            state_when = element.get('when')
+        elif element.tag == 'review':
+            reviews.append(ReviewRecord(element.attrib, [history_record(h) for h in element.iterchildren('history')]))
+        elif element.tag == 'history':
+            history.append(history_record(element))
+        elif element.tag == 'priority' and priority is None:
+            priority = element.text
+
+    return RequestRecord(request.get('id'), action_type, state_when, reviews, history, priority)
+
+
+def history_record(element):
+    comment = description = None
+    for child in element:
+        if child.tag == 'comment' and comment is None:
+            comment = child.text or ''
+        elif child.tag == 'description' and description is None:
+            description = child.text or ''
+
+    return HistoryRecord(element.get('when'), element.get('who'), comment, description)
+
+
+def parse_when(when):
+    # Considerably faster than date_parse() for the ISO 8601 dates of OBS.
+    try:
+        return datetime.fromisoformat(when)
+    except ValueError:
+        return date_parse(when)
+
+
+def ingest_request(api, project, request):
+    if request.type not in ('submit', 'delete'):
+        # TODO Handle non-stageable requests via different flow.
+        return
+
+    staging_prefix = f'{project}:Staging:'
+    staging_reviews = []
+    other_reviews = []
+    for review in request.reviews:
+        if staging_prefix in review.attributes.get('by_project', ''):
+            staging_reviews.append(review)
+        else:
+            other_reviews.append(review)
+
+    created_at = parse_when(request.history[0].when)
+    final_at = parse_when(request.state_when)
+    final_at_history = parse_when(request.history[-1].when)
+    if final_at_history > final_at:
+        # Workaround for invalid dates: openSUSE/open-build-service#3858.
+        final_at = final_at_history
+
+    # TODO Track requests in psuedo-ignore state.
+    point('total', {'backlog': 1, 'open': 1}, created_at, {'event': 'create'}, True)
+    point('total', {'backlog': -1, 'open': -1}, final_at, {'event': 'close'}, True)
+
+    staging_group_history = [history for review in request.reviews
+                             if review.attributes.get('by_group') == 'factory-staging'
+                             for history in review.history]
+    request_tags = {}
+    request_fields = {
+        'total': (final_at - created_at).total_seconds(),
+        'staged_count': len(staging_group_history),
+    }
+    # TODO Total time spent in backlog (ie factory-staging, but excluding when staged).
+
+    if staging_reviews:
+        by_project = staging_reviews[0].attributes.get('by_project')
+        request_tags['type'] = 'adi' if api.is_adi_project(by_project) else 'letter'
+
+        # TODO Determine current whitelists state based on dashboard revisions.
+        if project.startswith('openSUSE:Factory'):
+            splitter_whitelist = 'B C D E F G H I J'.split()
+            if splitter_whitelist:
+                short = api.extract_staging_short(by_project)
+                request_tags['whitelisted'] = short in splitter_whitelist
+        else:
+            # All letter where whitelisted since no restriction.
+            request_tags['whitelisted'] = request_tags['type'] == 'letter'
+
+    ready_to_accept = [history.when for review in staging_reviews
+                       if f'{staging_prefix}adi:' in review.attributes['by_project'] and
+                       review.attributes.get('state') == 'accepted'
+                       for history in review.history
+                       if history.comment == 'ready to accept' and history.when is not None]
+    if ready_to_accept:
+        ready_to_accept = parse_when(ready_to_accept[0])
+        request_fields['ready'] = (final_at - ready_to_accept).total_seconds()
+
+        # TODO Points with indentical timestamps are merged so this can be placed in total
+        # measurement, but may make sense to keep this separate and make the others follow.
+        point('ready', {'count': 1}, ready_to_accept, delta=True)
+        point('ready', {'count': -1}, final_at, delta=True)
+
+    staged_first = [history.when for history in staging_group_history if history.when is not None]
+    if staged_first:
+        staged_first = parse_when(staged_first[0])
+        request_fields['staged_first'] = (staged_first - created_at).total_seconds()
+
+        # TODO Decide if better to break out all measurements by time most relevant to event,
+        # time request was created, or time request was finalized. It may also make sense to
+        # keep separate measurement by different times like this one.
+        point('request_staged_first', {'value': request_fields['staged_first']}, staged_first, request_tags)
+
+    point('request', request_fields, final_at, request_tags)
+
+    # Staging related reviews.
+    for number, review in enumerate(staging_reviews, start=1):
+        staged_at = parse_when(review.attributes.get('when'))
+
+        project_type = 'adi' if api.is_adi_project(review.attributes.get('by_project')) else 'letter'
+        short = api.extract_staging_short(review.attributes.get('by_project'))
+        point('staging', {'count': 1}, staged_at,
+              {'id': short, 'type': project_type, 'event': 'select'}, True)
+        point('total', {'backlog': -1, 'staged': 1}, staged_at, {'event': 'select'}, True)
+
+        who = who_workaround(request, review)
+        review_tags = {'event': 'select', 'user': who, 'number': number}
+        review_tags.update(request_tags)
+        point('user', {'count': 1}, staged_at, review_tags)
+
+        if review.history:
+            unselected_at = parse_when(review.history[0].when)
+        else:
+            unselected_at = final_at
+
+        # If a request is declined and re-opened it must be repaired before being re-staged. At
+        # which point the only possible open review should be the final one.
+        point('staging', {'count': -1}, unselected_at,
+              {'id': short, 'type': project_type, 'event': 'unselect'}, True)
+        point('total', {'backlog': 1, 'staged': -1}, unselected_at, {'event': 'unselect'}, True)
+
+    # No-staging related reviews.
+    for review in other_reviews:
+        tags = {
+            # who_added is non-trivial due to openSUSE/open-build-service#3898.
+            'state': review.attributes.get('state'),
         }
-        # TODO Total time spent in backlog (ie factory-staging, but excluding when staged).
-
-        staged_first_review = request.xpath(f'review[contains(@by_project, "{project}:Staging:")]')
-        if len(staged_first_review):
-            by_project = staged_first_review[0].get('by_project')
-            request_tags['type'] = 'adi' if api.is_adi_project(by_project) else 'letter'
-
-            # TODO Determine current whitelists state based on dashboard revisions.
-            if project.startswith('openSUSE:Factory'):
-                splitter_whitelist = 'B C D E F G H I J'.split()
-                if splitter_whitelist:
-                    short = api.extract_staging_short(by_project)
-                    request_tags['whitelisted'] = short in splitter_whitelist
-            else:
-                # All letter where whitelisted since no restriction.
-                request_tags['whitelisted'] = request_tags['type'] == 'letter'
-
-        xpath = f'review[contains(@by_project, "{project}:Staging:adi:") and @state="accepted"]/'
-        xpath += 'history[comment[text() = "ready to accept"]]/@when'
-        ready_to_accept = request.xpath(xpath)
-        if len(ready_to_accept):
-            ready_to_accept = date_parse(ready_to_accept[0])
-            request_fields['ready'] = (final_at - ready_to_accept).total_seconds()
-
-            # TODO Points with indentical timestamps are merged so this can be placed in total
-            # measurement, but may make sense to keep this separate and make the others follow.
-            point('ready', {'count': 1}, ready_to_accept, delta=True)
-            point('ready', {'count': -1}, final_at, delta=True)
-
-        staged_first = request.xpath('review[@by_group="factory-staging"]/history/@when')
-        if len(staged_first):
-            staged_first = date_parse(staged_first[0])
-            request_fields['staged_first'] = (staged_first - created_at).total_seconds()
-
-            # TODO Decide if better to break out all measurements by time most relevant to event,
-            # time request was created, or time request was finalized. It may also make sense to
-            # keep separate measurement by different times like this one.
-            point('request_staged_first', {'value': request_fields['staged_first']}, staged_first, request_tags)
-
-        point('request', request_fields, final_at, request_tags)
-
-        # Staging related reviews.
-        for number, review in enumerate(
-                request.xpath(f'review[contains(@by_project, "{project}:Staging:")]'), start=1):
-            staged_at = date_parse(review.get('when'))
-
-            project_type = 'adi' if api.is_adi_project(review.get('by_project')) else 'letter'
-            short = api.extract_staging_short(review.get('by_project'))
-            point('staging', {'count': 1}, staged_at,
-                  {'id': short, 'type': project_type, 'event': 'select'}, True)
-            point('total', {'backlog': -1, 'staged': 1}, staged_at, {'event': 'select'}, True)
-
-            who = who_workaround(request, review)
-            review_tags = {'event': 'select', 'user': who, 'number': number}
-            review_tags.update(request_tags)
-            point('user', {'count': 1}, staged_at, review_tags)
-
-            history = review.find('history')
-            if history is not None:
-                unselected_at = date_parse(history.get('when'))
-            else:
-                unselected_at = final_at
-
-            # If a request is declined and re-opened it must be repaired before being re-staged. At
-            # which point the only possible open review should be the final one.
-            point('staging', {'count': -1}, unselected_at,
-                  {'id': short, 'type': project_type, 'event': 'unselect'}, True)
-            point('total', {'backlog': 1, 'staged': -1}, unselected_at, {'event': 'unselect'}, True)
-
-        # No-staging related reviews.
-        for review in request.xpath(f'review[not(contains(@by_project, "{project}:Staging:"))]'):
-            tags = {
-                # who_added is non-trivial due to openSUSE/open-build-service#3898.
-                'state': review.get('state'),
-            }
-
-            opened_at = date_parse(review.get('when'))
-            history = review.find('history')
-            if history is not None:
-                completed_at = date_parse(history.get('when'))
-                tags['who_completed'] = history.get('who')
-            else:
-                completed_at = final_at
-                # Does not seem to make sense to mirror user responsible for making final state
-                # change as the user who completed the review.
-
-            tags['key'] = []
-            tags['type'] = []
-            for name, value in sorted(review.items(), reverse=True):
-                if name.startswith('by_'):
-                    tags[name] = value
-                    tags['key'].append(value)
-                    tags['type'].append(name[3:])
-            tags['type'] = '_'.join(tags['type'])
-
-            point('review', {'open_for': (completed_at - opened_at).total_seconds()}, completed_at, tags)
-            point('review_count', {'count': 1}, opened_at, tags, True)
-            point('review_count', {'count': -1}, completed_at, tags, True)
-
-        found = []
-        for set_priority in request.xpath('history[description[contains(text(), "Request got a new priority:")]]'):
-            parts = set_priority.find('description').text.rsplit(' ', 3)
-            priority_previous = parts[1]
-            priority = parts[3]
-            if priority == priority_previous:
-                continue
-
-            changed_at = date_parse(set_priority.get('when'))
-            if priority_previous != 'moderate':
-                point('priority', {'count': -1}, changed_at, {'level': priority_previous}, True)
-            if priority != 'moderate':
-                point('priority', {'count': 1}, changed_at, {'level': priority}, True)
-                found.append(priority)
-
-        # Ensure a final removal entry is created when request is finalized.
-        priority = request.find('priority')
-        if priority is not None and priority.text != 'moderate':
-            if priority.text in found:
-                point('priority', {'count': -1}, final_at, {'level': priority.text}, True)
-            else:
-                print(f"unable to find priority history entry for {request.get('id')} to {priority.text}")
-
-    print(f'finalizing {len(points):,} points')
-    return walk_points(client, points, project)
-
-
-def who_workaround(request, review, relax=False):
+
+        opened_at = parse_when(review.attributes.get('when'))
+        if review.history:
+            completed_at = parse_when(review.history[0].when)
+            tags['who_completed'] = review.history[0].who
+        else:
+            completed_at = final_at
+            # Does not seem to make sense to mirror user responsible for making final state
+            # change as the user who completed the review.
+
+        tags['key'] = []
+        tags['type'] = []
+        for name, value in sorted(review.attributes.items(), reverse=True):
+            if name.startswith('by_'):
+                tags[name] = value
+                tags['key'].append(value)
+                tags['type'].append(name[3:])
+        tags['type'] = '_'.join(tags['type'])
+
+        point('review', {'open_for': (completed_at - opened_at).total_seconds()}, completed_at, tags)
+        point('review_count', {'count': 1}, opened_at, tags, True)
+        point('review_count', {'count': -1}, completed_at, tags, True)
+
+    found = []
+    for set_priority in request.history:
+        if set_priority.description is None or 'Request got a new priority:' not in set_priority.description:
+            continue
+
+        parts = set_priority.description.rsplit(' ', 3)
+        priority_previous = parts[1]
+        priority = parts[3]
+        if priority == priority_previous:
+            continue
+
+        changed_at = parse_when(set_priority.when)
+        if priority_previous != 'moderate':
+            point('priority', {'count': -1}, changed_at, {'level': priority_previous}, True)
+        if priority != 'moderate':
+            point('priority', {'count': 1}, changed_at, {'level': priority}, True)
+            found.append(priority)
+
+    # Ensure a final removal entry is created when request is finalized.
+    priority = request.priority
+    if priority is not None and priority != 'moderate':
+        if priority in found:
+            point('priority', {'count': -1}, final_at, {'level': priority}, True)
+        else:
+            print(f"unable to find priority history entry for {request.id} to {priority}")
+
+
+def who_workaround(request, review):
     # Super ugly workaround for incorrect and missing data:
     # - openSUSE/open-build-service#3857
     # - openSUSE/open-build-service#3898
     global who_workaround_swap, who_workaround_miss
 
-    who = review.get('who')  # All that should be required (used as fallback).
-    when = review.get('when')
-    if relax:
-        # Super hack, chop off seconds to relax in hopes of finding potential.
-        when = when[:-2]
-
-    who_real = request.xpath(
-        'history[contains(@when, "{}") and comment[contains(text(), "{}")]]/@who'.format(
-            when, review.get('by_project')))
-    if len(who_real):
-        who = who_real[0]
+    who = review.attributes.get('who')  # All that should be required (used as fallback).
+    when = review.attributes.get('when')
+    # Super hack, chop off seconds to relax in hopes of finding potential.
+    when_relaxed = when[:-2]
+    by_project = str(review.attributes.get('by_project'))
+
+    # Find the exact and relaxed match in a single pass over the history.
+    who_relaxed = None
+    for history in request.history:
+        if history.comment is None or by_project not in history.comment or history.when is None:
+            continue
+        if when in history.when:
+            who_workaround_swap += 1
+            return history.who
+        if who_relaxed is None and when_relaxed in history.when:
+            who_relaxed = history.who
+
+    if who_relaxed is not None:
         who_workaround_swap += 1
-    elif not relax:
-        return who_workaround(request, review, True)
-    else:
-        who_workaround_miss += 1
+        return who_relaxed
 
+    who_workaround_miss += 1
     return who
 
-# Walk data points in order by time, adding up deltas and merging points at
+# Sort points by time without holding all of them in memory. Runs of up to
+# run_size points are sorted and spilled to temporary files in chunks which are
+# then merged. The order of points at the same time is kept as with sorted().
+
+
+def points_sorted(points, run_size=POINTS_RUN_SIZE):
+    runs = []
+    run = []
+    for point in points:
+        run.append(point)
+        if len(run) == run_size:
+            runs.append(points_spill(run))
+            run = []
+    run.sort(key=attrgetter('time'))
+
+    if not runs:
+        # Everything fit in a single run.
+        return run
+
+    runs.append(points_spill(run))
+    return heapq.merge(*[points_load(f) for f in runs], key=attrgetter('time'))
+
+
+def points_spill(run):
+    run.sort(key=attrgetter('time'))
+    f = tempfile.TemporaryFile(prefix='metrics-points')
+    for chunk in range(0, len(run), POINTS_SPILL_CHUNK):
+        pickle.dump(run[chunk:chunk + POINTS_SPILL_CHUNK], f, protocol=pickle.HIGHEST_PROTOCOL)
+    f.seek(0)
+    return f
+
+
+def points_load(f):
+    with f:
+        while True:
+            try:
+                yield from pickle.load(f)
+            except EOFError:
+                break
+
+# Walk data points sorted by time, adding up deltas and merging points at
 # the same time. Data is converted to dict() and written to influx batches to
 # avoid extra memory usage required for all data in dict() and avoid influxdb
-# allocating memory for entire incoming data set at once.
+# allocating memory for entire incoming data set at once. With since only the
+# points from that time on are replaced, while the deltas of earlier points
+# are still added up.
 
 
-def walk_points(client, points, target):
+def walk_points(client, points, target, since=0):
     delete_api = client.delete_api()
     write_api = client.write_api(write_options=SYNCHRONOUS)
+    start = datetime.utcfromtimestamp(since).isoformat() + 'Z'
     measurements = set()
     counters = {}
     final = []
     time_last = None
     wrote = 0
-    for point in sorted(points, key=lambda p: p.time):
-        if point.measurement not in measurements:
+    for point in points:
+        write = point.time >= since
+        if write and point.measurement not in measurements:
             # Wait until just before writing to drop measurement.
-            delete_api.delete(start="1970-01-01T00:00:00Z",
+            delete_api.delete(start=start,
                               stop=datetime.utcnow().isoformat() + "Z",
                               bucket=target,
                               predicate=f'_measurement="{point.measurement}"')
@@ -312,7 +484,8 @@ def walk_points(client, points, target):
         time_last = point.time
 
         if not point.delta:
-            final.append(dict(point._asdict()))
+            if write:
+                final.append(dict(point._asdict()))
             continue
 
         # A more generic method like 'key' which ended up being needed is likely better.
@@ -329,6 +502,9 @@ def walk_points(client, points, target):
         for key, value in point.fields.items():
             values[key] = values.setdefault(key, 0) + value
 
+        if not write:
+            continue
+
         if counters_tag['last'] and point.time == counters_tag['last']['time']:
             point = counters_tag['last']
         else:
@@ -616,7 +792,10 @@ def main(args):
         global who_workaround_swap, who_workaround_miss
         who_workaround_swap = who_workaround_miss = 0
 
-        points_requests = ingest_requests(client, api, args.project)
+        request_store = args.request_store or os.path.join(
+            CacheManager.directory('metrics-requests'), f'{args.project}.sqlite')
+        with RequestStore(request_store) as store:
+            points_requests = ingest_requests(client, api, args.project, store)
         points_schedule = ingest_release_schedule(client, args.project)
 
     print('who_workaround_swap', who_workaround_swap)
@@ -640,6 +819,7 @@ if __name__ == '__main__':
     parser.add_argument('--heavy-cache', action='store_true',
                         help='cache ephemeral queries indefinitely (useful for development)')
     parser.add_argument('--release-only', action='store_true', help='ingest release metrics only')
+    parser.add_argument('--request-store', help='store of ingested requests, remove to ingest all again')
     args = parser.parse_args()
 
     sys.exit(main(args))
@@ -0,0 +1,90 @@
+import json
+import os
+import sqlite3
+import zlib
+from typing import Iterator, List, Optional, Tuple
+
+from lxml import etree as ET
+
+
+class RequestStore:
+    """
+    Persistent store of the requests ingested by metrics.py and the points
+    computed from each of them.
+
+    Requests are only fetched again once their state changed and points are
+    only computed again for such requests or when VERSION changed. The time
+    of the earliest point not yet written to the database is kept until the
+    write succeeded so that an interrupted run is completed by the next.
+    """
+
+    # Increase when the points computed from a request change.
+    VERSION = 1
+
+    SCHEMA = [
+        'CREATE TABLE IF NOT EXISTS requests ('
+        ' id INTEGER PRIMARY KEY,'
+        ' state_when TEXT NOT NULL,'
+        ' version INTEGER NOT NULL,'
+        ' request BLOB NOT NULL,'
+        ' points TEXT NOT NULL)',
+        'CREATE TABLE IF NOT EXISTS meta ('
+        ' key TEXT PRIMARY KEY,'
+        ' value TEXT NOT NULL)',
+    ]
+
+    def __init__(self, path: str):
+        self.path = path
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.connection = sqlite3.connect(path)
+        for statement in self.SCHEMA:
+            self.connection.execute(statement)
+
+    def close(self) -> None:
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def meta_get(self, key: str) -> Optional[str]:
+        row = self.connection.execute('SELECT value FROM meta WHERE key = ?', (key,)).fetchone()
+        return row[0] if row else None
+
+    def meta_set(self, key: str, value: Optional[str]) -> None:
+        if value is None:
+            self.connection.execute('DELETE FROM meta WHERE key = ?', (key,))
+        else:
+            self.connection.execute('INSERT OR REPLACE INTO meta VALUES (?, ?)', (key, value))
+        self.connection.commit()
+
+    def high_water(self) -> int:
+        "Highest request id in the store."
+        return self.connection.execute('SELECT COALESCE(MAX(id), 0) FROM requests').fetchone()[0]
+
+    def changed(self, request_id: int, state_when: str) -> bool:
+        row = self.connection.execute('SELECT state_when, version FROM requests WHERE id = ?',
+                                      (request_id,)).fetchone()
+        return row is None or row[0] != state_when or row[1] != self.VERSION
+
+    def put(self, request_id: int, state_when: str, request, points: List[tuple]) -> None:
+        self.connection.execute('INSERT OR REPLACE INTO requests VALUES (?, ?, ?, ?, ?)', (
+            request_id, state_when, self.VERSION, zlib.compress(ET.tostring(request)), json.dumps(points)))
+
+    def commit(self) -> None:
+        self.connection.commit()
+
+    def outdated(self) -> Iterator[Tuple[int, object]]:
+        "Requests whose points were computed before VERSION changed."
+        # Collect the ids first since the requests are replaced while iterating.
+        request_ids = [row[0] for row in self.connection.execute(
+            'SELECT id FROM requests WHERE version != ?', (self.VERSION,))]
+        for request_id in request_ids:
+            request = self.connection.execute('SELECT request FROM requests WHERE id = ?', (request_id,)).fetchone()[0]
+            yield request_id, ET.fromstring(zlib.decompress(request))
+
+    def points(self) -> Iterator[list]:
+        for row in self.connection.execute('SELECT points FROM requests'):
+            yield from json.loads(row[0])
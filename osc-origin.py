@@ -13,9 +13,11 @@ from osclib.core import entity_exists
 from osclib.core import package_kind
 from osclib.core import package_list
 from osclib.core import package_list_kind_filtered
+from osclib.core import package_source_hash_histories
 from osclib.core import project_attribute_list
 from osclib.core import project_locked
 from osclib.origin import config_load
+from osclib.origin import config_origin_generator
 from osclib.origin import config_origin_list
 from osclib.origin import origin_find
 from osclib.origin import origin_history
@@ -31,6 +33,8 @@ import time
 import yaml
 
 OSRT_ORIGIN_LOOKUP_TTL = 60 * 60 * 24 * 7
+# Cover the time latest_updated may be served from the cache.
+OSRT_ORIGIN_LOOKUP_UPDATED_MARGIN = Cache.TTL_SHORT
 
 
 @cmdln.option('--debug', action='store_true', help='output debug information')
@@ -38,6 +42,7 @@ OSRT_ORIGIN_LOOKUP_TTL = 60 * 60 * 24 * 7
 @cmdln.option('--dry', action='store_true', help='perform a dry-run where applicable')
 @cmdln.option('--force-refresh', action='store_true', help='force refresh of data')
 @cmdln.option('--format', default='plain', help='output format')
+@cmdln.option('--incremental', action='store_true', help='only refresh the lookup of packages changed since generated')
 @cmdln.option('--listen', action='store_true', help='listen to events')
 @cmdln.option('--listen-seconds', help='number of seconds to listen to events')
 @cmdln.option('--mail', action='store_true', help='mail report to <confg:mail-release-list>')
@@ -60,13 +65,13 @@ def do_origin(self, subcmd, opts, *args):
 
     Usage:
         osc origin config [--origins-only]
-        osc origin cron
+        osc origin cron [--incremental]
         osc origin history [--format json|yaml] PACKAGE
-        osc origin list [--force-refresh] [--format json|yaml]
+        osc origin list [--force-refresh] [--incremental] [--format json|yaml]
         osc origin package [--debug] PACKAGE
         osc origin potentials [--format json|yaml] PACKAGE
         osc origin projects [--format json|yaml]
-        osc origin report [--diff] [--force-refresh] [--mail]
+        osc origin report [--diff] [--force-refresh] [--incremental] [--mail]
         osc origin update [--listen] [--listen-seconds] [PACKAGE...]
     """
 
@@ -122,7 +127,7 @@ def osrt_origin_cron(apiurl, opts, *args):
                 continue
 
         # Force update lookup information.
-        lookup = osrt_origin_lookup(apiurl, project, force_refresh=True, quiet=True)
+        lookup = osrt_origin_lookup(apiurl, project, force_refresh=True, quiet=True, incremental=opts.incremental)
         print(f'{project} lookup updated for {len(lookup)} package(s)')
 
 
@@ -161,7 +166,7 @@ def osrt_origin_lookup_file(project, previous=False):
     return os.path.join(cache_dir, lookup_name)
 
 
-def osrt_origin_lookup(apiurl, project, force_refresh=False, previous=False, quiet=False):
+def osrt_origin_lookup(apiurl, project, force_refresh=False, previous=False, quiet=False, incremental=False):
     locked = project_locked(apiurl, project)
     if locked:
         force_refresh = False
@@ -171,28 +176,22 @@ def osrt_origin_lookup(apiurl, project, force_refresh=False, previous=False, qui
         if not locked and not previous:
             # Force refresh of lookup information if expried.
             if time.time() - os.stat(lookup_path).st_mtime > OSRT_ORIGIN_LOOKUP_TTL:
-                return osrt_origin_lookup(apiurl, project, True)
+                return osrt_origin_lookup(apiurl, project, True, incremental=incremental)
 
-        with open(lookup_path, 'r') as lookup_stream:
-            lookup = yaml.safe_load(lookup_stream)
-
-            if not isinstance(next(iter(lookup.values())), dict):
-                # Convert flat format to dictionary.
-                for package, origin in lookup.items():
-                    lookup[package] = {'origin': origin}
+        lookup = osrt_origin_lookup_load(lookup_path)
     else:
         if previous:
             return None
 
-        packages = package_list_kind_filtered(apiurl, project)
+        # Changes made while generating may not be reflected in the lookup.
+        generated = time.time()
+        packages = list(package_list_kind_filtered(apiurl, project))
 
-        lookup = {}
-        for package in packages:
-            origin_info = origin_find(apiurl, project, package)
-            lookup[str(package)] = {
-                'origin': str(origin_info),
-                'revisions': origin_revision_state(apiurl, project, package, origin_info),
-            }
+        lookup = None
+        if incremental and os.path.exists(lookup_path):
+            lookup = osrt_origin_lookup_incremental(apiurl, project, packages, lookup_path)
+        if lookup is None:
+            lookup = osrt_origin_lookup_packages(apiurl, project, packages)
 
         if os.path.exists(lookup_path):
             lookup_path_previous = osrt_origin_lookup_file(project, True)
@@ -200,6 +199,7 @@ def osrt_origin_lookup(apiurl, project, force_refresh=False, previous=False, qui
 
         with open(lookup_path, 'w+') as lookup_stream:
             yaml.dump(lookup, lookup_stream, default_flow_style=False)
+        os.utime(lookup_path, (time.time(), generated))
 
     if not previous and not quiet:
         dt = timedelta(seconds=time.time() - os.stat(lookup_path).st_mtime)
@@ -208,12 +208,111 @@ def osrt_origin_lookup(apiurl, project, force_refresh=False, previous=False, qui
     return lookup
 
 
+def osrt_origin_lookup_load(lookup_path):
+    with open(lookup_path, 'r') as lookup_stream:
+        lookup = yaml.safe_load(lookup_stream)
+
+        if not isinstance(next(iter(lookup.values())), dict):
+            # Convert flat format to dictionary.
+            for package, origin in lookup.items():
+                lookup[package] = {'origin': origin}
+
+    return lookup
+
+
+def osrt_origin_lookup_packages(apiurl, project, packages):
+    # Fetch the source histories considered by origin_find() and
+    # origin_revision_state() in bulk so that checking the packages one
+    # after another mostly finds the source hashes already cached.
+    config = config_load(apiurl, project)
+    pairs = [(project, package) for package in packages]
+    package_source_hash_histories(apiurl, pairs, 10, True)
+    pairs = set()
+    for package in packages:
+        for origin, _ in config_origin_generator(config['origins'], apiurl, project, package, True):
+            pairs.add((origin, package))
+    package_source_hash_histories(apiurl, sorted(pairs), 5, True)
+
+    origin_infos = {package: origin_find(apiurl, project, package) for package in packages}
+    package_source_hash_histories(apiurl, sorted((origin_info.project.rstrip('~'), package)
+                                                 for package, origin_info in origin_infos.items()
+                                                 if origin_info is not None), 20, True)
+
+    lookup = {}
+    for package, origin_info in origin_infos.items():
+        lookup[str(package)] = {
+            'origin': str(origin_info),
+            'revisions': origin_revision_state(apiurl, project, package, origin_info),
+        }
+
+    return lookup
+
+
+def osrt_origin_lookup_incremental(apiurl, project, packages, lookup_path):
+    """
+    Carry forward the entries of the existing lookup and only recompute those
+    of packages updated in any project since it was generated, or return None
+    if the entire lookup needs to be generated.
+    """
+    lookup_previous = osrt_origin_lookup_load(lookup_path)
+    if not lookup_previous or not isinstance(next(iter(lookup_previous.values())), dict) or \
+            any('revisions' not in entry for entry in lookup_previous.values()):
+        return None
+
+    # The origins may be the same packages in another project or a devel
+    # project which is why updated packages are considered by name only.
+    config = config_load(apiurl, project)
+    projects = {project} | {origin.rstrip('~') for origin in config_origin_list(config)}
+    since = os.stat(lookup_path).st_mtime - OSRT_ORIGIN_LOOKUP_UPDATED_MARGIN
+    updated = osrt_origin_updated_packages(apiurl, projects, since)
+    if updated is None:
+        return None
+
+    # Pending requests are not reflected by updated sources.
+    recompute = [package for package in packages if package not in lookup_previous or package in updated or
+                 lookup_previous[package]['origin'].endswith('+')]
+    lookup = {package: lookup_previous[package] for package in packages if package not in recompute}
+    reused = len(lookup)
+    lookup.update(osrt_origin_lookup_packages(apiurl, project, recompute))
+
+    print(f'# recomputed {len(recompute)} and reused {reused} package(s)', file=sys.stderr)
+    return lookup
+
+
+def osrt_origin_updated_packages(apiurl, projects, since):
+    """
+    Return the names of packages updated in any project since the timestamp,
+    or None if latest_updated does not reach back far enough or one of the
+    projects was updated itself.
+    """
+    # Reload for every project during cron runs which may take a while.
+    Cache.last_updated.pop(apiurl, None)
+    Cache.last_updated_load(apiurl)
+
+    since = time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(since))
+    if Cache.last_updated[apiurl]['__oldest'] >= since:
+        return None
+
+    packages = set()
+    for (project, package), updated in Cache.last_updated_packages[apiurl].items():
+        if updated < since:
+            continue
+        if package is None:
+            if project in projects:
+                return None
+            continue
+        packages.add(package)
+
+    return packages
+
+
 def osrt_origin_max_key(dictionary, minimum):
     return max(len(max(dictionary.keys(), key=len)), minimum)
 
 
 def osrt_origin_list(apiurl, opts, *args):
-    lookup = osrt_origin_lookup(apiurl, opts.project, opts.force_refresh, quiet=opts.format != 'plain')
+    lookup = osrt_origin_lookup(apiurl, opts.project, opts.force_refresh, quiet=opts.format != 'plain',
+                                incremental=opts.incremental)
 
     if opts.format != 'plain':
         # Suppliment data with request information.
@@ -308,7 +407,7 @@ def osrt_origin_report_diff(lookup, lookup_previous):
 
 
 def osrt_origin_report(apiurl, opts, *args):
-    lookup = osrt_origin_lookup(apiurl, opts.project, opts.force_refresh)
+    lookup = osrt_origin_lookup(apiurl, opts.project, opts.force_refresh, incremental=opts.incremental)
     origin_count = osrt_origin_report_count(lookup)
 
     columns = ['origin', 'count', 'percent']
@@ -11,6 +11,7 @@ from osc import conf
 from osclib.core import attribute_value_save, attribute_value_load
 from osclib.core import source_file_load, source_file_save
 from osclib.core import create_set_bugowner_request
+from osclib.core import request_cache_invalidate
 from osclib.pkglistgen_comments import PkglistComments
 from datetime import date
 
@@ -138,6 +139,7 @@ class AcceptCommand(object):
         for req in other_new:
             print(f"Accepting request {req['id']}: {req['package']}")
             change_request_state(self.api.apiurl, str(req['id']), 'accepted', message=f'Accept to {self.api.project}')
+            request_cache_invalidate(self.api.apiurl, req['id'])
 
         for project in sorted(staging_packages.keys()):
             print(f'waiting for staging project {project} to be accepted')
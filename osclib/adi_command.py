@@ -89,6 +89,8 @@ class AdiCommand:
                 splitter.group_by('./action/source/@project')
 
         splitter.split()
+        self.api.superseded_requests_prefetch(
+            request for group in splitter.grouped.values() for request in group['requests'])
 
         for group in sorted(splitter.grouped.keys()):
             print(Fore.YELLOW + (group if group != '' else 'wanted') + Fore.RESET)
@@ -1,10 +1,16 @@
+import atexit
 import datetime
 import hashlib
+import json
 import os
 import osc.core
 import re
+import sqlite3
 import sys
+import tempfile
+import threading
 
+from urllib.error import HTTPError
 from urllib.parse import unquote
 from urllib.parse import urlsplit, SplitResult
 from io import BytesIO
@@ -27,6 +33,22 @@ def http_request(method, url, headers={}, data=None, file=None):
         ret = Cache.get(url)
         if ret:
             return ret
+
+        # Expired entries with validators can be revalidated by the server
+        # which avoids transferring the body again when unchanged.
+        conditional = Cache.conditional_headers(url)
+        if conditional:
+            try:
+                ret = osc.core._http_request(method, url, dict(headers or {}, **conditional), data, file)
+            except HTTPError as e:
+                if e.code != 304:
+                    raise e
+                ret = Cache.revalidate(url)
+                if ret:
+                    return ret
+                ret = osc.core._http_request(method, url, headers, data, file)
+
+            return Cache.put(url, ret)
     else:
         # Logically, seems to make more sense after real call, but practically
         # it should not matter and makes the apitests happy when dealing with
@@ -60,9 +82,29 @@ class Cache(object):
 
     Any paths without a project context will be cleared when updated using this
     cache, but obviously not for other contributors.
+
+    Validators (ETag and Last-Modified) returned by the server are stored with
+    each entry. Once an entry expires a conditional request is made and a 304
+    response refreshes the entry without downloading the body again. Counts of
+    hits, revalidations, and misses are kept in Cache.stats and printed upon
+    exit when $OSRT_CACHE_STATS is set.
+
+    The cache may be used from several threads at once, like those fetching
+    source histories in parallel, for which the stats and last updated data
+    are guarded by locks and the backends replace entries atomically.
     """
 
     CACHE_DIR = None
+    BACKENDS = {}
+    backend = None
+    stats = {'hit': 0, 'revalidated': 0, 'revalidated_bytes': 0, 'miss': 0}
+    lock = threading.Lock()
+    last_updated_lock = threading.Lock()
+    VALIDATORS = {
+        # Response header: conditional request header.
+        'ETag': 'If-None-Match',
+        'Last-Modified': 'If-Modified-Since',
+    }
     TTL_LONG = 12 * 60 * 60
     TTL_MEDIUM = 30 * 60
     TTL_SHORT = 5 * 60
@@ -100,6 +142,7 @@ class Cache(object):
     }
 
     last_updated = {}
+    last_updated_packages = {}
 
     @staticmethod
     def init(directory='main'):
@@ -110,8 +153,16 @@ class Cache(object):
 
         Cache.CACHE_DIR = CacheManager.directory('request', directory)
 
+        backend = os.environ.get('OSRT_CACHE_BACKEND', 'file')
+        if backend not in Cache.BACKENDS:
+            raise Exception(f'unknown cache backend {backend} via $OSRT_CACHE_BACKEND')
+        Cache.backend = Cache.BACKENDS[backend](Cache.CACHE_DIR)
+
         Cache.patterns = []
 
+        if str2bool(os.environ.get('OSRT_CACHE_STATS', '')):
+            atexit.register(Cache.stats_print)
+
         if str2bool(os.environ.get('OSRT_DISABLE_CACHE', '')):
             if conf.config['debug']:
                 print('CACHE_DISABLE via $OSRT_DISABLE_CACHE', file=sys.stderr)
@@ -131,7 +182,6 @@ class Cache(object):
         url = unquote(url)
         match, project = Cache.match(url)
         if match:
-            path = Cache.path(url, project, include_file=True)
             ttl = Cache.PATTERNS[match]
 
             if project:
@@ -154,10 +204,7 @@ class Cache(object):
 
                 # Treat non-existant cache as brand new for the sake of history
                 # span check since it behaves as desired.
-                age = 0
-                directory = Cache.path(url, project)
-                if os.path.exists(directory):
-                    age = time() - os.path.getmtime(directory)
+                age = Cache.backend.project_age(url, project) or 0
 
                 # If history span is shorter than allowed cache life and the age
                 # of the current cache is older than history span with no
@@ -171,14 +218,16 @@ class Cache(object):
                 if history_span < ttl_delta and age_delta > history_span:
                     Cache.delete_project(apiurl, project)
 
-            if os.path.exists(path) and time() - os.path.getmtime(path) <= ttl:
+            data, reason = Cache.backend.get(url, project, ttl)
+            if data is not None:
                 if conf.config['debug']:
                     print('CACHE_GET', url, file=sys.stderr)
-                return urlopen('file://' + path)
+                with Cache.lock:
+                    Cache.stats['hit'] += 1
+                return data
             else:
-                reason = '(' + ('expired' if os.path.exists(path) else 'does not exist') + ')'
                 if conf.config['debug']:
-                    print('CACHE_MISS', url, reason, file=sys.stderr)
+                    print('CACHE_MISS', url, '(' + reason + ')', file=sys.stderr)
 
         return None
 
@@ -187,7 +236,6 @@ class Cache(object):
         url = unquote(url)
         match, project = Cache.match(url)
         if match:
-            path = Cache.path(url, project, include_file=True, makedirs=True)
             ttl = Cache.PATTERNS[match]
             if ttl == 0:
                 return data
@@ -196,23 +244,80 @@ class Cache(object):
             # after writing to cache. As such a wrapper must be used. This could
             # be replaced with urlopen('file://...') to be consistent, but until
             # the need arrises BytesIO has less overhead.
+            validators = Cache.validators_extract(data)
             text = data.read()
             data = BytesIO(text)
 
             if conf.config['debug']:
                 print('CACHE_PUT', url, project, file=sys.stderr)
-            f = open(path, 'wb')
-            f.write(text)
-            f.close()
+            with Cache.lock:
+                Cache.stats['miss'] += 1
+            Cache.backend.put(url, project, match, text, validators)
 
         return data
 
+    @staticmethod
+    def validators_extract(data):
+        headers = getattr(data, 'headers', None)
+        if headers is None:
+            return None
+
+        validators = {}
+        for header in Cache.VALIDATORS:
+            value = headers.get(header)
+            if value:
+                validators[header] = value
+
+        return validators or None
+
+    @staticmethod
+    def conditional_headers(url):
+        """
+        Provide the headers to make a conditional request for an expired entry.
+        """
+        url = unquote(url)
+        match, project = Cache.match(url)
+        if not match:
+            return None
+
+        validators = Cache.backend.validators(url, project)
+        if not validators:
+            return None
+
+        return {Cache.VALIDATORS[header]: value for header, value in validators.items()}
+
+    @staticmethod
+    def revalidate(url):
+        """
+        Refresh the age of an entry confirmed unchanged by the server (304).
+        """
+        url = unquote(url)
+        match, project = Cache.match(url)
+        size = Cache.backend.touch(url, project)
+        if size is None:
+            return None
+
+        if conf.config['debug']:
+            print('CACHE_REVALIDATE', url, file=sys.stderr)
+        with Cache.lock:
+            Cache.stats['revalidated'] += 1
+            Cache.stats['revalidated_bytes'] += size
+
+        data, _ = Cache.backend.get(url, project, sys.maxsize)
+        return data
+
+    @staticmethod
+    def stats_print():
+        print('CACHE_STATS hit={hit} revalidated={revalidated} ({revalidated_bytes} bytes saved) miss={miss}'.format(
+            **Cache.stats), file=sys.stderr)
+
     @staticmethod
     def delete(url):
         url = unquote(url)
         match, project = Cache.match(url)
         if match:
-            path = Cache.path(url, project, include_file=True)
+            # Entry is stored under the project matched by the url.
+            entry_project = project
 
             # Rather then wait for last updated statistics to expire, remove the
             # project cache if applicable.
@@ -223,10 +328,9 @@ class Cache(object):
                     project = osc.core.get_request(apiurl, project).actions[0].tgt_project
                 Cache.delete_project(apiurl, project)
 
-            if os.path.exists(path):
+            if Cache.backend.delete(url, entry_project):
                 if conf.config['debug']:
                     print('CACHE_DELETE', url, file=sys.stderr)
-                os.remove(path)
 
         # Also delete version without query. This does not handle other
         # variations using different query strings. Handy for PUT with ?force=1.
@@ -237,17 +341,14 @@ class Cache(object):
 
     @staticmethod
     def delete_project(apiurl, project):
-        path = Cache.path(apiurl, project)
-
-        if os.path.exists(path):
+        if Cache.backend.delete_project(apiurl, project):
             if conf.config['debug']:
                 print('CACHE_DELETE_PROJECT', apiurl, project, file=sys.stderr)
-            rmtree_nfs_safe(path)
 
     @staticmethod
     def delete_all():
-        if os.path.exists(Cache.CACHE_DIR):
-            rmtree_nfs_safe(Cache.CACHE_DIR)
+        if Cache.backend:
+            Cache.backend.delete_all()
 
     @staticmethod
     def match(url):
@@ -281,28 +382,246 @@ class Cache(object):
 
         directory = os.path.join(*parts)
         if not os.path.exists(directory) and makedirs:
-            os.makedirs(directory)
+            os.makedirs(directory, exist_ok=True)
 
         if include_file:
-            parts.append(hashlib.sha1(url.encode('utf-8')).hexdigest())
+            parts.append(Cache.key(url))
             return os.path.join(*parts)
 
         return directory
 
+    @staticmethod
+    def key(url):
+        return hashlib.sha1(url.encode('utf-8')).hexdigest()
+
     @staticmethod
     def last_updated_load(apiurl):
         if apiurl in Cache.last_updated:
             return
 
+        with Cache.last_updated_lock:
+            # Loaded by another thread meanwhile.
+            if apiurl not in Cache.last_updated:
+                Cache.last_updated_fetch(apiurl)
+
+    @staticmethod
+    def last_updated_fetch(apiurl):
         url = osc.core.makeurl(apiurl, ['statistics', 'latest_updated'], {'limit': 5000})
         root = ET.parse(osc.core.http_GET(url)).getroot()
         last_updated = {}
+        last_updated_packages = {}
         for entity in root:
             # Entities repesent either a project or package.
             key = 'name' if entity.tag == 'project' else 'project'
             if entity.attrib[key] not in last_updated:
                 last_updated[entity.attrib[key]] = entity.attrib['updated']
 
+            # Also by package with None as package for the project itself.
+            package = entity.attrib['name'] if entity.tag == 'package' else None
+            last_updated_packages.setdefault((entity.attrib[key], package), entity.attrib['updated'])
+
         # Keep track of the last entry to indicate the covered timespan.
         last_updated['__oldest'] = entity.attrib['updated']
         Cache.last_updated[apiurl] = last_updated
+        Cache.last_updated_packages[apiurl] = last_updated_packages
+
+
+class CacheBackendFile(object):
+    """
+    Store each cached response in its own file.
+
+    Files are laid out as CACHE_DIR/<host>/<project>/<sha1 of url> which allows
+    a project to be expired by removing its directory. The modification time of
+    the project directory serves as the age of the project cache. Validators
+    are kept next to the entry in a file with VALIDATORS_SUFFIX appended.
+    """
+
+    VALIDATORS_SUFFIX = '.validators'
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def project_age(self, url, project):
+        directory = Cache.path(url, project)
+        if os.path.exists(directory):
+            return time() - os.path.getmtime(directory)
+        return None
+
+    def get(self, url, project, ttl):
+        path = Cache.path(url, project, include_file=True)
+        try:
+            if time() - os.path.getmtime(path) <= ttl:
+                return urlopen('file://' + path), None
+        except OSError:
+            # Also removed by another thread between the calls.
+            return None, 'does not exist'
+        return None, 'expired'
+
+    def put(self, url, project, pattern, text, validators=None):
+        path = Cache.path(url, project, include_file=True, makedirs=True)
+        if validators:
+            self.write(path + self.VALIDATORS_SUFFIX, json.dumps(validators).encode('utf-8'))
+        else:
+            self.remove(path + self.VALIDATORS_SUFFIX)
+        self.write(path, text)
+
+    @staticmethod
+    def write(path, data):
+        # Replace atomically so concurrent readers never see a partial file.
+        fd, path_tmp = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.tmp-')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(path_tmp, path)
+        except BaseException:
+            os.unlink(path_tmp)
+            raise
+
+    @staticmethod
+    def remove(path):
+        try:
+            os.remove(path)
+            return True
+        except FileNotFoundError:
+            return False
+
+    def validators(self, url, project):
+        path = Cache.path(url, project, include_file=True) + self.VALIDATORS_SUFFIX
+        try:
+            with open(path) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def touch(self, url, project):
+        path = Cache.path(url, project, include_file=True)
+        try:
+            os.utime(path)
+            return os.path.getsize(path)
+        except FileNotFoundError:
+            return None
+
+    def delete(self, url, project):
+        path = Cache.path(url, project, include_file=True)
+        self.remove(path + self.VALIDATORS_SUFFIX)
+        return self.remove(path)
+
+    def delete_project(self, apiurl, project):
+        path = Cache.path(apiurl, project)
+        if os.path.exists(path):
+            rmtree_nfs_safe(path)
+            return True
+        return False
+
+    def delete_all(self):
+        if os.path.exists(self.directory):
+            rmtree_nfs_safe(self.directory)
+
+
+class CacheBackendSQLite(object):
+    """
+    Store all cached responses in a single indexed SQLite database.
+
+    Avoids the stat() calls and many small files of CacheBackendFile which are
+    costly on network filesystems. Expiring a project is a single indexed
+    delete. Entries not written within CacheManager.PRUNE_TTL are pruned when
+    the database is opened since CacheManager only prunes by file access time.
+    """
+
+    FILENAME = 'cache.sqlite'
+    SCHEMA = [
+        'CREATE TABLE IF NOT EXISTS cache ('
+        ' host TEXT NOT NULL,'
+        ' key TEXT NOT NULL,'
+        ' project TEXT NOT NULL,'
+        ' pattern TEXT NOT NULL,'
+        ' timestamp REAL NOT NULL,'
+        ' body BLOB NOT NULL,'
+        ' validators TEXT,'
+        ' PRIMARY KEY (host, key))',
+        'CREATE INDEX IF NOT EXISTS cache_project ON cache (host, project, timestamp)',
+        'CREATE INDEX IF NOT EXISTS cache_timestamp ON cache (timestamp)',
+    ]
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.path = os.path.join(directory, self.FILENAME)
+        # Connections cannot be shared between threads, like those fetching
+        # source histories in parallel.
+        self.local = threading.local()
+        self.generation = 0
+
+    @property
+    def connection(self):
+        # Opened lazily and reopened after delete_all() removed the database.
+        if getattr(self.local, 'generation', None) != self.generation:
+            os.makedirs(self.directory, exist_ok=True)
+            self.local.connection = sqlite3.connect(self.path, timeout=60, isolation_level=None)
+            for statement in self.SCHEMA:
+                self.local.connection.execute(statement)
+            self.local.connection.execute('DELETE FROM cache WHERE timestamp < ?',
+                                          (time() - CacheManager.PRUNE_TTL,))
+            self.local.generation = self.generation
+        return self.local.connection
+
+    @staticmethod
+    def host(url):
+        return urlsplit(url).hostname
+
+    def project_age(self, url, project):
+        row = self.connection.execute('SELECT MAX(timestamp) FROM cache WHERE host = ? AND project = ?',
+                                      (self.host(url), project)).fetchone()
+        if row[0] is None:
+            return None
+        return time() - row[0]
+
+    def get(self, url, project, ttl):
+        row = self.connection.execute('SELECT timestamp, body FROM cache WHERE host = ? AND key = ?',
+                                      (self.host(url), Cache.key(url))).fetchone()
+        if row is None:
+            return None, 'does not exist'
+        if time() - row[0] <= ttl:
+            return BytesIO(row[1]), None
+        return None, 'expired'
+
+    def put(self, url, project, pattern, text, validators=None):
+        self.connection.execute('INSERT OR REPLACE INTO cache VALUES (?, ?, ?, ?, ?, ?, ?)',
+                                (self.host(url), Cache.key(url), project or '', pattern, time(), text,
+                                 json.dumps(validators) if validators else None))
+
+    def validators(self, url, project):
+        row = self.connection.execute('SELECT validators FROM cache WHERE host = ? AND key = ?',
+                                      (self.host(url), Cache.key(url))).fetchone()
+        if row is None or row[0] is None:
+            return None
+        return json.loads(row[0])
+
+    def touch(self, url, project):
+        cursor = self.connection.execute('UPDATE cache SET timestamp = ? WHERE host = ? AND key = ?',
+                                         (time(), self.host(url), Cache.key(url)))
+        if cursor.rowcount == 0:
+            return None
+        row = self.connection.execute('SELECT length(body) FROM cache WHERE host = ? AND key = ?',
+                                      (self.host(url), Cache.key(url))).fetchone()
+        return row[0]
+
+    def delete(self, url, project):
+        cursor = self.connection.execute('DELETE FROM cache WHERE host = ? AND key = ?',
+                                         (self.host(url), Cache.key(url)))
+        return cursor.rowcount > 0
+
+    def delete_project(self, apiurl, project):
+        cursor = self.connection.execute('DELETE FROM cache WHERE host = ? AND project = ?',
+                                         (self.host(apiurl), project))
+        return cursor.rowcount > 0
+
+    def delete_all(self):
+        if getattr(self.local, 'generation', None) == self.generation:
+            self.local.connection.close()
+        self.generation += 1
+        if os.path.exists(self.directory):
+            rmtree_nfs_safe(self.directory)
+
+
+Cache.BACKENDS['file'] = CacheBackendFile
+Cache.BACKENDS['sqlite'] = CacheBackendSQLite
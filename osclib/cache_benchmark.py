@@ -0,0 +1,85 @@
+import argparse
+import re
+import shutil
+import tempfile
+import time
+
+from osc import conf
+from osclib.cache import Cache
+
+APIURL = 'https://api.example.com'
+
+
+class Response(object):
+    "Non-seekable response like the one returned by osc.core.http_request()."
+
+    def __init__(self, text):
+        self.text = text
+        self.headers = {'ETag': '"benchmark"'}
+
+    def read(self):
+        return self.text
+
+
+def urls(projects, packages):
+    for project in range(projects):
+        for package in range(packages):
+            yield f'{APIURL}/source/openSUSE:Factory:Staging:{project}/package{package}/_meta'
+
+
+def measure(function, urls):
+    start = time.perf_counter()
+    for url in urls:
+        function(url)
+    return (time.perf_counter() - start) / len(urls) * 1000000
+
+
+def benchmark(backend, directory, args):
+    Cache.CACHE_DIR = directory
+    Cache.backend = Cache.BACKENDS[backend](directory)
+    Cache.patterns = [re.compile(pattern) for pattern in Cache.PATTERNS]
+    # Projects are unchanged since long before the cache was filled.
+    Cache.last_updated[APIURL] = {'__oldest': '1970-01-01T00:00:00Z'}
+
+    cached = list(urls(args.projects, args.packages))
+    missing = [url.replace('/_meta', '/_link') for url in cached]
+    body = b'<package/>' * (args.size // 10)
+
+    results = {
+        'put': measure(lambda url: Cache.put(url, Response(body)).read(), cached),
+        'hit': measure(lambda url: Cache.get(url).read(), cached),
+        'miss': measure(Cache.get, missing),
+    }
+    start = time.perf_counter()
+    for project in range(args.projects):
+        Cache.delete_project(APIURL, f'openSUSE:Factory:Staging:{project}')
+    results['delete_project'] = (time.perf_counter() - start) / args.projects * 1000000
+    return results
+
+
+def main(args) -> None:
+    conf.config['debug'] = False
+    print(f'{args.projects} projects with {args.packages} entries of {args.size} bytes, microseconds per call')
+    print(f"{'backend':<8} {'put':>10} {'hit':>10} {'miss':>10} {'delete_project':>15}")
+    for backend in args.backend:
+        directory = tempfile.mkdtemp(prefix='cache-benchmark-', dir=args.directory)
+        try:
+            results = benchmark(backend, directory, args)
+        finally:
+            shutil.rmtree(directory)
+        print(f"{backend:<8} {results['put']:>10.1f} {results['hit']:>10.1f} {results['miss']:>10.1f} "
+              f"{results['delete_project']:>15.1f}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compare the hit and miss latency of the osclib.cache backends')
+    parser.add_argument('--backend', action='append', choices=sorted(Cache.BACKENDS),
+                        help='backend to measure, may be repeated (default: all)')
+    parser.add_argument('--directory', help='directory to create the caches in, like the NFS-backed cache')
+    parser.add_argument('--projects', type=int, default=10, help='number of projects')
+    parser.add_argument('--packages', type=int, default=500, help='number of entries per project')
+    parser.add_argument('--size', type=int, default=2000, help='size of each entry in bytes')
+    args = parser.parse_args()
+    args.backend = args.backend or sorted(Cache.BACKENDS)
+
+    main(args)
@@ -1,9 +1,12 @@
 from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timezone
 from dateutil.parser import parse as date_parse
 import re
 import socket
 import logging
+import threading
+import time
 from typing import Dict, List, Optional, Tuple, Union
 try:
     from typing import Literal
@@ -34,12 +37,20 @@ from osc.util.helper import decode_it
 from osc import conf
 from osclib.conf import Config
 from osclib.memoize import memoize
+from osclib.sourcehashstore import SourceHashStore
 import traceback
 
 BINARY_REGEX = r'(?:.*::)?(?P<filename>(?P<name>.*)-(?P<version>[^-]+)-(?P<release>[^-]+)\.(?P<arch>[^-\.]+))'
 RPM_REGEX = BINARY_REGEX + r'\.rpm'
 BinaryParsed = namedtuple('BinaryParsed', ('package', 'filename', 'name', 'arch'))
 REQUEST_STATES_MINUS_ACCEPTED = ['new', 'review', 'declined', 'revoked', 'superseded']
+SRCMD5_REGEX = re.compile(r'^[0-9a-f]{32}$')
+SOURCE_HASH_WORKERS = 8
+# Requests are fetched by ids in batches and kept for a short time, see requests_get().
+REQUEST_BATCH_SIZE = 50
+REQUEST_SEARCH_LIMIT = 1000
+REQUEST_CACHE_TTL = 60
+REQUEST_STATS = {'calls': 0, 'avoided': 0}
 
 
 @memoize(session=True)
@@ -113,6 +124,88 @@ def get_request_list_with_history(
     return requests
 
 
+_request_cache: Dict[Tuple[str, str], Tuple[float, Request]] = {}
+_request_cache_lock = threading.Lock()
+
+
+def _requests_read(apiurl: str, response) -> List[Request]:
+    requests = []
+    now = time.time()
+    for element in ET.parse(response).getroot().findall('request'):
+        request = Request()
+        request.read(element)
+        requests.append(request)
+
+    with _request_cache_lock:
+        REQUEST_STATS['calls'] += 1
+        for key in [key for key, (expires, _) in _request_cache.items() if expires <= now]:
+            del _request_cache[key]
+        for request in requests:
+            _request_cache[(apiurl, request.reqid)] = (now + REQUEST_CACHE_TTL, request)
+
+    return requests
+
+
+def requests_get(apiurl: str, request_ids) -> List[Request]:
+    """
+    Requests (with full history) of the given ids in the same order, leaving
+    out those not found.
+
+    Instead of one call per request they are fetched REQUEST_BATCH_SIZE at a
+    time and kept for REQUEST_CACHE_TTL seconds, also when found by
+    requests_search(). The calls made and avoided are counted in
+    REQUEST_STATS.
+    """
+    request_ids = [str(request_id) for request_id in request_ids]
+    requests = {}
+    missing = []
+    now = time.time()
+    with _request_cache_lock:
+        for request_id in request_ids:
+            expires, request = _request_cache.get((apiurl, request_id), (0, None))
+            if expires > now:
+                requests[request_id] = request
+                REQUEST_STATS['avoided'] += 1
+            elif request_id not in missing:
+                missing.append(request_id)
+
+    for offset in range(0, len(missing), REQUEST_BATCH_SIZE):
+        batch = missing[offset:offset + REQUEST_BATCH_SIZE]
+        url = makeurl(apiurl, ['request'], {'view': 'collection', 'ids': ','.join(batch), 'withfullhistory': 1})
+        for request in _requests_read(apiurl, http_GET(url)):
+            requests[request.reqid] = request
+        with _request_cache_lock:
+            REQUEST_STATS['avoided'] += len(batch) - 1
+
+    return [requests[request_id] for request_id in request_ids if request_id in requests]
+
+
+def request_get(apiurl: str, request_id) -> Optional[Request]:
+    """Request of the given id like osc.core.get_request(), or None if not found."""
+    requests = requests_get(apiurl, [request_id])
+    return requests[0] if requests else None
+
+
+def requests_search(apiurl: str, xpath: str) -> List[Request]:
+    """Requests (with full history) matching xpath, fetched REQUEST_SEARCH_LIMIT at a time."""
+    requests = []
+    offset = 0
+    while True:
+        url = makeurl(apiurl, ['search', 'request'], {
+            'match': xpath, 'withfullhistory': 1, 'limit': REQUEST_SEARCH_LIMIT, 'offset': offset})
+        found = _requests_read(apiurl, http_GET(url))
+        requests.extend(found)
+        if len(found) < REQUEST_SEARCH_LIMIT:
+            return requests
+        offset += REQUEST_SEARCH_LIMIT
+
+
+def request_cache_invalidate(apiurl: str, request_id) -> None:
+    """Fetch the request again after it was changed."""
+    with _request_cache_lock:
+        _request_cache.pop((apiurl, str(request_id)), None)
+
+
 def convert_from_osc_et(xml):
     """osc uses xml.etree while we rely on lxml."""
     from xml.etree import ElementTree as oscET
@@ -820,6 +913,15 @@ def package_source_hash(apiurl, project, package, revision=None):
     if package_source_link_copy(apiurl, project, package):
         query['expand'] = 1
 
+    # Unlike the expansion of a link against its target, the unexpanded
+    # sources of a srcmd5 never change and their hash can be kept forever.
+    store = None
+    if revision and 'expand' not in query and SRCMD5_REGEX.match(revision):
+        store = SourceHashStore.default()
+        source_hash = store.get(apiurl, project, package, revision)
+        if source_hash:
+            return source_hash
+
     try:
         url = makeurl(apiurl, ['source', project, package], query)
         root = ET.parse(http_GET(url)).getroot()
@@ -835,7 +937,10 @@ def package_source_hash(apiurl, project, package, revision=None):
         return None
 
     from osclib.util import sha1_short
-    return sha1_short(root.xpath('entry[@name!="_link"]/@md5'))
+    source_hash = sha1_short(root.xpath('entry[@name!="_link"]/@md5'))
+    if store:
+        store.set(apiurl, project, package, revision, source_hash)
+    return source_hash
 
 
 def package_source_hash_history(apiurl, project, package, limit=5, include_project_link=False):
@@ -882,6 +987,24 @@ def package_source_hash_history(apiurl, project, package, limit=5, include_proje
                     break
 
 
+def package_source_hash_histories(apiurl, packages, limit=5, include_project_link=False,
+                                  workers=SOURCE_HASH_WORKERS):
+    """
+    Return the package_source_hash_history() of each (project, package) pair
+    of packages as a dictionary keyed by the pairs.
+
+    The histories are fetched by a pool of workers. Since the hashes of the
+    revisions are kept by package_source_hash() this also serves to prefetch
+    them before checking the histories one package at a time.
+    """
+    def history(pair):
+        return list(package_source_hash_history(apiurl, pair[0], pair[1], limit, include_project_link))
+
+    packages = list(packages)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return dict(zip(packages, executor.map(history, packages)))
+
+
 def package_version(apiurl, project, package):
     try:
         url = makeurl(apiurl, ['source', project, package, '_history'], {'limit': 1})
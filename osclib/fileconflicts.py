@@ -0,0 +1,494 @@
+import argparse
+import gzip
+import hashlib
+import logging
+import os
+import pickle
+import re
+import sys
+import time
+
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+import yaml
+
+logger = logging.getLogger('FileConflicts')
+
+S_IFDIR = 0o040000
+S_IFREG = 0o100000
+S_IFLNK = 0o120000
+GHOST = 0o100
+
+SKIP_RE = re.compile(r'^(glibc-usrmerge-bootstrap-helper|bash-legacybin) ')
+USRMERGE_RE = re.compile(r'^120777 0 root:root (/(?:s?bin|lib(?:64)?)) -> /?usr(/(?:s?bin|lib(?:64)?))$')
+USRMERGE_DIR_RE = re.compile(r'^/(?:s?bin|lib(?:64)?)')
+LINK_RE = re.compile(r'^(12.*)( -> .*?)$')
+FILE_RE = re.compile(r'^(\d+ (\d+) \S+) (.*/)(.*?)$', re.ASCII)
+DIR_RE = re.compile(r'^(.*/)(.*?)/$')
+
+FILE_TYPES = {0o01: 'p', 0o02: 'c', 0o04: 'd', 0o06: 'b', 0o10: '-', 0o12: 'l', 0o14: 's'}
+
+
+class Package:
+    "Data of one package needed to find and judge its file conflicts."
+
+    __slots__ = ('digest', 'keys', 'provides', 'conflicts', 'obsoletes', 'usrmerge')
+
+    def __init__(self, digest: str):
+        self.digest = digest
+        # Keys into FileIndex.files of the files of the package.
+        self.keys: List[str] = []
+        self.provides: List[str] = []
+        self.conflicts: List[str] = []
+        self.obsoletes: List[str] = []
+        # Whether this is a filesystem package with /bin and co linked to /usr.
+        self.usrmerge = False
+
+    def __getstate__(self):
+        return tuple(getattr(self, slot) for slot in self.__slots__)
+
+    def __setstate__(self, state):
+        for slot, value in zip(self.__slots__, state):
+            setattr(self, slot, value)
+
+
+class FileIndex:
+    """
+    Index from path to the packages containing it for the packages of a
+    susetags packages file, used to find the file conflicts between packages
+    like the findfileconflicts script did.
+
+    The index can be saved and updated from a later version of the packages
+    file. Only packages that changed are indexed again, which makes repeated
+    checks of mostly the same packages cheap.
+
+    Packages are named by their '<name> <version> <release> <arch>' string.
+    Files are keyed by '<directory id>/<basename>' to keep the index small,
+    each key maps to the (package, mode id) entries of the file.
+    """
+
+    # Bump to rebuild saved indexes when the format changes.
+    VERSION = 1
+
+    def __init__(self):
+        self.dirs: List[str] = ['/']
+        self.dir_ids: Dict[str, int] = {'/': 0}
+        # Number of file entries per directory, directories without are ignored.
+        self.dir_refs: List[int] = [0]
+        # Known 'filemode fileflags owner:group[ -> link target]' combinations.
+        self.modes: List[str] = ['40755 0 root:root']
+        self.mode_ids: Dict[str, int] = {'40755 0 root:root': 0}
+        self.mode_types: List[int] = [S_IFDIR]
+        self.mode_ghosts: List[int] = [0]
+        self.files: Dict[str, List[Tuple[str, int]]] = {}
+        # Keys of files contained in more than one package.
+        self.collisions: Set[str] = set()
+        self.packages: Dict[str, Package] = {}
+
+    @classmethod
+    def load(cls, path: str) -> 'FileIndex':
+        "Load a saved index, or return an empty one if missing or outdated."
+        index = cls()
+        if os.path.exists(path):
+            with open(path, 'rb') as f:
+                state = pickle.load(f)
+            if state.get('version') == cls.VERSION:
+                del state['version']
+                index.__dict__.update(state)
+        return index
+
+    def save(self, path: str) -> None:
+        with open(path + '.tmp', 'wb') as f:
+            pickle.dump(dict(self.__dict__, version=self.VERSION), f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.rename(path + '.tmp', path)
+
+    @staticmethod
+    def read_packages(path: str) -> Iterable[str]:
+        "Return the lines of a susetags packages file, which may be compressed."
+        if path.endswith('.gz'):
+            return gzip.open(path, 'rt', errors='surrogateescape')
+        return open(path, errors='surrogateescape')
+
+    def update(self, lines: Iterable[str]) -> None:
+        """
+        Make the index match the packages described by the susetags lines.
+        Packages that are unchanged since the last update are left as they are.
+        """
+        seen = set()
+        added = removed = 0
+        for pkg, chunk in self._split(lines):
+            seen.add(pkg)
+            digest = hashlib.sha1('\n'.join(chunk).encode('utf-8', 'surrogateescape')).hexdigest()
+            package = self.packages.get(pkg)
+            if package is not None:
+                if package.digest == digest:
+                    continue
+                self.remove(pkg)
+                removed += 1
+            self.add(pkg, digest, chunk)
+            added += 1
+
+        for pkg in list(self.packages):
+            if pkg not in seen:
+                self.remove(pkg)
+                removed += 1
+
+        logger.debug(f'indexed {added} and dropped {removed} packages, {len(self.packages)} total')
+
+    @staticmethod
+    def _split(lines: Iterable[str]) -> Iterable[Tuple[str, List[str]]]:
+        "Yield the name and lines of each package."
+        pkg = None
+        chunk = []
+        for line in lines:
+            line = line.rstrip('\n')
+            if line.startswith('=Pkg: '):
+                if pkg:
+                    yield pkg, chunk
+                pkg = line[6:]
+                chunk = []
+            chunk.append(line)
+        if pkg:
+            yield pkg, chunk
+
+    def _dir_id(self, directory: str) -> int:
+        n = self.dir_ids.get(directory)
+        if n is None:
+            n = len(self.dirs)
+            self.dir_ids[directory] = n
+            self.dirs.append(directory)
+            self.dir_refs.append(0)
+        return n
+
+    def _mode_id(self, mode: str, flag: int) -> int:
+        m = self.mode_ids.get(mode)
+        if m is None:
+            m = len(self.modes)
+            self.mode_ids[mode] = m
+            self.modes.append(mode)
+            self.mode_types.append(int(mode.split(' ', 1)[0], 8) & 0o7770000)
+            self.mode_ghosts.append(flag & GHOST)
+        return m
+
+    def add(self, pkg: str, digest: str, lines: List[str]) -> None:
+        package = Package(digest)
+        # Let packages of the same name conflict.
+        package.obsoletes.append(pkg.split(' ', 1)[0])
+        skip_files = SKIP_RE.match(pkg)
+        section = None
+        for line in lines:
+            if section is None:
+                if line in ('+Flx:', '+Prv:', '+Con:', '+Obs:'):
+                    section = line[1:4]
+                continue
+            if line == f'-{section}:':
+                section = None
+            elif section == 'Flx':
+                if not skip_files:
+                    self._add_file(pkg, package, line)
+            elif section == 'Prv':
+                # no version stuff
+                package.provides.append(line.split(' ', 1)[0])
+            elif section == 'Con':
+                dependency = line.split(' ', 1)[0]
+                match = re.match(r'^otherproviders\((.*)\)$', dependency)
+                package.conflicts.append(match.group(1) if match else dependency)
+            elif section == 'Obs':
+                package.obsoletes.append(line.split(' ', 1)[0])
+
+        self.packages[pkg] = package
+
+    def _add_file(self, pkg: str, package: Package, line: str) -> None:
+        if pkg.startswith('filesystem '):
+            match = USRMERGE_RE.match(line)
+            if match and match.group(1) == match.group(2):
+                package.usrmerge = True
+
+        # 120777 0 root:root /usr/bin/foo -> /usr/sbin/bar
+        link = ''
+        match = LINK_RE.match(line)
+        if match:
+            line, link = match.groups()
+        # 120777 0 root:root /usr/bin/foo
+        match = FILE_RE.match(line)
+        if not match:
+            return
+        perms, flag, directory, basename = match.group(1), int(match.group(2), 8), match.group(3), match.group(4)
+
+        if flag & GHOST:
+            # it's a ghost directory, remove the ghost flag so no conflict is
+            # produced due to file flag mismatch.
+            if int(perms.split(' ', 1)[0], 8) & 0o7770000 == S_IFDIR:
+                flag ^= GHOST
+                perms = re.sub(r'^(\d+ )(\d+)', rf'\g<1>{flag:o}', perms)
+            # ignore link target
+            link = ''
+            # pretend a ghost file has normal mode
+            perms = re.sub(r'^100000', '100644', perms)
+
+        n = self._dir_id(directory)
+        self.dir_refs[n] += 1
+        key = f'{n}/{basename}'
+        entries = self.files.setdefault(key, [])
+        entries.append((pkg, self._mode_id(perms + link, flag)))
+        if len(entries) > 1:
+            self.collisions.add(key)
+        package.keys.append(key)
+
+    def remove(self, pkg: str) -> None:
+        package = self.packages.pop(pkg)
+        for key in package.keys:
+            self.dir_refs[int(key.split('/', 1)[0])] -= 1
+        for key in set(package.keys):
+            entries = [entry for entry in self.files[key] if entry[0] != pkg]
+            if entries:
+                self.files[key] = entries
+            else:
+                del self.files[key]
+            if len(entries) < 2:
+                self.collisions.discard(key)
+
+    def beautify_mode(self, m: int) -> str:
+        mode, flag, rest = self.modes[m].split(' ', 2)
+        fm = int(mode, 8)
+        ft = FILE_TYPES.get(fm >> 12 & 0o77, '?')
+        fm &= ~0o770000
+
+        rt = int(flag, 8)
+        rts = ''
+        for bit, char in ((0o2, 'd'), (0o1, 'c'), (0o10, 'm'), (0o20, 'n'), (0o100, 'g'), (0o200, 'l'), (0o400, 'r')):
+            if rt & bit:
+                rts += char
+        rt &= ~0o733
+        if rt:
+            rts += f'{rt:o}'
+        if rts:
+            rts += ' '
+        return f'{rts}{ft}{fm:03o} {rest}'
+
+    def conflicts(self) -> List[dict]:
+        """
+        Return the file conflicts between the indexed packages in the format
+        printed by findfileconflicts, a list of {'between': [pkg1, pkg2],
+        'conflicts': paths} where pkg is [name, version, release, arch] and
+        paths are the conflicting paths separated by newlines.
+        """
+        # The index is left untouched, lists are replaced instead of modified.
+        files = dict(self.files)
+        collisions = set(self.collisions)
+        dirs: List[Optional[str]] = [d if refs else None for d, refs in zip(self.dirs, self.dir_refs)]
+        dirs[0] = '/'
+        dir_ids = {d: n for n, d in enumerate(dirs) if d is not None}
+
+        if any(package.usrmerge for package in self.packages.values()):
+            self._usrmerge(files, collisions, dirs, dir_ids)
+
+        implicit = self._implicit_conflicts(files, dirs, dir_ids)
+        if implicit:
+            self._implicit_owners(implicit, files, collisions, dirs, dir_ids)
+
+        # reduce all-dir conflicts and trivial multiarch conflicts
+        for key in list(collisions):
+            entries = files[key]
+            pkgs = [pkg for pkg, _ in entries]
+            # Only packages of the same name but different version/release/arch.
+            if len({pkg.split(' ', 1)[0] for pkg in pkgs}) == 1 and \
+                    all(pkgs[i] != pkgs[i - 1] for i in range(1, len(pkgs))):
+                collisions.discard(key)
+                continue
+            # No checksums are known, so identical directories would conflict.
+            modes = {m for _, m in entries}
+            if len(modes) == 1 and self.mode_types[modes.pop()] == S_IFDIR:
+                collisions.discard(key)
+
+        return self._check(files, collisions, dirs)
+
+    def _usrmerge(self, files, collisions, dirs, dir_ids) -> None:
+        "Move the files in /bin, /sbin, /lib and /lib64 to their /usr counterparts."
+        merged = {}
+        for rn, rd in enumerate(list(dirs)):
+            if rd is None or not USRMERGE_DIR_RE.match(rd):
+                continue
+            n = dir_ids.get('/usr' + rd)
+            if n is None:
+                # the dir does not exist in /usr so just rename it
+                dir_ids['/usr' + rd] = rn
+                del dir_ids[rd]
+                dirs[rn] = '/usr' + rd
+            else:
+                merged[rn] = n
+                # Invalid to skip it when connecting directories.
+                dirs[rn] = f'*** {rd} ***'
+
+        if not merged:
+            return
+
+        for key in [key for key in files if int(key.split('/', 1)[0]) in merged]:
+            rn, basename = key.split('/', 1)
+            target = f'{merged[int(rn)]}/{basename}'
+            files[target] = files.get(target, []) + files.pop(key)
+            if len(files[target]) > 1:
+                collisions.add(target)
+            collisions.discard(key)
+
+    def _implicit_conflicts(self, files, dirs, dir_ids) -> List[str]:
+        "Connect the directories and return the keys of files used as directories by other packages."
+        implicit = []
+        # New parent directories are appended and connected as well.
+        i = 0
+        while i < len(dirs):
+            directory = dirs[i]
+            i += 1
+            match = DIR_RE.match(directory) if directory else None
+            if not match:
+                continue
+            n = dir_ids.get(match.group(1))
+            if n is None:
+                dir_ids[match.group(1)] = len(dirs)
+                dirs.append(match.group(1))
+                continue
+            key = f'{n}/{match.group(2)}'
+            if key not in files:
+                continue
+            if any(self.mode_types[m] == S_IFDIR for _, m in files[key]):
+                continue
+            implicit.append(key)
+        return implicit
+
+    def _implicit_owners(self, implicit, files, collisions, dirs, dir_ids) -> None:
+        "Add the packages owning files below each implicit conflict to it."
+        parents = {}
+        for n, directory in enumerate(dirs):
+            match = DIR_RE.match(directory) if directory else None
+            if match:
+                parents[n] = dir_ids[match.group(1)]
+
+        baddir = {}
+        for key in implicit:
+            n, basename = key.split('/', 1)
+            directory = dir_ids.get(f'{dirs[int(n)]}{basename}/')
+            if directory is not None:
+                baddir[directory] = key
+        done = False
+        while not done:
+            done = True
+            for n, parent in parents.items():
+                if parent in baddir and n not in baddir:
+                    baddir[n] = baddir[parent]
+                    done = False
+
+        # this is not cheap, sorry
+        owners = {}
+        for key, entries in files.items():
+            n = int(key.split('/', 1)[0])
+            if n in baddir:
+                owners.setdefault(baddir[n], set()).update(pkg for pkg, _ in entries)
+
+        for key in implicit:
+            pkgs = owners.get(key) or {'implicit_directory 0 0 noarch'}
+            files[key] = files[key] + [(pkg, 0) for pkg in sorted(pkgs)]
+            collisions.add(key)
+
+    def _declared_conflicts(self, needed: Set[str]) -> Set[Tuple[str, str]]:
+        "Return the pairs of packages that cannot be installed together anyway."
+        whatprovides = {}
+        for pkg, package in self.packages.items():
+            for provide in package.provides:
+                whatprovides.setdefault(provide, []).append(pkg)
+
+        pairs = set()
+        for pkg in needed:
+            package = self.packages.get(pkg)
+            if package is None:
+                continue
+            for conflict in package.conflicts:
+                for p in whatprovides.get(conflict, []):
+                    if p != pkg:
+                        pairs.update(((pkg, p), (p, pkg)))
+            for obsolete in package.obsoletes:
+                for p in whatprovides.get(obsolete, []):
+                    if p != pkg and p.startswith(obsolete + ' '):
+                        pairs.update(((pkg, p), (p, pkg)))
+
+            # let 32bit packages conflict with the i586 version
+            match = re.match(r'^([^ ]+)-32bit ', pkg)
+            if match:
+                name = match.group(1)
+                for p in whatprovides.get(name, []):
+                    if p != pkg and re.match(rf'^{re.escape(name)} .* i[56]86$', p):
+                        pairs.update(((pkg, p), (p, pkg)))
+        return pairs
+
+    def _check(self, files, collisions, dirs) -> List[dict]:
+        needed = set()
+        tocheck = {}
+        for key in sorted(collisions):
+            # normalize
+            entries = sorted(files[key], key=lambda entry: f'{entry[0]}/{entry[1]}')
+            pkgs = [pkg for pkg, _ in entries]
+            needed.update(pkgs)
+            tocheck.setdefault('\n'.join(pkgs), []).append((key, entries))
+
+        declared = self._declared_conflicts(needed)
+        logger.debug(f'found {len(tocheck)} conflict candidates')
+
+        conflicts = []
+        for candidate in sorted(tocheck):
+            pkgs = candidate.split('\n')
+            for i, p1 in enumerate(pkgs):
+                for p2 in pkgs[i + 1:]:
+                    if (p1, p2) in declared:
+                        continue
+                    paths = self._conflicting_paths(p1, p2, tocheck[candidate], dirs)
+                    if paths:
+                        conflicts.append({'between': [p1.split(), p2.split()], 'conflicts': '\n'.join(paths)})
+        return conflicts
+
+    def _conflicting_paths(self, p1, p2, entries, dirs) -> List[str]:
+        paths = []
+        for key, file_entries in entries:
+            modes = [m for pkg, m in file_entries if pkg in (p1, p2)]
+            if not modes:
+                continue
+            info = ''
+            if len(set(modes)) == 1:
+                m = modes[0]
+                # no conflict if all dirs or all ghosts or all links
+                if self.mode_types[m] in (S_IFDIR, S_IFLNK) or self.mode_ghosts[m] == GHOST:
+                    continue
+            elif any(self.mode_types[m] not in (S_IFREG, S_IFLNK) or self.mode_ghosts[m] == GHOST for m in modes):
+                # don't report mode mismatches for files/symlinks that are not ghosts
+                info = f" [mode mismatch: {', '.join(self.beautify_mode(m) for m in modes)}]"
+
+            n, basename = key.split('/', 1)
+            path = dirs[int(n)] + basename
+            if not re.search(r'/etc/uefi/certs/.*crt', path):
+                paths.append(path + info)
+        return paths
+
+
+def main(args) -> None:
+    start = time.monotonic()
+    index = FileIndex.load(args.index) if args.index else FileIndex()
+    with FileIndex.read_packages(args.packages) as lines:
+        index.update(lines)
+    logger.info(f'indexed {len(index.packages)} packages in {time.monotonic() - start:.1f}s')
+    if args.index:
+        index.save(args.index)
+
+    start = time.monotonic()
+    conflicts = index.conflicts()
+    logger.info(f'found {len(conflicts)} conflicts in {time.monotonic() - start:.1f}s')
+    if conflicts:
+        yaml.safe_dump(conflicts, sys.stdout, default_flow_style=None)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Find file conflicts between the packages of a susetags packages file')
+    parser.add_argument('--index', help='file to keep the index in, only changed packages are indexed again')
+    parser.add_argument('-d', '--debug', action='store_true', help='print debug information')
+    parser.add_argument('packages', help='susetags packages file, optionally gzip compressed')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.DEBUG if args.debug else logging.INFO)
+    main(args)
@@ -0,0 +1,157 @@
+import logging
+import os
+import threading
+
+from typing import Dict, Iterator, NamedTuple
+
+logger = logging.getLogger('HeaderStore')
+
+
+class HeaderEntry(NamedTuple):
+    name: str
+    offset: int
+    length: int
+
+    @property
+    def filename(self) -> str:
+        return f'{self.name}.rpm'
+
+
+class HeaderStore:
+    """
+    Append-only store of RPM headers keyed by hdrmd5.
+
+    Headers are appended to a single pack file and located through an index
+    file which names the pack followed by an append-only log of additions and
+    tombstones:
+
+        = <pack generation>
+        + <hdrmd5> <name> <offset> <length>
+        - <hdrmd5>
+
+    Removing a header only appends a tombstone, the space is reclaimed by
+    compact() once the dead bytes outweigh the live ones. Compaction writes a
+    new pack generation and switches to it by replacing the index.
+    """
+
+    INDEX = 'headers.idx'
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.index_path = os.path.join(directory, self.INDEX)
+        self.generation = 0
+        self.entries: Dict[str, HeaderEntry] = {}
+        self.dead = 0
+        self.lock = threading.Lock()
+        self._load()
+
+    @property
+    def pack_path(self) -> str:
+        return self._pack_path(self.generation)
+
+    def _pack_path(self, generation: int) -> str:
+        return os.path.join(self.directory, f'headers.{generation}.pack')
+
+    def _load(self):
+        if not os.path.exists(self.index_path):
+            return
+
+        pack_size = 0
+        with open(self.index_path) as index:
+            for line in index:
+                fields = line.split()
+                if len(fields) == 2 and fields[0] == '=':
+                    self.generation = int(fields[1])
+                    pack_size = os.path.getsize(self.pack_path) if os.path.exists(self.pack_path) else 0
+                elif len(fields) == 5 and fields[0] == '+':
+                    entry = HeaderEntry(fields[2], int(fields[3]), int(fields[4]))
+                    if entry.offset + entry.length > pack_size:
+                        # Interrupted before the pack was flushed.
+                        continue
+                    if fields[1] in self.entries:
+                        self.dead += self.entries[fields[1]].length
+                    self.entries[fields[1]] = entry
+                elif len(fields) == 2 and fields[0] == '-':
+                    if fields[1] in self.entries:
+                        self.dead += self.entries.pop(fields[1]).length
+                else:
+                    # Only a truncated last line is expected after a crash.
+                    logger.warning(f'ignoring malformed line in {self.index_path}: {line!r}')
+
+    def __contains__(self, hdrmd5: str) -> bool:
+        return hdrmd5 in self.entries
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.entries)
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def add(self, hdrmd5: str, name: str, content: bytes) -> None:
+        with self.lock:
+            with open(self.pack_path, 'ab') as pack:
+                offset = pack.tell()
+                pack.write(content)
+            with open(self.index_path, 'a') as index:
+                if index.tell() == 0:
+                    index.write(f'= {self.generation}\n')
+                index.write(f'+ {hdrmd5} {name} {offset} {len(content)}\n')
+
+            if hdrmd5 in self.entries:
+                self.dead += self.entries[hdrmd5].length
+            self.entries[hdrmd5] = HeaderEntry(name, offset, len(content))
+
+    def remove(self, hdrmd5: str) -> None:
+        with self.lock:
+            with open(self.index_path, 'a') as index:
+                index.write(f'- {hdrmd5}\n')
+            self.dead += self.entries.pop(hdrmd5).length
+
+    def read(self, hdrmd5: str) -> bytes:
+        entry = self.entries[hdrmd5]
+        with open(self.pack_path, 'rb') as pack:
+            pack.seek(entry.offset)
+            return pack.read(entry.length)
+
+    def export(self, hdrmd5s, destdir: str) -> Dict[str, str]:
+        """
+        Write the given headers as individual <hdrmd5>-<name>.rpm files for tools
+        like rpms2solv which expect them. Returns a mapping of hdrmd5 to path.
+        """
+        paths = {}
+        with open(self.pack_path, 'rb') as pack:
+            for hdrmd5 in sorted(hdrmd5s, key=lambda h: self.entries[h].offset):
+                entry = self.entries[hdrmd5]
+                pack.seek(entry.offset)
+                path = os.path.join(destdir, f'{hdrmd5}-{entry.filename}')
+                with open(path, 'wb') as f:
+                    f.write(pack.read(entry.length))
+                paths[hdrmd5] = path
+
+        return paths
+
+    def needs_compaction(self) -> bool:
+        live = sum(entry.length for entry in self.entries.values())
+        return self.dead > live
+
+    def compact(self) -> None:
+        "Rewrite the live headers into the next pack generation."
+        with self.lock:
+            logger.info(f'Compacting {self.pack_path} dropping {self.dead} bytes')
+            generation = self.generation + 1
+            entries = {}
+            with open(self.pack_path, 'rb') as pack, open(self._pack_path(generation), 'wb') as pack_new, \
+                    open(self.index_path + '.new', 'w') as index_new:
+                index_new.write(f'= {generation}\n')
+                for hdrmd5, entry in sorted(self.entries.items(), key=lambda item: item[1].offset):
+                    pack.seek(entry.offset)
+                    entries[hdrmd5] = HeaderEntry(entry.name, pack_new.tell(), entry.length)
+                    pack_new.write(pack.read(entry.length))
+                    index_new.write(f'+ {hdrmd5} {entry.name} {entries[hdrmd5].offset} {entry.length}\n')
+
+            # Replacing the index switches to the new generation atomically.
+            os.rename(self.index_path + '.new', self.index_path)
+            os.unlink(self.pack_path)
+            self.generation = generation
+            self.entries = entries
+            self.dead = 0
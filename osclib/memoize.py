@@ -1,15 +1,116 @@
-from datetime import datetime
-import fcntl
 from functools import wraps
+import hashlib
 import os
 from osclib.cache_manager import CacheManager
-import shelve
 import pickle
+import sqlite3
+import threading
+from time import time
 
 # Where the cache files are stored
 CACHEDIR = CacheManager.directory('memoize')
 
 
+class MemoizeStore(object):
+    """Persistent cache of one memoized function backed by SQLite.
+
+    Readers do not block each other, unlike the exclusive lock previously held
+    on a shelve for every call. The default rollback journal is kept since
+    write-ahead logging does not work on network filesystems. Entries are
+    indexed by timestamp so expired or surplus entries are evicted by a single
+    indexed delete without loading values. Expired entries are removed when
+    the database is first opened.
+    """
+
+    SCHEMA = [
+        'CREATE TABLE IF NOT EXISTS memoize ('
+        ' key TEXT PRIMARY KEY,'
+        ' timestamp REAL NOT NULL,'
+        ' value BLOB NOT NULL)',
+        'CREATE INDEX IF NOT EXISTS memoize_timestamp ON memoize (timestamp)',
+    ]
+
+    def __init__(self, path, ttl, slots, nclean):
+        self.path = path
+        self.ttl = ttl
+        self.slots = slots
+        self.nclean = nclean
+        self.local = threading.local()
+        # Entries inserted since last counted, only an upper bound as other
+        # processes may evict entries and replace does not add any.
+        self.count = 0
+
+    @property
+    def connection(self):
+        # A connection must neither be shared between threads nor with forked children.
+        if getattr(self.local, 'pid', None) != os.getpid():
+            self.local.connection = sqlite3.connect(self.path, timeout=60, isolation_level=None)
+            for statement in self.SCHEMA:
+                self.local.connection.execute(statement)
+            self.local.connection.execute('DELETE FROM memoize WHERE timestamp < ?', (time() - self.ttl,))
+            self.local.pid = os.getpid()
+            self.count = self.local.connection.execute('SELECT COUNT(*) FROM memoize').fetchone()[0]
+        return self.local.connection
+
+    def get(self, key):
+        row = self.connection.execute('SELECT timestamp, value FROM memoize WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            return None
+        return row[0], pickle.loads(row[1])
+
+    def set(self, key, timestamp, value):
+        value = pickle.dumps(value, protocol=-1)
+        with self.connection:
+            self.connection.execute('BEGIN IMMEDIATE')
+            self.connection.execute('INSERT OR REPLACE INTO memoize VALUES (?, ?, ?)', (key, timestamp, value))
+            self.count += 1
+            if self.count >= self.slots:
+                self.clean()
+
+    def clean(self):
+        # Only counted once the running count reached the limit.
+        count = self.connection.execute('SELECT COUNT(*) FROM memoize').fetchone()[0]
+        if count >= self.slots:
+            nclean = self.nclean + count - self.slots
+            self.connection.execute('DELETE FROM memoize WHERE key IN '
+                                    '(SELECT key FROM memoize ORDER BY timestamp LIMIT ?)', (nclean,))
+            count -= nclean
+        self.count = count
+
+    def delete(self, key):
+        self.connection.execute('DELETE FROM memoize WHERE key = ?', (key,))
+
+    def clear(self):
+        self.connection.execute('DELETE FROM memoize')
+        self.count = 0
+
+
+class MemoizeSessionStore(object):
+    """In-memory cache of one memoized function reset by memoize_session_reset()."""
+
+    def __init__(self, fn):
+        self.fn = fn
+
+    @property
+    def cache(self):
+        if not hasattr(self.fn, '_memoize_session_cache'):
+            self.fn._memoize_session_cache = {}
+            memoize.session_functions.append(self.fn)
+        return self.fn._memoize_session_cache
+
+    def get(self, key):
+        return self.cache.get(key)
+
+    def set(self, key, timestamp, value):
+        self.cache[key] = (timestamp, value)
+
+    def delete(self, key):
+        self.cache.pop(key, None)
+
+    def clear(self):
+        self.cache.clear()
+
+
 def memoize(ttl=None, session=False, add_invalidate=False):
     """Decorator function to implement a persistent cache.
 
@@ -17,53 +118,19 @@ def memoize(ttl=None, session=False, add_invalidate=False):
     ... def test_func(a):
     ...     return a
 
-    Internally, the memoized function has a cache:
-
-    >>> cache = [c.cell_contents for c in test_func.func_closure if 'sync' in dir(c.cell_contents)][0]
-    >>> 'sync' in dir(cache)
-    True
-
-    There is a limit of the size of the cache
-
-    >>> for k in cache:
-    ...     del cache[k]
-    >>> len(cache)
-    0
-
-    >>> for i in range(4095):
-    ...     test_func(i)
-    ... len(cache)
-    4095
-
-    >>> test_func(0)
-    0
-
-    >>> len(cache)
-    4095
-
-    >>> test_func(4095)
-    4095
-
-    >>> len(cache)
-    3072
+    The value is computed once and then served from the cache until the ttl
+    expires.
 
     >>> test_func(0)
     0
 
-    >>> len(cache)
-    3073
-
-    >>> from datetime import timedelta
-    >>> k = [k for k in cache if cPickle.loads(k) == ((0,), {})][0]
-    >>> t, v = cache[k]
-    >>> t = t - timedelta(days=10)
-    >>> cache[k] = (t, v)
-    >>> test_func(0)
-    0
-    >>> t2, v = cache[k]
-    >>> t != t2
-    True
+    There is a limit of the size of the cache. When SLOTS is reached the
+    NCLEAN oldest entries are removed.
 
+    With session=True the cache is kept in memory for the life of the process
+    and can be reset using memoize_session_reset(). With add_invalidate=True
+    the decorated method adds _invalidate_<name>() and _invalidate_all() to
+    its instance.
     """
 
     # Configuration variables
@@ -73,65 +140,21 @@ def memoize(ttl=None, session=False, add_invalidate=False):
     memoize.session_functions = []
 
     def _memoize(fn):
-        # Implement a POSIX lock / unlock extension for shelves. Inspired
-        # on ActiveState Code recipe #576591
-        def _lock(filename):
-            lckfile = open(filename + '.lck', 'w')
-            fcntl.flock(lckfile.fileno(), fcntl.LOCK_EX)
-            return lckfile
-
-        def _unlock(lckfile):
-            fcntl.flock(lckfile.fileno(), fcntl.LOCK_UN)
-            lckfile.close()
-
-        def _open_cache(cache_name):
-            if not session:
-                lckfile = _lock(cache_name)
-                cache = shelve.open(cache_name, protocol=-1)
-                # Store a reference to the lckfile to avoid to be
-                # closed by gc
-                cache.lckfile = lckfile
-            else:
-                if not hasattr(fn, '_memoize_session_cache'):
-                    fn._memoize_session_cache = {}
-                    memoize.session_functions.append(fn)
-                cache = fn._memoize_session_cache
-            return cache
-
-        def _close_cache(cache):
-            if not session:
-                cache.close()
-                _unlock(cache.lckfile)
-
-        def _clean_cache(cache):
-            len_cache = len(cache)
-            if len_cache >= SLOTS:
-                nclean = NCLEAN + len_cache - SLOTS
-                keys_to_delete = sorted(cache, key=lambda k: cache[k][0])[:nclean]
-                for key in keys_to_delete:
-                    del cache[key]
-
         def _key(obj):
-            # Pickle doesn't guarantee that there is a single
-            # representation for every serialization.  We can try to
-            # picke / depickle twice to have a canonical
-            # representation.
-            key = pickle.dumps(obj, protocol=-1)
-            key = pickle.dumps(pickle.loads(key), protocol=-1)
-            # shelve only support str keys
-            return key if session else str(key)
-
-        def _invalidate(*args, **kwargs):
-            key = _key((args, kwargs))
-            cache = _open_cache(cache_name)
-            if key in cache:
-                del cache[key]
-
-        def _invalidate_all():
-            cache = _open_cache(cache_name)
-            cache.clear()
+            # Hash the pickled arguments to provide a compact fixed length key.
+            return hashlib.sha1(pickle.dumps(obj, protocol=-1)).hexdigest()
+
+        def _key_call(args, kwargs):
+            first = str(args[0]) if isinstance(args[0], object) else args[0]
+            return _key((first, args[1:], kwargs))
 
         def _add_invalidate_method(_self):
+            def _invalidate(*args, **kwargs):
+                cache.delete(_key_call((_self,) + args, kwargs))
+
+            def _invalidate_all():
+                cache.clear()
+
             name = f'_invalidate_{fn.__name__}'
             if not hasattr(_self, name):
                 setattr(_self, name, _invalidate)
@@ -142,27 +165,23 @@ def memoize(ttl=None, session=False, add_invalidate=False):
 
         @wraps(fn)
         def _fn(*args, **kwargs):
-            def total_seconds(td):
-                return (td.microseconds + (td.seconds + td.days * 24 * 3600.) * 10**6) / 10**6
-            now = datetime.now()
+            now = time()
             if add_invalidate:
                 _self = args[0]
                 _add_invalidate_method(_self)
-            first = str(args[0]) if isinstance(args[0], object) else args[0]
-            key = _key((first, args[1:], kwargs))
-            updated = False
-            cache = _open_cache(cache_name)
-            if key in cache:
-                timestamp, value = cache[key]
-                updated = True if total_seconds(now - timestamp) < ttl else False
-            if not updated:
-                value = fn(*args, **kwargs)
-                cache[key] = (now, value)
-            _clean_cache(cache)
-            _close_cache(cache)
+            key = _key_call(args, kwargs)
+            entry = cache.get(key)
+            if entry is not None and now - entry[0] < ttl:
+                return entry[1]
+
+            value = fn(*args, **kwargs)
+            cache.set(key, now, value)
             return value
 
-        cache_name = os.path.join(CACHEDIR, fn.__name__)
+        if session:
+            cache = MemoizeSessionStore(fn)
+        else:
+            cache = MemoizeStore(os.path.join(CACHEDIR, fn.__name__ + '.sqlite'), ttl, SLOTS, NCLEAN)
         return _fn
 
     ttl = ttl if ttl else TIMEOUT
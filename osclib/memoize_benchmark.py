@@ -0,0 +1,70 @@
+import argparse
+import multiprocessing
+import shutil
+import tempfile
+import time
+
+from osclib import memoize
+
+
+def worker(directory, phase, process, keys, calls, start, results):
+    memoize.CACHEDIR = directory
+
+    @memoize.memoize()
+    def benchmark(key):
+        return {'key': key, 'value': 'x' * 100}
+
+    if phase == 'miss':
+        # Every call computes and stores a value of its own.
+        arguments = [f'{process}-{i}' for i in range(calls)]
+    else:
+        arguments = [i % keys for i in range(calls)]
+
+    start.wait()
+    begin = time.perf_counter()
+    for argument in arguments:
+        benchmark(argument)
+    results.put(time.perf_counter() - begin)
+
+
+def run(directory, phase, processes, keys, calls):
+    "Return the calls per second of all processes together."
+    start = multiprocessing.Event()
+    results = multiprocessing.Queue()
+    workers = [multiprocessing.Process(target=worker, args=(directory, phase, i, keys, calls, start, results))
+               for i in range(processes)]
+    for process in workers:
+        process.start()
+    start.set()
+    elapsed = max(results.get() for _ in workers)
+    for process in workers:
+        process.join()
+    return processes * calls / elapsed
+
+
+def main(args) -> None:
+    print(f'{args.calls} calls per process, {args.keys} keys for hits, calls per second of all processes')
+    print(f"{'processes':>9} {'hit':>10} {'miss':>10}")
+    for processes in args.processes:
+        directory = tempfile.mkdtemp(prefix='memoize-benchmark-', dir=args.directory)
+        try:
+            # Fill the cache for the hits.
+            run(directory, 'hit', 1, args.keys, args.keys)
+            hit = run(directory, 'hit', processes, args.keys, args.calls)
+            miss = run(directory, 'miss', processes, args.keys, args.calls)
+        finally:
+            shutil.rmtree(directory)
+        print(f'{processes:>9} {hit:>10.0f} {miss:>10.0f}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Measure memoize() calls per second of concurrent processes')
+    parser.add_argument('--directory', help='directory to create the cache in, like the shared cache directory')
+    parser.add_argument('--processes', type=int, action='append',
+                        help='number of concurrent processes, may be repeated (default: 1, 2, 4 and 8)')
+    parser.add_argument('--keys', type=int, default=1000, help='number of distinct keys of the hits')
+    parser.add_argument('--calls', type=int, default=2000, help='number of calls per process')
+    args = parser.parse_args()
+    args.processes = args.processes or [1, 2, 4, 8]
+
+    main(args)
@@ -2,6 +2,9 @@ import osc
 
 from urllib.error import HTTPError
 
+from osclib.core import request_cache_invalidate
+from osclib.core import requests_get
+
 
 class PrioCommand(object):
     def __init__(self, api):
@@ -14,16 +17,19 @@ class PrioCommand(object):
 
         """
         message = f"raising priority for {status.get('name')}"
-        for r in status.findall('missing_reviews/review'):
+        reviews = status.findall('missing_reviews/review')
+        requests = {req.reqid: req for req in requests_get(self.api.apiurl, [r.get('request') for r in reviews])}
+        for r in reviews:
             reqid = r.get('request')
-            req = osc.core.get_request(self.api.apiurl, reqid)
-            if req.priority == priority:
+            req = requests.get(reqid)
+            if req is None or req.priority == priority:
                 continue
             query = {'cmd': 'setpriority', 'priority': priority}
             url = osc.core.makeurl(self.api.apiurl, ['request', reqid], query)
             print(f"raising priority of {r.get('package')} [{r.get('request')}] to {priority}")
             try:
                 osc.core.http_POST(url, data=message)
+                request_cache_invalidate(self.api.apiurl, reqid)
             except HTTPError as e:
                 print(e)
 
@@ -1,7 +1,7 @@
 from urllib.error import HTTPError
 from osc import oscerr
 from osc.core import change_review_state
-from osc.core import get_request
+from osclib.core import request_get
 from osclib.request_finder import RequestFinder
 
 
@@ -13,7 +13,7 @@ class RepairCommand(object):
     def repair(self, request):
         reviews = []
         reqid = str(request)
-        req = get_request(self.api.apiurl, reqid)
+        req = request_get(self.api.apiurl, reqid)
 
         if not req:
             raise oscerr.WrongArgs(f'Request {reqid} not found')
@@ -11,14 +11,14 @@ from lxml import etree as ET
 from osc.core import http_GET
 from osc.core import makeurl
 
-import yaml
-
+from osclib import susetags
 from osclib.cache_manager import CacheManager
+from osclib.fileconflicts import FileIndex
 from osclib.repomirror import RepoMirror
+from osclib.util import sha1_short
 
 logger = logging.getLogger('InstallChecker')
 
-SCRIPT_PATH = os.path.dirname(os.path.realpath(__file__))
 CACHEDIR = CacheManager.directory('repository-meta')
 
 
@@ -64,17 +64,7 @@ def _check_conflicts_whitelist(sp1, sp2, whitelist):
         return True
 
 
-def _do_packages_conflict(pool, pkgs):
-    logger.debug("Checking whether %s can be installed at once", pkgs)
-    jobs = []
-    for pkg in pkgs:
-        sel = pool.select(pkg, solv.Selection.SELECTION_CANON | solv.Selection.SELECTION_DOTARCH)
-        if sel.isempty():
-            raise RuntimeError(f"{pkg} not found in pool")
-
-        jobs += sel.jobs(solv.Job.SOLVER_INSTALL)
-
-    solver = pool.Solver()
+def _do_packages_conflict(solver, jobs):
     problems = solver.solve(jobs)
     if not problems:
         return False
@@ -85,42 +75,80 @@ def _do_packages_conflict(pool, pkgs):
     return True
 
 
-def _fileconflicts(pfile, arch, target_packages, whitelist):
-    script = os.path.join(SCRIPT_PATH, '..', 'findfileconflicts')
-    p = subprocess.run(['perl', script, pfile], stdout=subprocess.PIPE)
-    if p.returncode or len(p.stdout):
-        output = ''
-        conflicts = yaml.safe_load(p.stdout)
+def _file_index(pfile, base=None):
+    """
+    Return the file index of pfile. With a base the saved index of the base
+    packages is updated, so only the packages of the staging are indexed.
+    """
+    index = FileIndex()
+    if base is not None:
+        path = os.path.join(base.directory, 'fileconflicts.index')
+        with base.lock():
+            index = FileIndex.load(path)
+            if not index.packages:
+                with open(base.packages_path, errors='surrogateescape') as lines:
+                    index.update(lines)
+                index.save(path)
+
+    with FileIndex.read_packages(pfile) as lines:
+        index.update(lines)
+    return index
+
+
+def _fileconflicts(pfile, arch, target_packages, whitelist, base=None):
+    candidates = []
+    for conflict in _file_index(pfile, base).conflicts():
+        sp1 = conflict['between'][0]
+        sp2 = conflict['between'][1]
+
+        if sp1[0] not in target_packages and sp2[0] not in target_packages:
+            continue
+
+        if _check_conflicts_whitelist(sp1, sp2, whitelist):
+            continue
+
+        candidates.append(conflict)
+
+    if not candidates:
+        return None
+
+    # One pool and solver confirm all candidates.
+    pool = solv.Pool()
+    pool.setarch(arch)
+    repo = pool.add_repo("packages")
+    repo.add_susetags(solv.xfopen(pfile), pool.lookup_id(solv.SOLVID_META, solv.SUSETAGS_DEFAULTVENDOR), "en")
+    pool.createwhatprovides()
+    solver = pool.Solver()
 
-        pool = solv.Pool()
-        pool.setarch(arch)
-        repo = pool.add_repo("packages")
-        repo.add_susetags(solv.xfopen(pfile), pool.lookup_id(solv.SOLVID_META, solv.SUSETAGS_DEFAULTVENDOR), "en")
-        pool.createwhatprovides()
+    jobs = {}
 
-        for conflict in conflicts:
-            sp1 = conflict['between'][0]
-            sp2 = conflict['between'][1]
+    def install_jobs(pkg):
+        if pkg not in jobs:
+            logger.debug("Checking whether %s can be installed", pkg)
+            sel = pool.select(pkg, solv.Selection.SELECTION_CANON | solv.Selection.SELECTION_DOTARCH)
+            if sel.isempty():
+                raise RuntimeError(f"{pkg} not found in pool")
+            jobs[pkg] = sel.jobs(solv.Job.SOLVER_INSTALL)
+        return jobs[pkg]
 
-            if sp1[0] not in target_packages and sp2[0] not in target_packages:
-                continue
+    output = ''
+    for conflict in candidates:
+        sp1 = conflict['between'][0]
+        sp2 = conflict['between'][1]
 
-            if _check_conflicts_whitelist(sp1, sp2, whitelist):
-                continue
-
-            pkgcanon1 = _format_pkg(sp1)
-            pkgcanon2 = _format_pkg(sp2)
-            if _do_packages_conflict(pool, [pkgcanon1, pkgcanon2]):
-                logger.debug("Packages %s and %s with conflicting files conflict", pkgcanon1, pkgcanon2)
-                continue
+        pkgcanon1 = _format_pkg(sp1)
+        pkgcanon2 = _format_pkg(sp2)
+        if _do_packages_conflict(solver, install_jobs(pkgcanon1) + install_jobs(pkgcanon2)):
+            logger.debug("Packages %s and %s with conflicting files conflict", pkgcanon1, pkgcanon2)
+            continue
 
-            output += f"found conflict of {_format_pkg(sp1)} with {_format_pkg(sp2)}\n"
-            for file in conflict['conflicts'].split('\n'):
-                output += f"  {file}\n"
-            output += "\n"
+        output += f"found conflict of {_format_pkg(sp1)} with {_format_pkg(sp2)}\n"
+        for file in conflict['conflicts'].split('\n'):
+            output += f"  {file}\n"
+        output += "\n"
 
-        if len(output):
-            return output
+    if len(output):
+        return output
 
 
 def filter_release(line):
@@ -174,27 +202,83 @@ def parsed_installcheck(repos, arch, target_packages, whitelist):
     return reported_problems
 
 
-def installcheck(directories, arch, whitelist, ignore_conflicts):
+def followup_installcheck(reported_problems):
+    """
+    Replace the complete output of another package found within the output of
+    a package reported by parsed_installcheck() by FOLLOWUP(package).
 
-    with tempfile.TemporaryDirectory(prefix='repochecker') as dir:
-        pfile = os.path.join(dir, 'packages')
+    Outputs are matched as blocks of whole lines looked up by their content,
+    so this stays linear in the size of the output even when thousands of
+    packages fail because of the same library. Of packages with identical
+    output the first one keeps it and the others become its followups.
+    """
+    blocks = dict()
+    lengths = dict()
+    for package, problem in reported_problems.items():
+        lines = tuple(problem['output'])
+        if lines:
+            blocks.setdefault(lines, package)
+            lengths.setdefault(lines[0], set()).add(len(lines))
+    # try the longest blocks first
+    lengths = {line: sorted(values, reverse=True) for line, values in lengths.items()}
+
+    for package, problem in reported_problems.items():
+        lines = problem['output']
+        output = []
+        lnr = 0
+        while lnr < len(lines):
+            for length in lengths.get(lines[lnr], []):
+                if lnr + length > len(lines):
+                    continue
+                followup = blocks.get(tuple(lines[lnr:lnr + length]))
+                if followup is not None and followup != package:
+                    output.append(f'FOLLOWUP({followup})')
+                    lnr += length
+                    break
+            else:
+                output.append(lines[lnr])
+                lnr += 1
+        problem['output'] = output
+
+    return reported_problems
+
+
+def write_packages(directory, directories, base=None):
+    """
+    Write the susetags packages file of the mirrored directories, layered above
+    the optional base, into directory and return the catalog of packages per
+    directory.
+    """
+    try:
+        return susetags.write_packages(directory, directories, base)
+    except susetags.CorruptHeader:
+        # the corrupt header was removed to be mirrored again
+        raise CorruptRepos
 
-        script = os.path.join(SCRIPT_PATH, '..', 'write_repo_susetags_file.pl')
-        parts = ['perl', script, dir] + directories
 
-        p = subprocess.run(parts)
-        if p.returncode:
-            # technically only 126, but there is no other value atm -
-            # so if some other perl error happens, we don't continue
-            raise CorruptRepos
+def installcheck_base(key, directories):
+    """
+    Return the packages base identified by key, which must include the state of
+    the repositories it covers. directories is only called to mirror them if the
+    base was not built yet.
+    """
+    base = susetags.PackagesBase(CacheManager.directory('installcheck-base', sha1_short(key)))
+    try:
+        return base.load_or_build(directories)
+    except susetags.CorruptHeader:
+        raise CorruptRepos
+
+
+def installcheck(directories, arch, whitelist, ignore_conflicts, base=None):
+
+    with tempfile.TemporaryDirectory(prefix='repochecker') as dir:
+        pfile = os.path.join(dir, 'packages')
 
-        target_packages = []
-        with open(os.path.join(dir, 'catalog.yml')) as file:
-            catalog = yaml.safe_load(file)
-            target_packages = catalog.get(directories[0], [])
+        catalog = write_packages(dir, directories, base)
+        target_packages = catalog.get(directories[0], {})
 
         parts = []
-        output = _fileconflicts(pfile, arch, target_packages, ignore_conflicts)
+        output = _fileconflicts(pfile, arch, target_packages, ignore_conflicts, base)
         if output:
             parts.append(output)
 
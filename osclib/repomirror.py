@@ -1,34 +1,62 @@
+import argparse
 import fcntl
-import itertools
 import logging
 import os
 import osc.conf
 import re
+import shutil
 import struct
-import sys
-import tempfile
+import time
+import uuid
 
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from lxml import etree as ET
 from osc.core import makeurl, http_GET
 from osc.util.cpio import CpioHdr
+from osclib.headerstore import HeaderStore
+from typing import Dict, List, NamedTuple, Optional, Set
 from urllib.parse import quote_plus
 
 logger = logging.getLogger('RepoMirror')
 
 
+class MirrorChanges(NamedTuple):
+    "hdrmd5 of the headers added and removed by a mirror run."
+    added: List[str]
+    removed: List[str]
+
+
 class RepoMirror:
     cpio_struct = struct.Struct('6s8s8s8s8s8s8s8s8s8s8s8s8s8s')
     cpio_name_re = re.compile('^([^/]+)-([0-9a-f]{32})$')
 
-    def __init__(self, apiurl: str, nameignore: str = '-debug(info|source|info-32bit).rpm$'):
+    # Batch size is adapted to have each batch take roughly BATCH_SECONDS.
+    BATCH_SIZE = 50
+    BATCH_SIZE_MIN = 10
+    BATCH_SIZE_MAX = 1000
+    BATCH_SECONDS = 20
+
+    def __init__(self, apiurl: str, nameignore: str = '-debug(info|source|info-32bit).rpm$', workers: int = 1,
+                 packed: bool = False):
         """
         Class to mirror RPM headers of all binaries in a repo on OBS (full tree).
         Debug packages are ignored by default, see the nameignore parameter.
+        With workers > 1 that many batches of headers are downloaded at once.
+        With packed the headers are kept in a HeaderStore instead of one
+        <md5>-<name>.rpm file per binary. Both layouts can share destdir.
         """
         self.apiurl = apiurl
         self.nameignorere = re.compile(nameignore)
+        self.workers = workers
+        self.packed = packed
+        self.batch_size = self.BATCH_SIZE
 
-    def extract_cpio_stream(self, destdir: str, stream):
+    def extract_cpio_stream(self, destdir: str, stream, wanted: Optional[Set[str]] = None,
+                            store: Optional[HeaderStore] = None):
+        """
+        Extract the headers contained in a cpioheaders stream into destdir or store.
+        If wanted is given only headers named like '<md5>-<name>.rpm' in the set are kept.
+        """
         while True:
             hdrtuples = self.cpio_struct.unpack(stream.read(self.cpio_struct.size))
             # Read and parse the CPIO header
@@ -51,14 +79,20 @@ class RepoMirror:
             elif binarymatch:
                 name = binarymatch.group(1)
                 md5 = binarymatch.group(2)
-                destpath = os.path.join(destdir, f'{md5}-{name}.rpm')
-                with tempfile.NamedTemporaryFile(mode='wb', dir=destdir) as tmpfile:
-                    # Probably not big enough to need chunking
-                    tmpfile.write(stream.read(hdr.filesize))
-                    os.link(tmpfile.name, destpath)
-                    # Would be nice to use O_TMPFILE + link here, but python passes
-                    # O_EXCL which breaks that.
-                    # os.link(f'/proc/self/fd/{tmpfile.fileno()}', destpath)
+                filename = f'{md5}-{name}.rpm'
+                # Probably not big enough to need chunking
+                content = stream.read(hdr.filesize)
+                if wanted is not None and filename not in wanted:
+                    pass
+                elif store is not None:
+                    store.add(md5, name, content)
+                else:
+                    # The batch pack is already complete on disk, so a partial header can
+                    # only be left behind by a crash and is replaced on the next mirror.
+                    destpath = os.path.join(destdir, filename)
+                    with open(destpath + '.part', 'wb') as f:
+                        f.write(content)
+                    os.rename(destpath + '.part', destpath)
 
                 align()
             elif hdr.filename == 'TRAILER!!!':
@@ -68,7 +102,7 @@ class RepoMirror:
             else:
                 raise NotImplementedError(f'Unhandled file {hdr.filename} in archive')
 
-    def _mirror(self, destdir: str, prj: str, repo: str, arch: str) -> None:
+    def _mirror(self, destdir: str, prj: str, repo: str, arch: str) -> MirrorChanges:
         "Using the _repositories endpoint, download all RPM headers into destdir."
         logger.info(f'Mirroring {prj}/{repo}/{arch}')
         pkglistxml = http_GET(makeurl(self.apiurl, ['build', prj, repo, arch, '_repository'],
@@ -81,36 +115,129 @@ class RepoMirror:
                 hdrmd5 = binary.get('hdrmd5')
                 remotebins[f'{hdrmd5}-{name}'] = name[:-4]
 
-        to_delete: list[str] = []
-        for filename in os.listdir(destdir):
-            if not filename.endswith('.rpm'):
-                continue
+        store = HeaderStore(destdir) if self.packed else None
+        if store is not None:
+            self._import_files(destdir, remotebins, store)
+            local = [f'{hdrmd5}-{store.entries[hdrmd5].filename}' for hdrmd5 in store]
+        else:
+            local = [filename for filename in os.listdir(destdir) if filename.endswith('.rpm')]
 
+        to_delete: list[str] = []
+        for filename in local:
             if filename in remotebins:
                 del remotebins[filename]  # Already downloaded
             else:
-                to_delete.append(os.path.join(destdir, filename))
+                to_delete.append(filename)
 
         if to_delete:
             logger.info(f'Deleting {len(to_delete)} old packages')
-            for path in to_delete:
-                os.unlink(path)
+            for filename in to_delete:
+                if store is not None:
+                    store.remove(filename[:32])
+                else:
+                    os.unlink(os.path.join(destdir, filename))
+
+        changes = MirrorChanges([filename[:32] for filename in remotebins],
+                                [filename[:32] for filename in to_delete])
+        remotebins = self._resume(destdir, remotebins, store)
 
         if remotebins:
             logger.info(f'Downloading {len(remotebins)} new packages')
-            binaries = remotebins.values()
+            self._download(destdir, prj, repo, arch, list(remotebins.values()), store)
+
+        if store is not None and store.needs_compaction():
+            store.compact()
+
+        return changes
+
+    def _import_files(self, destdir: str, remotebins: Dict[str, str], store: HeaderStore) -> None:
+        "Seed store from headers mirrored as individual files by a non-packed RepoMirror sharing destdir."
+        for filename in os.listdir(destdir):
+            if filename.endswith('.rpm') and filename in remotebins and filename[:32] not in store:
+                with open(os.path.join(destdir, filename), 'rb') as f:
+                    store.add(filename[:32], filename[33:-4], f.read())
+
+    def _resume(self, destdir: str, remotebins: Dict[str, str], store: Optional[HeaderStore] = None) -> Dict[str, str]:
+        "Extract batch packs left behind by an interrupted mirror and drop them from remotebins."
+        resumed = False
+        for filename in os.listdir(destdir):
+            path = os.path.join(destdir, filename)
+            if filename.endswith('.part'):
+                # Incomplete download or header.
+                os.unlink(path)
+            elif filename.startswith('.batch-') and filename.endswith('.cpio'):
+                logger.info(f'Resuming from {filename}')
+                with open(path, 'rb') as pack:
+                    self.extract_cpio_stream(destdir, pack, set(remotebins), store)
+                os.unlink(path)
+                resumed = True
+
+        if not resumed:
+            return remotebins
+
+        if store is not None:
+            return {filename: name for filename, name in remotebins.items() if filename[:32] not in store}
+
+        return {filename: name for filename, name in remotebins.items()
+                if not os.path.exists(os.path.join(destdir, filename))}
+
+    def _download(self, destdir: str, prj: str, repo: str, arch: str, binaries: List[str],
+                  store: Optional[HeaderStore] = None) -> None:
+        "Download binaries in batches using a pool of self.workers and report the throughput."
+        start = time.monotonic()
+        offset = 0
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            futures = {}
+            while offset < len(binaries) or futures:
+                while offset < len(binaries) and len(futures) < self.workers:
+                    batch = binaries[offset:offset + self.batch_size]
+                    offset += len(batch)
+                    futures[executor.submit(self._download_batch, destdir, prj, repo, arch, batch, store)] = len(batch)
+
+                done, _ = wait(futures, return_when=FIRST_COMPLETED)
+                for future in done:
+                    self._batch_size_adapt(futures.pop(future), future.result())
 
-            # Download in batches of 50
-            for chunk in range(0, len(binaries), 50):
-                query = 'view=cpioheaders'
-                for binary in itertools.islice(binaries, chunk, chunk + 50):
-                    query += '&binary=' + quote_plus(binary)
+        elapsed = time.monotonic() - start
+        logger.info(f'Downloaded {len(binaries)} headers in {elapsed:.1f}s '
+                    f'({len(binaries) / max(elapsed, 0.001):.1f} headers/s)')
 
-                req = http_GET(makeurl(self.apiurl, ['build', prj, repo, arch, '_repository'],
-                                       query=query))
-                self.extract_cpio_stream(destdir, req)
+    def _download_batch(self, destdir: str, prj: str, repo: str, arch: str, batch: List[str],
+                        store: Optional[HeaderStore] = None) -> float:
+        """
+        Download the headers of batch into a pack file which is extracted once complete.
+        Returns the time taken in seconds.
+        """
+        start = time.monotonic()
+        query = 'view=cpioheaders'
+        for binary in batch:
+            query += '&binary=' + quote_plus(binary)
+
+        path = os.path.join(destdir, f'.batch-{uuid.uuid4().hex}.cpio')
+        req = http_GET(makeurl(self.apiurl, ['build', prj, repo, arch, '_repository'],
+                               query=query))
+        with open(path + '.part', 'wb') as pack:
+            shutil.copyfileobj(req, pack)
+        os.rename(path + '.part', path)
+
+        with open(path, 'rb') as pack:
+            self.extract_cpio_stream(destdir, pack, store=store)
+        os.unlink(path)
 
-    def mirror(self, destdir: str, prj: str, repo: str, arch: str) -> None:
+        return time.monotonic() - start
+
+    def _batch_size_adapt(self, size: int, seconds: float) -> None:
+        "Grow or shrink the batch size towards BATCH_SECONDS per batch."
+        if size < self.batch_size:
+            # Final partial batch says nothing about the server.
+            return
+
+        if seconds < self.BATCH_SECONDS / 2:
+            self.batch_size = min(self.batch_size * 2, self.BATCH_SIZE_MAX)
+        elif seconds > self.BATCH_SECONDS * 2:
+            self.batch_size = max(self.batch_size // 2, self.BATCH_SIZE_MIN)
+
+    def mirror(self, destdir: str, prj: str, repo: str, arch: str) -> MirrorChanges:
         "Creates destdir and locks destdir/.lock before mirroring."
         os.makedirs(destdir, exist_ok=True)
 
@@ -126,9 +253,16 @@ class RepoMirror:
 
 
 if __name__ == '__main__':
-    if len(sys.argv) != 6:
-        print("Usage: repomirror.py apiurl destdir prj repo arch")
-    else:
-        osc.conf.get_config()
-        rm = RepoMirror(sys.argv[1])
-        rm.mirror(sys.argv[2], sys.argv[3], sys.argv[4], sys.argv[5])
+    parser = argparse.ArgumentParser(description='Mirror RPM headers of a repository on OBS')
+    parser.add_argument('--workers', type=int, default=1, help='number of batches to download at once')
+    parser.add_argument('apiurl')
+    parser.add_argument('destdir')
+    parser.add_argument('prj')
+    parser.add_argument('repo')
+    parser.add_argument('arch')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    osc.conf.get_config()
+    rm = RepoMirror(args.apiurl, workers=args.workers)
+    rm.mirror(args.destdir, args.prj, args.repo, args.arch)
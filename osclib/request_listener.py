@@ -0,0 +1,96 @@
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from osclib.PubSubConsumer import PubSubConsumer
+
+
+class RequestListener(PubSubConsumer):
+    """
+    Check requests as soon as events about them arrive on the AMQP bus instead
+    of polling for them.
+
+    workfunc(ids) is called with the ids of the requests changed since the
+    last call, and workfunc() to check all requests. The latter happens on
+    (re-)connecting and then every sweep_interval seconds as a safety net
+    for missed events.
+
+    workfunc is run in a separate thread, one call at a time, since a sweep
+    may take longer than the heartbeat timeout of the connection which is
+    served by the ioloop meanwhile. Events arriving in the meantime are
+    collected for the next call.
+    """
+
+    # Seconds to wait for further events after the first one to check the
+    # requests in a batch.
+    DELAY = 5
+
+    def __init__(self, amqp_prefix, logger, workfunc, sweep_interval):
+        super(RequestListener, self).__init__(amqp_prefix, logger)
+        self.amqp_prefix = amqp_prefix
+        self.workfunc = workfunc
+        self.sweep_interval = sweep_interval
+        self.sweep_next = 0
+        self.requests_to_check = set()
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.working = None
+
+    def routing_keys(self):
+        return [self.amqp_prefix + suffix for suffix in ('.obs.request.*', '.obs.review.*')]
+
+    def start_consuming(self):
+        # Events were possibly missed while not connected.
+        self.sweep_next = 0
+        super(RequestListener, self).start_consuming()
+
+    def busy(self):
+        return self.working is not None and not self.working.done()
+
+    def interval(self):
+        if len(self.requests_to_check) or self.busy():
+            return self.DELAY
+        return max(0, min(self.sweep_next - time.time(), super(RequestListener, self).interval()))
+
+    def still_alive(self):
+        if self.busy():
+            # Checked once the current call is done.
+            pass
+        elif time.time() >= self.sweep_next:
+            self.sweep_next = time.time() + self.sweep_interval
+            self.requests_to_check = set()
+            self.working = self.executor.submit(self.work)
+        elif len(self.requests_to_check):
+            ids = sorted(self.requests_to_check, key=int)
+            self.requests_to_check = set()
+            self.working = self.executor.submit(self.work, ids)
+
+        super(RequestListener, self).still_alive()
+
+    def work(self, ids=None):
+        if ids:
+            self.logger.info(f"checking requests {', '.join(ids)}")
+        else:
+            self.logger.info('checking all requests')
+
+        try:
+            self.workfunc(ids)
+        except Exception as e:
+            self.logger.exception(e)
+
+    def on_message(self, unused_channel, method, properties, body):
+        self.acknowledge_message(method.delivery_tag)
+        try:
+            body = json.loads(body)
+        except ValueError:
+            return
+
+        number = body.get('number')
+        if number is None:
+            return
+
+        self.logger.debug(f'{method.routing_key} for request {number}')
+        first = not len(self.requests_to_check)
+        self.requests_to_check.add(str(number))
+        if first:
+            # Check after DELAY instead of waiting for the next sweep.
+            self.restart_timer()
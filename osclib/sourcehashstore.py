@@ -0,0 +1,70 @@
+import os
+import sqlite3
+import threading
+
+from typing import Optional
+from urllib.parse import urlsplit
+
+from osclib.cache_manager import CacheManager
+
+
+class SourceHashStore:
+    """
+    Persistent map of (project, package, srcmd5) to the source hash of the
+    revision as computed by package_source_hash().
+
+    The unexpanded sources of a srcmd5 never change, so unlike the responses
+    kept by osclib.cache the entries never expire. Each thread opens its own
+    connection to the database. The default rollback journal is kept since
+    write-ahead logging does not work on network filesystems, so a writer
+    briefly blocks readers and concurrent writers wait for up to the timeout.
+    """
+
+    FILENAME = 'source-hash.sqlite'
+    SCHEMA = [
+        'CREATE TABLE IF NOT EXISTS source_hash ('
+        ' host TEXT NOT NULL,'
+        ' project TEXT NOT NULL,'
+        ' package TEXT NOT NULL,'
+        ' srcmd5 TEXT NOT NULL,'
+        ' source_hash TEXT NOT NULL,'
+        ' PRIMARY KEY (host, project, package, srcmd5))',
+    ]
+
+    _default = None
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.path = os.path.join(directory, self.FILENAME)
+        self.local = threading.local()
+
+    @classmethod
+    def default(cls) -> 'SourceHashStore':
+        if cls._default is None:
+            cls._default = cls(CacheManager.directory('source-hash'))
+        return cls._default
+
+    @property
+    def connection(self) -> sqlite3.Connection:
+        # A connection must neither be shared between threads nor with forked children.
+        if getattr(self.local, 'pid', None) != os.getpid():
+            os.makedirs(self.directory, exist_ok=True)
+            self.local.connection = sqlite3.connect(self.path, timeout=60, isolation_level=None)
+            for statement in self.SCHEMA:
+                self.local.connection.execute(statement)
+            self.local.pid = os.getpid()
+        return self.local.connection
+
+    @staticmethod
+    def host(apiurl: str) -> str:
+        return urlsplit(apiurl).hostname
+
+    def get(self, apiurl: str, project: str, package: str, srcmd5: str) -> Optional[str]:
+        row = self.connection.execute(
+            'SELECT source_hash FROM source_hash WHERE host = ? AND project = ? AND package = ? AND srcmd5 = ?',
+            (self.host(apiurl), project, package, srcmd5)).fetchone()
+        return row[0] if row else None
+
+    def set(self, apiurl: str, project: str, package: str, srcmd5: str, source_hash: str) -> None:
+        self.connection.execute('INSERT OR REPLACE INTO source_hash VALUES (?, ?, ?, ?, ?)',
+                                (self.host(apiurl), project, package, srcmd5, source_hash))
@@ -21,7 +21,6 @@ from osc.core import change_review_state
 from osc.core import delete_project
 from osc.core import get_commitlog
 from osc.core import get_group
-from osc.core import get_request
 from osc.core import make_meta_url
 from osc.core import makeurl
 from osc.core import http_GET
@@ -41,6 +40,9 @@ from osclib.core import entity_exists
 from osclib.core import project_pseudometa_file_load
 from osclib.core import project_pseudometa_file_save
 from osclib.core import project_pseudometa_file_ensure
+from osclib.core import request_cache_invalidate
+from osclib.core import request_get
+from osclib.core import requests_get
 from osclib.core import source_file_load
 from osclib.comments import CommentAPI
 from osclib.ignore_command import IgnoreCommand
@@ -379,7 +381,7 @@ class StagingAPI(object):
 
         message = '' if not message else message
 
-        req = get_request(self.apiurl, str(request_id))
+        req = request_get(self.apiurl, request_id)
         if not req:
             raise oscerr.WrongArgs(f'Request {request_id} not found')
 
@@ -390,12 +392,14 @@ class StagingAPI(object):
                review.state == 'new':
 
                 # call osc's function
-                return change_review_state(self.apiurl, str(request_id),
-                                           newstate,
-                                           message=message,
-                                           by_group=by_group,
-                                           by_user=by_user,
-                                           by_project=by_project)
+                result = change_review_state(self.apiurl, str(request_id),
+                                             newstate,
+                                             message=message,
+                                             by_group=by_group,
+                                             by_user=by_user,
+                                             by_project=by_project)
+                request_cache_invalidate(self.apiurl, request_id)
+                return result
 
         return False
 
@@ -456,7 +460,7 @@ class StagingAPI(object):
 
             # Ensure a request for same package is already staged.
             if stage_info and stage_info['rq_id'] != request_id:
-                request_old = get_request(self.apiurl, str(stage_info['rq_id'])).to_xml()
+                request_old = request_get(self.apiurl, stage_info['rq_id']).to_xml()
                 request_new = request
                 replace_old = request_old.find('state').get('name') in ['revoked', 'superseded', 'declined']
 
@@ -604,6 +608,22 @@ class StagingAPI(object):
                 requests.append(rq)
         return requests
 
+    def superseded_requests_prefetch(self, requests):
+        """
+        Fetch the staged requests possibly superseded by requests at once
+        instead of one by one in superseded_request().
+        """
+        request_ids = []
+        for request in requests:
+            target = request.find('action/target')
+            if target is None:
+                continue
+            stage_info = self.packages_staged.get(target.get('package'))
+            if stage_info and stage_info['rq_id'] != request.get('id'):
+                request_ids.append(stage_info['rq_id'])
+
+        requests_get(self.apiurl, request_ids)
+
     def dispatch_open_requests(self, target_requests=None):
         """
         Verify all requests and dispatch them to staging projects or
@@ -617,6 +637,7 @@ class StagingAPI(object):
         # get all current pending requests
         self._supersede = True
         requests = self.get_open_requests()
+        self.superseded_requests_prefetch(requests)
         # check if we can reduce it down by accepting some
         for rq in requests:
             stage_info, code = self.update_superseded_request(rq, target_requests)
@@ -689,7 +710,9 @@ class StagingAPI(object):
         requestxml = f"<requests><request id='{request}'/></requests>"
         u = makeurl(self.apiurl, ['staging', project,
                                   'staging_projects', stage, 'staged_requests'])
-        return http_DELETE(u, data=requestxml)
+        result = http_DELETE(u, data=requestxml)
+        request_cache_invalidate(self.apiurl, request)
+        return result
 
     def is_package_disabled(self, project, package, store=False):
         meta = show_package_meta(self.apiurl, project, package)
@@ -903,7 +926,7 @@ class StagingAPI(object):
         # read info from sr
         act_type = None
 
-        req = get_request(self.apiurl, str(request_id))
+        req = request_get(self.apiurl, request_id)
         if not req:
             raise oscerr.WrongArgs(f'Request {request_id} not found')
 
@@ -926,6 +949,7 @@ class StagingAPI(object):
             opts['remove_exclusion'] = 1
         u = makeurl(self.apiurl, ['staging', self.project, 'staging_projects', project, 'staged_requests'], opts)
         http_POST(u, data=requestxml)
+        request_cache_invalidate(self.apiurl, request_id)
 
         if act_type == 'delete':
             self.delete_to_prj(act[0], project)
@@ -1110,7 +1134,7 @@ class StagingAPI(object):
         :param request_id: request to add review to
         :param project: project to assign review to
         """
-        req = get_request(self.apiurl, str(request_id))
+        req = request_get(self.apiurl, request_id)
         if not req:
             raise oscerr.WrongArgs(f'Request {request_id} not found')
         for i in req.reviews:
@@ -1138,6 +1162,7 @@ class StagingAPI(object):
         query['cmd'] = 'addreview'
         url = self.makeurl(['request', str(request_id)], query)
         http_POST(url, data=msg)
+        request_cache_invalidate(self.apiurl, request_id)
 
     def get_flag_in_prj(self, project, flag='build', repository=None, arch=None):
         """Return the flag value in a project."""
@@ -0,0 +1,412 @@
+import fcntl
+import json
+import logging
+import os
+import re
+import sqlite3
+import stat
+import struct
+
+from contextlib import contextmanager
+
+from typing import BinaryIO, Callable, Dict, Iterator, List, Optional, Set, Tuple
+
+logger = logging.getLogger('Susetags')
+
+LEAD_MAGIC = b'\xed\xab\xee\xdb'
+LEAD_SIZE = 96
+HEADER_MAGIC = b'\x8e\xad\xe8\x01'
+HEADER_INTRO = struct.Struct('>4s4xII')
+HEADER_ENTRY = struct.Struct('>IIiI')
+
+RPMTAG_NAME = 1000
+RPMTAG_VERSION = 1001
+RPMTAG_RELEASE = 1002
+RPMTAG_ARCH = 1022
+RPMTAG_FILEMODES = 1030
+RPMTAG_FILELINKTOS = 1036
+RPMTAG_FILEFLAGS = 1037
+RPMTAG_FILEUSERNAME = 1039
+RPMTAG_FILEGROUPNAME = 1040
+RPMTAG_SOURCERPM = 1044
+RPMTAG_PROVIDENAME = 1047
+RPMTAG_REQUIREFLAGS = 1048
+RPMTAG_REQUIRENAME = 1049
+RPMTAG_REQUIREVERSION = 1050
+RPMTAG_CONFLICTFLAGS = 1053
+RPMTAG_CONFLICTNAME = 1054
+RPMTAG_CONFLICTVERSION = 1055
+RPMTAG_OBSOLETENAME = 1090
+RPMTAG_PROVIDEFLAGS = 1112
+RPMTAG_PROVIDEVERSION = 1113
+RPMTAG_OBSOLETEFLAGS = 1114
+RPMTAG_OBSOLETEVERSION = 1115
+RPMTAG_DIRINDEXES = 1116
+RPMTAG_BASENAMES = 1117
+RPMTAG_DIRNAMES = 1118
+RPMTAG_DISTURL = 1123
+RPMTAG_RECOMMENDNAME = 5046
+RPMTAG_RECOMMENDVERSION = 5047
+RPMTAG_RECOMMENDFLAGS = 5048
+RPMTAG_SUGGESTNAME = 5049
+RPMTAG_SUGGESTVERSION = 5050
+RPMTAG_SUGGESTFLAGS = 5051
+RPMTAG_SUPPLEMENTNAME = 5052
+RPMTAG_SUPPLEMENTVERSION = 5053
+RPMTAG_SUPPLEMENTFLAGS = 5054
+RPMTAG_ENHANCENAME = 5055
+RPMTAG_ENHANCEVERSION = 5056
+RPMTAG_ENHANCEFLAGS = 5057
+
+# Dependency name, flags and version tags of the susetags sections.
+DEPENDENCIES = {
+    'Prv': (RPMTAG_PROVIDENAME, RPMTAG_PROVIDEFLAGS, RPMTAG_PROVIDEVERSION),
+    'Con': (RPMTAG_CONFLICTNAME, RPMTAG_CONFLICTFLAGS, RPMTAG_CONFLICTVERSION),
+    'Req': (RPMTAG_REQUIRENAME, RPMTAG_REQUIREFLAGS, RPMTAG_REQUIREVERSION),
+    'Obs': (RPMTAG_OBSOLETENAME, RPMTAG_OBSOLETEFLAGS, RPMTAG_OBSOLETEVERSION),
+    'Rec': (RPMTAG_RECOMMENDNAME, RPMTAG_RECOMMENDFLAGS, RPMTAG_RECOMMENDVERSION),
+    'Sup': (RPMTAG_SUPPLEMENTNAME, RPMTAG_SUPPLEMENTFLAGS, RPMTAG_SUPPLEMENTVERSION),
+    'Enh': (RPMTAG_ENHANCENAME, RPMTAG_ENHANCEFLAGS, RPMTAG_ENHANCEVERSION),
+    'Sug': (RPMTAG_SUGGESTNAME, RPMTAG_SUGGESTFLAGS, RPMTAG_SUGGESTVERSION),
+}
+
+SOURCERPM_RE = re.compile(r'^(.*)-([^-]*)-([^-]*)\.(src|nosrc)\.rpm')
+HDRMD5_RE = re.compile(r'^[a-z0-9]{32}-')
+
+
+class CorruptHeader(Exception):
+    pass
+
+
+def rpm_header(data: bytes) -> Dict[int, list]:
+    """
+    Parse the tags of an RPM header. Accepts complete RPMs as well as the bare
+    headers mirrored by RepoMirror. Strings are decoded with surrogateescape
+    so that they are written back unchanged.
+    """
+    offset = 0
+    if data[:4] == LEAD_MAGIC:
+        # Skip the lead and the signature header, which is padded to 8 bytes.
+        magic, nindex, hsize = HEADER_INTRO.unpack_from(data, LEAD_SIZE)
+        offset = LEAD_SIZE + HEADER_INTRO.size + nindex * HEADER_ENTRY.size + hsize
+        offset += (8 - offset % 8) % 8
+
+    magic, nindex, hsize = HEADER_INTRO.unpack_from(data, offset)
+    if magic != HEADER_MAGIC:
+        raise ValueError('bad header magic')
+
+    index = offset + HEADER_INTRO.size
+    store = index + nindex * HEADER_ENTRY.size
+    if store + hsize > len(data):
+        raise ValueError('truncated header')
+
+    def strings(start, count):
+        values = data[start:store + hsize].split(b'\0', count)[:count]
+        return [value.decode('utf-8', 'surrogateescape') for value in values]
+
+    tags = {}
+    for i in range(nindex):
+        tag, kind, start, count = HEADER_ENTRY.unpack_from(data, index + i * HEADER_ENTRY.size)
+        start += store
+        if kind == 3:
+            tags[tag] = list(struct.unpack_from(f'>{count}H', data, start))
+        elif kind == 4:
+            tags[tag] = list(struct.unpack_from(f'>{count}I', data, start))
+        elif kind == 6:
+            tags[tag] = strings(start, 1)
+        elif kind in (8, 9):
+            tags[tag] = strings(start, count)
+    return tags
+
+
+def _dependencies(tags: Dict[int, list], name: int, flags: int, version: int) -> List[str]:
+    "Combine the dependency names with their flags and versions like Build::Rpm::add_flagsvers()."
+    dependencies = []
+    flags = tags.get(flags, [])
+    versions = tags.get(version, [])
+    for i, dependency in enumerate(tags.get(name, [])):
+        if i < len(flags) and flags[i] & 0xe and i < len(versions):
+            op = ''
+            op += '<' if flags[i] & 2 else ''
+            op += '>' if flags[i] & 4 else ''
+            op += '=' if flags[i] & 8 else ''
+            dependency = f'{dependency} {op} {versions[i]}'
+        dependencies.append(dependency)
+    return dependencies
+
+
+def package_snippet(data: bytes) -> Tuple[str, str]:
+    """
+    Return the source name and the susetags snippet describing the package with
+    the given header in the format of CreatePackageDescr::package_snippet().
+    """
+    try:
+        tags = rpm_header(data)
+    except (ValueError, struct.error) as e:
+        raise CorruptHeader(str(e))
+    if not tags.get(RPMTAG_NAME):
+        raise CorruptHeader('missing name')
+
+    name = tags[RPMTAG_NAME][0]
+    arch = tags.get(RPMTAG_ARCH, [''])[0]
+    # some packages are more equal than others
+    if arch == 'i686':
+        arch = 'i586'
+    out = [f"=Pkg: {name} {tags.get(RPMTAG_VERSION, [''])[0]} {tags.get(RPMTAG_RELEASE, [''])[0]} {arch}"]
+    out.append('+Flx:')
+
+    # e.g. libqt5-qttools-5.12.3-1.2.src.rpm
+    source = ['', '', '']
+    match = SOURCERPM_RE.match(tags.get(RPMTAG_SOURCERPM, [''])[0])
+    if match:
+        source = list(match.group(1, 2, 3))
+    # overwrite the source with the disturl, in case of multibuild and co
+    # e.g. obs://build.opensuse.org/openSUSE:Factory/standard/e71360fe635636b65ef2244eb123fc7f-libqt5-qttools
+    if tags.get(RPMTAG_DISTURL):
+        source[0] = re.sub(r'^[^-]*-', '', os.path.basename(tags[RPMTAG_DISTURL][0]))
+    # listed after +Flx: like CreatePackageDescr::package_snippet() always did
+    out.append(f'=Src: {source[0]} {source[1]} {source[2]} src')
+
+    xprvs = []
+    modes = tags.get(RPMTAG_FILEMODES, [])
+    flags = tags.get(RPMTAG_FILEFLAGS, [])
+    users = tags.get(RPMTAG_FILEUSERNAME, [])
+    groups = tags.get(RPMTAG_FILEGROUPNAME, [])
+    linktos = tags.get(RPMTAG_FILELINKTOS, [])
+    dirnames = tags.get(RPMTAG_DIRNAMES, [])
+    dirindexes = tags.get(RPMTAG_DIRINDEXES, [])
+    for i, basename in enumerate(tags.get(RPMTAG_BASENAMES, [])):
+        filename = dirnames[dirindexes[i]] + basename
+        fs = filename
+        if stat.S_ISLNK(modes[i]):
+            fs = f'{filename} -> {linktos[i]}'
+        out.append(f'{modes[i]:o} {flags[i]:o} {users[i]}:{groups[i]} {fs}')
+        if filename.startswith('/etc/') or 'bin/' in filename or filename == '/usr/lib/sendmail':
+            xprvs.append(filename)
+    out.append('-Flx:')
+
+    for section, (name_tag, flags_tag, version_tag) in DEPENDENCIES.items():
+        out.append(f'+{section}:')
+        for dependency in _dependencies(tags, name_tag, flags_tag, version_tag):
+            if section == 'Req':
+                if dependency == 'this-is-only-for-build-envs':
+                    continue
+                # Completely disgusting, but maintainers have no interest in fixing,
+                # see #1153 for more details.
+                if re.match('^installation-images-debuginfodeps', name) and re.search('debuginfo.build', dependency):
+                    continue
+            elif section == 'Rec' and dependency.startswith('('):
+                # ignore boolean dependencies
+                continue
+            out.append(dependency)
+        if section == 'Prv':
+            out.extend(xprvs)
+        out.append(f'-{section}:')
+
+    return source[0], '\n'.join(out) + '\n'
+
+
+class SnippetCache:
+    """
+    Susetags snippets of the headers mirrored into a directory, kept in a single
+    SQLite database in the directory and keyed by hdrmd5. Snippets are only
+    generated for headers not seen before and are dropped with their header.
+    Headers served are marked as used so they are not pruned from the cache.
+    """
+
+    FILENAME = '.susetags.sqlite'
+    # Bump to regenerate all snippets when package_snippet() changes.
+    VERSION = 2
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        # The default rollback journal is kept since the directory may be on
+        # a network filesystem, where write-ahead logging does not work.
+        self.connection = sqlite3.connect(os.path.join(directory, self.FILENAME), timeout=60)
+        if self.connection.execute('PRAGMA user_version').fetchone()[0] != self.VERSION:
+            with self.connection:
+                self.connection.execute('DROP TABLE IF EXISTS snippets')
+                self.connection.execute(f'PRAGMA user_version = {self.VERSION}')
+        self.connection.execute('CREATE TABLE IF NOT EXISTS snippets ('
+                                ' key TEXT PRIMARY KEY,'
+                                ' source TEXT NOT NULL,'
+                                ' snippet BLOB NOT NULL)')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.connection.close()
+
+    @staticmethod
+    def package_name(filename: str) -> Tuple[str, str]:
+        "Return the cache key and package name of a mirrored header file."
+        if HDRMD5_RE.match(filename):  # repo cache
+            return filename[:32], filename[33:-4]
+        return filename, re.sub(r'^(.*)-[^-]+-[^-]+.rpm', r'\1', filename)
+
+    def update(self, filenames: List[str]) -> None:
+        "Generate the snippets missing for filenames and drop those of headers gone."
+        keys = {self.package_name(filename)[0]: filename for filename in filenames}
+        known = {row[0] for row in self.connection.execute('SELECT key FROM snippets')}
+
+        with self.connection:
+            for key in keys.keys() - known:
+                path = os.path.join(self.directory, keys[key])
+                with open(path, 'rb') as f:
+                    data = f.read()
+                try:
+                    source, snippet = package_snippet(data)
+                except CorruptHeader as e:
+                    logger.error(f'corrupt rpm: {path}: {e}')
+                    # Needs to be re-mirrored.
+                    os.unlink(path)
+                    raise
+                snippet = snippet.encode('utf-8', 'surrogateescape')
+                self.connection.execute('INSERT OR REPLACE INTO snippets VALUES (?, ?, ?)', (key, source, snippet))
+
+            stale = known - keys.keys()
+            if stale:
+                self.connection.executemany('DELETE FROM snippets WHERE key = ?', ((key,) for key in stale))
+
+        logger.debug(f'{self.directory}: generated {len(keys.keys() - known)} and dropped {len(stale)} snippets')
+
+    def snippets(self) -> Iterator[Tuple[str, str, bytes]]:
+        "Yield the package name, source and snippet of each header in the directory."
+        filenames = sorted(filename for filename in os.listdir(self.directory) if filename.endswith('.rpm'))
+        self.update(filenames)
+        for filename in filenames:
+            # mark as used
+            os.utime(os.path.join(self.directory, filename))
+            key, name = self.package_name(filename)
+            row = self.connection.execute('SELECT source, snippet FROM snippets WHERE key = ?', (key,)).fetchone()
+            yield name, row[0], row[1]
+
+
+def packages(directories: List[str]) -> Iterator[Tuple[str, str, str, bytes]]:
+    """
+    Yield the directory, package name, source and snippet of the headers mirrored
+    in directories. A package name is only taken from the first directory
+    containing it. Paths which are not directories, like the primary.xml of
+    download on demand repositories, are skipped.
+    """
+    written = set()
+    for directory in directories:
+        if not os.path.isdir(directory):
+            continue
+        with SnippetCache(directory) as cache:
+            for name, source, snippet in cache.snippets():
+                if name in written:
+                    continue
+                written.add(name)
+                yield directory, name, source or 'unknown', snippet
+
+
+def write_packages(output_directory: str, directories: List[str], base: Optional['PackagesBase'] = None) \
+        -> Dict[str, Dict[str, str]]:
+    """
+    Write the susetags packages file of the headers mirrored in directories to
+    output_directory, like write_repo_susetags_file.pl. The packages of base not
+    found in directories are added after them. Returns the catalog mapping each
+    directory to the names of the packages taken from it and their source.
+    """
+    catalog = {}
+    with open(os.path.join(output_directory, 'packages'), 'wb') as output:
+        output.write(b'=Ver: 2.0\n')
+        for directory, name, source, snippet in packages(directories):
+            catalog.setdefault(directory, {})[name] = source
+            output.write(snippet)
+
+        if base is not None:
+            written = set()
+            for names in catalog.values():
+                written.update(names)
+            base.write(output, written, catalog)
+
+    return catalog
+
+
+class PackagesBase:
+    """
+    Susetags packages of a set of mirrored directories written once and layered
+    below the packages of other directories by write_packages(). Used for the
+    target project repositories which are the same for the checks of all
+    stagings. The packages file is accompanied by an index of the offset of each
+    package so that the packages shadowed by a staging can be skipped.
+    """
+
+    PACKAGES = 'packages'
+    INDEX = 'packages.json'
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        # directory, name, source, offset and length of each package.
+        self.entries: List[Tuple[str, str, str, int, int]] = []
+
+    @property
+    def packages_path(self) -> str:
+        return os.path.join(self.directory, self.PACKAGES)
+
+    @property
+    def index_path(self) -> str:
+        return os.path.join(self.directory, self.INDEX)
+
+    def load_or_build(self, directories: Callable[[], List[str]]) -> 'PackagesBase':
+        """
+        Load the base or build it from the directories returned by calling
+        directories, which allows to skip mirroring them when already built.
+        """
+        with self.lock():
+            if os.path.exists(self.index_path):
+                with open(self.index_path) as f:
+                    self.entries = [tuple(entry) for entry in json.load(f)]
+                logger.debug(f'using {self.directory} with {len(self.entries)} packages')
+            else:
+                self.build(directories())
+
+        return self
+
+    @contextmanager
+    def lock(self):
+        "Serialize the processes building the base or artifacts derived from it."
+        os.makedirs(self.directory, exist_ok=True)
+        with open(os.path.join(self.directory, '.lock'), 'w') as lockfile:
+            fcntl.flock(lockfile, fcntl.LOCK_EX)
+            yield
+
+    def build(self, directories: List[str]) -> None:
+        self.entries = []
+        with open(self.packages_path + '.tmp', 'wb') as output:
+            for directory, name, source, snippet in packages(directories):
+                self.entries.append((directory, name, source, output.tell(), len(snippet)))
+                output.write(snippet)
+        os.rename(self.packages_path + '.tmp', self.packages_path)
+
+        # The index is written last since its presence marks the base complete.
+        with open(self.index_path + '.tmp', 'w') as f:
+            json.dump(self.entries, f)
+        os.rename(self.index_path + '.tmp', self.index_path)
+        logger.debug(f'built {self.directory} with {len(self.entries)} packages')
+
+    def write(self, output: BinaryIO, exclude: Set[str], catalog: Dict[str, Dict[str, str]]) -> None:
+        "Copy the packages not named in exclude to output and add them to catalog."
+        with open(self.packages_path, 'rb') as base:
+            start = end = 0
+            for directory, name, source, offset, length in self.entries:
+                if name in exclude:
+                    continue
+                catalog.setdefault(directory, {})[name] = source
+                if offset != end:
+                    # Copy the run of packages before the skipped ones at once.
+                    self._copy(base, output, start, end)
+                    start = offset
+                end = offset + length
+            self._copy(base, output, start, end)
+
+    @staticmethod
+    def _copy(base: BinaryIO, output: BinaryIO, start: int, end: int) -> None:
+        base.seek(start)
+        while start < end:
+            chunk = base.read(min(end - start, 1024 * 1024))
+            output.write(chunk)
+            start += len(chunk)
@@ -1,7 +1,7 @@
 import dateutil.parser
 from datetime import datetime
 
-from osc.core import get_request
+from osclib.core import requests_get
 from osclib.comments import CommentAPI
 from osclib.request_finder import RequestFinder
 
@@ -32,8 +32,8 @@ class UnignoreCommand(object):
 
         if cleanup:
             now = datetime.now()
-            for request_id in set(requests_ignored):
-                request = get_request(self.api.apiurl, str(request_id))
+            for request in requests_get(self.api.apiurl, set(requests_ignored)):
+                request_id = int(request.reqid)
                 if request.state.name not in ('new', 'review'):
                     changed = dateutil.parser.parse(request.state.when)
                     diff = now - changed
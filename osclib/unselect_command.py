@@ -1,5 +1,5 @@
 from osc import conf
-from osc.core import get_request
+from osclib.core import request_get
 from osclib.comments import CommentAPI
 from osclib.request_finder import RequestFinder
 
@@ -56,7 +56,7 @@ class UnselectCommand(object):
             print(f'Unselecting "{request}" from "{staging_project}"')
             self.api.rm_from_prj(staging_project, request_id=request)
 
-            req = get_request(self.api.apiurl, str(request))
+            req = request_get(self.api.apiurl, request)
             if message:
                 self.api.add_ignored_request(request, message)
                 self.comment.add_comment(request_id=str(request), comment=message)
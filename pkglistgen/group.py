@@ -122,121 +122,25 @@ class Group(object):
         """ base: list of base groups or None """
 
         solved = dict()
-        for arch in self.pkglist.filtered_architectures:
-            solved[arch] = dict()
-
         self.srcpkgs = dict()
         self.recommends = dict()
         self.suggested = dict()
-        for arch in self.pkglist.filtered_architectures:
-            pool = self.pkglist.prepare_pool(arch, False)
-            solver = pool.Solver()
-            solver.set_flag(solver.SOLVER_FLAG_IGNORE_RECOMMENDED, not use_recommends)
-            solver.set_flag(solver.SOLVER_FLAG_ADD_ALREADY_RECOMMENDED, use_recommends)
-
-            # pool.set_debuglevel(10)
-            suggested = dict()
-
-            # packages resulting from explicit recommended expansion
-            extra = []
-
-            def solve_one_package(n, group):
-                jobs = list(self.pkglist.lockjobs[arch])
-                sel = pool.select(str(n), solv.Selection.SELECTION_NAME)
-                if sel.isempty():
-                    self.logger.debug(f'{self.name}.{arch}: package {n} not found')
-                    self.not_found.setdefault(n, set()).add(arch)
-                    return
-                else:
-                    if n in self.expand_recommended:
-                        for s in sel.solvables():
-                            for dep in s.lookup_deparray(solv.SOLVABLE_RECOMMENDS):
-                                # only add recommends that exist as packages
-                                rec = pool.select(dep.str(), solv.Selection.SELECTION_NAME)
-                                if not rec.isempty():
-                                    extra.append([dep.str(), f"{group}:recommended:{n}"])
-
-                    jobs += sel.jobs(solv.Job.SOLVER_INSTALL)
-
-                locked = self.locked | self.pkglist.unwanted
-                for lock in locked:
-                    sel = pool.select(str(lock), solv.Selection.SELECTION_NAME)
-                    # if we can't find it, it probably is not as important
-                    if not sel.isempty():
-                        jobs += sel.jobs(solv.Job.SOLVER_LOCK)
-
-                for s in self.silents:
-                    sel = pool.select(str(s), solv.Selection.SELECTION_NAME | solv.Selection.SELECTION_FLAT)
-                    if sel.isempty():
-                        self.logger.warning(f'{self.name}.{arch}: silent package {s} not found')
-                    else:
-                        jobs += sel.jobs(solv.Job.SOLVER_INSTALL)
-
-                problems = solver.solve(jobs)
-                if problems:
-                    for problem in problems:
-                        msg = f'unresolvable: {self.name}:{n}.{arch}: {problem}'
-                        self.logger.debug(msg)
-                        self.unresolvable[arch][n] = str(problem)
-                    return
-
-                for s in solver.get_recommended():
-                    if s.name in locked:
-                        continue
-                    self.recommends.setdefault(s.name, f"{group}:{n}")
-                if n in self.expand_suggested:
-                    for s in solver.get_suggested():
-                        suggested[s.name] = f"{group}:suggested:{n}"
-                        self.suggested.setdefault(s.name, suggested[s.name])
-
-                trans = solver.transaction()
-                if trans.isempty():
-                    self.logger.error('%s.%s: nothing to do', self.name, arch)
-                    return
-
-                for s in trans.newsolvables():
-                    solved[arch].setdefault(s.name, f"{group}:{n}")
-                    if None:
-                        reason, rule = solver.describe_decision(s)
-                        print(self.name, s.name, reason, rule.info().problemstr())
-                    # don't ask me why, but that's how it seems to work
-                    if s.lookup_void(solv.SOLVABLE_SOURCENAME):
-                        src = s.name
-                    else:
-                        src = s.lookup_str(solv.SOLVABLE_SOURCENAME)
-                    self.srcpkgs[src] = f"{group}:{s.name}"
-
-            start = time.time()
-            for n, group in self.packages[arch]:
-                solve_one_package(n, group)
-
-            # resetup the pool with ignored conflicts to get supplements from the list
-            pool = self.pkglist.prepare_pool(arch, True)
-            solver = pool.Solver()
-            solver.set_flag(solver.SOLVER_FLAG_IGNORE_RECOMMENDED, not use_recommends)
-            solver.set_flag(solver.SOLVER_FLAG_ADD_ALREADY_RECOMMENDED, use_recommends)
-
-            jobs = list(self.pkglist.lockjobs[arch])
-            locked = self.locked | self.pkglist.unwanted
-            for lock in locked:
-                sel = pool.select(str(lock), solv.Selection.SELECTION_NAME)
-                # if we can't find it, it probably is not as important
-                if not sel.isempty():
-                    jobs += sel.jobs(solv.Job.SOLVER_LOCK)
-
-            for n in list(solved[arch]) + list(suggested):
-                if n in locked:
-                    continue
-                sel = pool.select(str(n), solv.Selection.SELECTION_NAME)
-                jobs += sel.jobs(solv.Job.SOLVER_INSTALL)
-
-            solver.solve(jobs)
-            trans = solver.transaction()
-            for s in trans.newsolvables():
-                solved[arch].setdefault(s.name, f"{group}:expansion")
 
-            end = time.time()
-            self.logger.info('%s - solving took %f', self.name, end - start)
+        # Merge in architecture order so that the first reason recorded is the
+        # same no matter if the architectures were solved in parallel.
+        results = self.pkglist.solve_architectures(self, use_recommends)
+        for arch in self.pkglist.filtered_architectures:
+            result = results[arch]
+            solved[arch] = result['solved']
+            for n in result['not_found']:
+                self.not_found.setdefault(n, set()).add(arch)
+            self.unresolvable[arch].update(result['unresolvable'])
+            for name, reason in result['recommends']:
+                self.recommends.setdefault(name, reason)
+            for name, reason in result['suggested']:
+                self.suggested.setdefault(name, reason)
+            for src, reason in result['srcpkgs']:
+                self.srcpkgs[src] = reason
 
         common = None
         # compute common packages across all architectures
@@ -258,6 +162,231 @@ class Group(object):
         self.solved_packages = solved
         self.solved = True
 
+    def solve_arch(self, arch, use_recommends=False):
+        """
+        Solve the group for a single architecture.
+
+        Only reads the group and pool, the outcome is returned as plain data
+        which solve() merges so that it can be run in a worker process.
+        """
+        solved = dict()
+        result = {
+            'solved': solved,
+            'not_found': [],
+            'unresolvable': dict(),
+            'recommends': [],
+            'suggested': [],
+            'srcpkgs': [],
+        }
+
+        pool = self.pkglist.prepare_pool(arch, False)
+        solver = pool.Solver()
+        solver.set_flag(solver.SOLVER_FLAG_IGNORE_RECOMMENDED, not use_recommends)
+        solver.set_flag(solver.SOLVER_FLAG_ADD_ALREADY_RECOMMENDED, use_recommends)
+
+        # pool.set_debuglevel(10)
+        suggested = dict()
+
+        # packages resulting from explicit recommended expansion
+        extra = []
+
+        # The locks and silents do not depend on the package being solved.
+        locked = self.locked | self.pkglist.unwanted
+        lock_jobs = []
+        for lock in locked:
+            sel = pool.select(str(lock), solv.Selection.SELECTION_NAME)
+            # if we can't find it, it probably is not as important
+            if not sel.isempty():
+                lock_jobs += sel.jobs(solv.Job.SOLVER_LOCK)
+
+        silent_jobs = []
+        for s in self.silents:
+            sel = pool.select(str(s), solv.Selection.SELECTION_NAME | solv.Selection.SELECTION_FLAT)
+            if sel.isempty():
+                self.logger.warning(f'{self.name}.{arch}: silent package {s} not found')
+            else:
+                silent_jobs += sel.jobs(solv.Job.SOLVER_INSTALL)
+
+        def select_package(n, group):
+            sel = pool.select(str(n), solv.Selection.SELECTION_NAME)
+            if sel.isempty():
+                self.logger.debug(f'{self.name}.{arch}: package {n} not found')
+                result['not_found'].append(n)
+                return None
+
+            if n in self.expand_recommended:
+                for s in sel.solvables():
+                    for dep in s.lookup_deparray(solv.SOLVABLE_RECOMMENDS):
+                        # only add recommends that exist as packages
+                        rec = pool.select(dep.str(), solv.Selection.SELECTION_NAME)
+                        if not rec.isempty():
+                            extra.append([dep.str(), f"{group}:recommended:{n}"])
+
+            return sel.jobs(solv.Job.SOLVER_INSTALL)
+
+        def add_solvable(s, group, reason):
+            solved.setdefault(s.name, reason)
+            if None:
+                reason, rule = solver.describe_decision(s)
+                print(self.name, s.name, reason, rule.info().problemstr())
+            # don't ask me why, but that's how it seems to work
+            if s.lookup_void(solv.SOLVABLE_SOURCENAME):
+                src = s.name
+            else:
+                src = s.lookup_str(solv.SOLVABLE_SOURCENAME)
+            result['srcpkgs'].append((src, f"{group}:{s.name}"))
+
+        def solve_one_package(n, group, install_jobs):
+            jobs = list(self.pkglist.lockjobs[arch]) + install_jobs + lock_jobs + silent_jobs
+
+            problems = solver.solve(jobs)
+            if problems:
+                for problem in problems:
+                    msg = f'unresolvable: {self.name}:{n}.{arch}: {problem}'
+                    self.logger.debug(msg)
+                    result['unresolvable'][n] = str(problem)
+                return
+
+            for s in solver.get_recommended():
+                if s.name in locked:
+                    continue
+                result['recommends'].append((s.name, f"{group}:{n}"))
+            if n in self.expand_suggested:
+                for s in solver.get_suggested():
+                    suggested[s.name] = f"{group}:suggested:{n}"
+                    result['suggested'].append((s.name, suggested[s.name]))
+
+            trans = solver.transaction()
+            if trans.isempty():
+                self.logger.error('%s.%s: nothing to do', self.name, arch)
+                return
+
+            for s in trans.newsolvables():
+                add_solvable(s, group, f"{group}:{n}")
+
+        def solve_batch(packages):
+            """
+            Solve all packages at once and attribute each solvable to the group
+            package which pulled it in. Returns False if there are problems.
+            """
+            jobs = list(self.pkglist.lockjobs[arch])
+            for n, group, install_jobs in packages:
+                jobs += install_jobs
+            jobs += lock_jobs + silent_jobs
+
+            if solver.solve(jobs):
+                return False
+
+            trans = solver.transaction()
+            origins = {}
+            for n, group, install_jobs in packages:
+                origins.setdefault(n, (group, f"{group}:{n}"))
+
+            attributed = {}
+
+            def attribute(s, seen=()):
+                # Follow the decisions back to the group package responsible for s.
+                if s.name in origins:
+                    return s.name
+                if s.id in attributed:
+                    return attributed[s.id]
+                if s.id in seen:
+                    return None
+
+                seen = seen + (s.id,)
+                reason, rule = solver.describe_decision(s)
+                causes = []
+                if reason == solver.SOLVER_REASON_WEAKDEP:
+                    causes = [cause for _, cause, _ in solver.describe_weakdep_decision(s) if cause]
+                elif rule:
+                    causes = [rule.info().solvable]
+
+                attributed[s.id] = None
+                for cause in causes:
+                    if cause and cause.id != s.id:
+                        attributed[s.id] = attribute(cause, seen)
+                        if attributed[s.id]:
+                            break
+                return attributed[s.id]
+
+            def weakdep_origins(keyname):
+                # Map each solvable to the first installed solvable recommending or suggesting it.
+                weak = {}
+                for s in trans.newsolvables():
+                    for dep in s.lookup_deparray(keyname):
+                        for provider in pool.whatprovides(dep):
+                            weak.setdefault(provider.id, s)
+                return weak
+
+            first = packages[0][0]
+            recommenders = weakdep_origins(solv.SOLVABLE_RECOMMENDS)
+            for s in solver.get_recommended():
+                if s.name in locked:
+                    continue
+                n = attribute(recommenders[s.id]) if s.id in recommenders else None
+                result['recommends'].append((s.name, origins[n or first][1]))
+            if self.expand_suggested:
+                suggesters = weakdep_origins(solv.SOLVABLE_SUGGESTS)
+                for s in solver.get_suggested():
+                    n = attribute(suggesters[s.id]) if s.id in suggesters else None
+                    if n in self.expand_suggested:
+                        group = origins[n][0]
+                        suggested[s.name] = f"{group}:suggested:{n}"
+                        result['suggested'].append((s.name, suggested[s.name]))
+
+            if trans.isempty():
+                self.logger.error('%s.%s: nothing to do', self.name, arch)
+                return True
+
+            # Record the solvables in package order like the one by one solving.
+            order = {n: i for i, n in enumerate(origins)}
+            for s in sorted(trans.newsolvables(), key=lambda s: order[attribute(s) or first]):
+                add_solvable(s, *origins[attribute(s) or first])
+
+            return True
+
+        start = time.time()
+        packages = []
+        for n, group in self.packages[arch]:
+            install_jobs = select_package(n, group)
+            if install_jobs is not None:
+                packages.append((n, group, install_jobs))
+
+        # Fall back to solving package by package to attribute the problems.
+        if not (self.pkglist.batch_solve and packages and solve_batch(packages)):
+            for n, group, install_jobs in packages:
+                solve_one_package(n, group, install_jobs)
+
+        # resetup the pool with ignored conflicts to get supplements from the list
+        pool = self.pkglist.prepare_pool(arch, True)
+        solver = pool.Solver()
+        solver.set_flag(solver.SOLVER_FLAG_IGNORE_RECOMMENDED, not use_recommends)
+        solver.set_flag(solver.SOLVER_FLAG_ADD_ALREADY_RECOMMENDED, use_recommends)
+
+        jobs = list(self.pkglist.lockjobs[arch])
+        locked = self.locked | self.pkglist.unwanted
+        for lock in locked:
+            sel = pool.select(str(lock), solv.Selection.SELECTION_NAME)
+            # if we can't find it, it probably is not as important
+            if not sel.isempty():
+                jobs += sel.jobs(solv.Job.SOLVER_LOCK)
+
+        for n in list(solved) + list(suggested):
+            if n in locked:
+                continue
+            sel = pool.select(str(n), solv.Selection.SELECTION_NAME)
+            jobs += sel.jobs(solv.Job.SOLVER_INSTALL)
+
+        solver.solve(jobs)
+        trans = solver.transaction()
+        for s in trans.newsolvables():
+            solved.setdefault(s.name, f"{group}:expansion")
+
+        end = time.time()
+        self.logger.info('%s - solving took %f', self.name, end - start)
+
+        return result
+
     def check_dups(self, modules, overlap):
         if not overlap:
             return
@@ -0,0 +1,157 @@
+import fcntl
+import json
+import logging
+import os
+import solv
+import subprocess
+import tempfile
+
+from typing import Dict, List
+
+from osclib.headerstore import HeaderStore
+from osclib.repomirror import MirrorChanges
+
+logger = logging.getLogger(__name__)
+
+
+class SolvSegments:
+    """
+    Maintain the solv data of a mirrored repository as a list of segments.
+
+    Each segment is a solv file generated by rpms2solv from up to SEGMENT_SIZE
+    headers in a HeaderStore. Added headers become new segments and only the
+    segments containing removed headers are regenerated, instead of passing
+    the entire repository to rpms2solv on every change. The segments are
+    combined into the single solv file consumed by the solver.
+
+    Since removals leave segments smaller over time all segments are rebuilt
+    after rebuild_interval incremental updates.
+    """
+
+    MANIFEST = 'segments.json'
+    SEGMENT_SIZE = 500
+    REBUILD_INTERVAL = 20
+
+    def __init__(self, directory: str, rebuild_interval: int = REBUILD_INTERVAL):
+        self.directory = directory
+        self.rebuild_interval = rebuild_interval
+        self.manifest_path = os.path.join(directory, self.MANIFEST)
+        self.lockfile = None
+        # Segment id -> hdrmd5 of the headers it contains.
+        self.segments: Dict[str, List[str]] = {}
+        self.next_id = 0
+        # Incremental updates since the last rebuild.
+        self.steps = 0
+
+    def __enter__(self):
+        # Lock before loading the manifest since it is rewritten by update().
+        self.lockfile = open(os.path.join(self.directory, 'segments.lock'), 'w')
+        fcntl.flock(self.lockfile, fcntl.LOCK_EX)
+        self._load()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        fcntl.flock(self.lockfile, fcntl.LOCK_UN)
+        self.lockfile.close()
+
+    def _load(self) -> None:
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path) as f:
+                manifest = json.load(f)
+            self.segments = manifest['segments']
+            self.next_id = manifest['next_id']
+            self.steps = manifest.get('steps', 0)
+
+    def segment_path(self, segment_id: str) -> str:
+        return os.path.join(self.directory, f'segment-{segment_id}.solv')
+
+    def update(self, store: HeaderStore, changes: MirrorChanges) -> None:
+        "Regenerate the segments affected by changes so that they cover all of store."
+        known = set()
+        for hdrmd5s in self.segments.values():
+            known.update(hdrmd5s)
+        expected = (known - set(changes.removed)) | set(changes.added)
+        if expected != set(store) or not all(os.path.exists(self.segment_path(s)) for s in self.segments):
+            # Missing or stale manifest, for example after an interrupted run.
+            self.rebuild(store)
+            return
+
+        if self.steps + 1 >= self.rebuild_interval:
+            self.rebuild(store)
+            return
+
+        removed = set(changes.removed)
+        for segment_id, hdrmd5s in list(self.segments.items()):
+            if removed.isdisjoint(hdrmd5s):
+                continue
+
+            remaining = [hdrmd5 for hdrmd5 in hdrmd5s if hdrmd5 not in removed]
+            self._drop(segment_id)
+            if remaining:
+                self._add(store, remaining)
+
+        added = [hdrmd5 for hdrmd5 in changes.added if hdrmd5 in store and hdrmd5 not in known]
+        if added:
+            self._add(store, added)
+
+        logger.debug(f'updated {self.directory} segments for {len(changes.added)} added '
+                     f'and {len(changes.removed)} removed headers')
+        self.steps += 1
+        self._save()
+
+    def rebuild(self, store: HeaderStore) -> None:
+        "Regenerate the segments from all headers in store."
+        logger.debug(f'rebuilding {self.directory} segments from {len(store)} headers')
+        self.segments = {}
+        for filename in os.listdir(self.directory):
+            # Including partial segments left behind by an interrupted run.
+            if filename.startswith('segment-'):
+                os.unlink(os.path.join(self.directory, filename))
+        if len(store):
+            self._add(store, list(store))
+        self.steps = 0
+        self._save()
+
+    def write(self, solv_file: str) -> None:
+        "Combine the segments into solv_file."
+        pool = solv.Pool()
+        repo = pool.add_repo(os.path.basename(solv_file))
+        for segment_id in sorted(self.segments, key=int):
+            if not repo.add_solv(self.segment_path(segment_id)):
+                raise Exception(f'failed to read {self.segment_path(segment_id)}')
+        repo.internalize()
+
+        ofh = solv.xfopen(solv_file, 'w')
+        repo.write(ofh)
+        ofh.flush()
+
+    def _add(self, store: HeaderStore, hdrmd5s: List[str]) -> None:
+        for chunk in range(0, len(hdrmd5s), self.SEGMENT_SIZE):
+            self._add_segment(store, hdrmd5s[chunk:chunk + self.SEGMENT_SIZE])
+
+    def _add_segment(self, store: HeaderStore, hdrmd5s: List[str]) -> None:
+        segment_id = str(self.next_id)
+        self.next_id += 1
+
+        path = self.segment_path(segment_id)
+        with tempfile.TemporaryDirectory(dir=self.directory) as tmpdir:
+            files = store.export(hdrmd5s, tmpdir)
+            with open(path + '.tmp', 'w') as fh:
+                p = subprocess.Popen(
+                    ['rpms2solv', '-m', '-', '-0'], stdin=subprocess.PIPE, stdout=fh)
+                p.communicate(bytes('\0'.join(files.values()), 'utf-8'))
+            if p.wait() != 0:
+                raise Exception("rpm2solv failed")
+        os.rename(path + '.tmp', path)
+
+        self.segments[segment_id] = list(hdrmd5s)
+
+    def _drop(self, segment_id: str) -> None:
+        del self.segments[segment_id]
+        if os.path.exists(self.segment_path(segment_id)):
+            os.unlink(self.segment_path(segment_id))
+
+    def _save(self) -> None:
+        with open(self.manifest_path + '.tmp', 'w') as f:
+            json.dump({'segments': self.segments, 'next_id': self.next_id, 'steps': self.steps}, f)
+        os.rename(self.manifest_path + '.tmp', self.manifest_path)
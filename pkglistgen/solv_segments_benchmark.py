@@ -0,0 +1,109 @@
+import argparse
+import hashlib
+import logging
+import os
+import random
+import shutil
+import struct
+import tempfile
+import time
+
+from osclib.headerstore import HeaderStore
+from osclib.repomirror import MirrorChanges
+from pkglistgen.solv_segments import SolvSegments
+
+HEADER_MAGIC = b'\x8e\xad\xe8\x01'
+
+
+def synthetic_header(i: int) -> bytes:
+    "Bare RPM header of a package with a few dependencies like those mirrored by RepoMirror."
+    name = f'package{i}'
+    tags = [
+        (1000, [name]), (1001, ['1.0']), (1002, ['1.1']), (1022, ['x86_64']),
+        (1047, [name, f'lib{name}.so.1()(64bit)']),
+        (1049, ['libc.so.6()(64bit)', f'lib{(i + 1) % 1000}.so.1()(64bit)']),
+    ]
+    index = b''
+    store = b''
+    for tag, values in tags:
+        data = b''.join(value.encode() + b'\0' for value in values)
+        index += struct.pack('>IIiI', tag, 8 if len(values) > 1 else 6, len(store), len(values))
+        store += data
+    return HEADER_MAGIC + b'\0' * 4 + struct.pack('>II', len(tags), len(store)) + index + store
+
+
+def copy_store(source: str, directory: str, packages: int) -> HeaderStore:
+    os.mkdir(directory)
+    store = HeaderStore(directory)
+    if source:
+        headers = HeaderStore(source)
+        for hdrmd5 in headers:
+            store.add(hdrmd5, headers.entries[hdrmd5].name, headers.read(hdrmd5))
+    else:
+        for i in range(packages):
+            header = synthetic_header(i)
+            store.add(hashlib.md5(header).hexdigest(), f'package{i}-1.0-1.1.x86_64', header)
+    return store
+
+
+def measure(function) -> float:
+    start = time.perf_counter()
+    function()
+    return time.perf_counter() - start
+
+
+def main(args) -> None:
+    SolvSegments.SEGMENT_SIZE = args.segment_size
+    directory = tempfile.mkdtemp(prefix='solv-segments-benchmark-', dir=args.directory)
+    try:
+        store = copy_store(args.store, os.path.join(directory, 'store'), args.packages)
+        hdrmd5s = list(store)
+        random.seed(0)
+        # Headers of the packages rebuilt in each step, held back for the first one.
+        pending = random.sample(hdrmd5s, args.changed)
+        held = {hdrmd5: (store.entries[hdrmd5].name, store.read(hdrmd5)) for hdrmd5 in pending}
+        for hdrmd5 in pending:
+            store.remove(hdrmd5)
+
+        solv_file = os.path.join(directory, 'repo.solv')
+        segments_directory = os.path.join(directory, 'segments')
+        os.mkdir(segments_directory)
+        print(f'{len(hdrmd5s)} headers in segments of {args.segment_size}, '
+              f'{args.changed} replaced per incremental update, seconds')
+        with SolvSegments(segments_directory) as segments:
+            rebuild = measure(lambda: (segments.rebuild(store), segments.write(solv_file)))
+        print(f'{"rebuild":<12} {rebuild:>8.2f} {len(segments.segments):>4} segments')
+
+        for step in range(args.steps):
+            removed = random.sample(sorted(store), args.changed)
+            for hdrmd5 in removed:
+                held[hdrmd5] = (store.entries[hdrmd5].name, store.read(hdrmd5))
+                store.remove(hdrmd5)
+            for hdrmd5 in pending:
+                store.add(hdrmd5, *held.pop(hdrmd5))
+            changes = MirrorChanges(pending, removed)
+            pending = removed
+
+            with SolvSegments(segments_directory) as segments:
+                update = measure(lambda: (segments.update(store, changes), segments.write(solv_file)))
+            print(f'{f"update {step + 1}":<12} {update:>8.2f} {len(segments.segments):>4} segments')
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Compare full and incremental regeneration of the solv file of a mirrored repository')
+    parser.add_argument('--store', help='directory of a HeaderStore mirrored by RepoMirror, like a Factory '
+                                        'repository, instead of synthetic headers')
+    parser.add_argument('--packages', type=int, default=15000, help='number of synthetic headers')
+    parser.add_argument('--changed', type=int, default=50, help='number of headers replaced per update')
+    parser.add_argument('--segment-size', type=int, default=SolvSegments.SEGMENT_SIZE,
+                        help='number of headers per segment')
+    parser.add_argument('--steps', type=int, default=3, help='number of incremental updates')
+    parser.add_argument('--directory', help='directory to work in')
+    parser.add_argument('-d', '--debug', action='store_true', help='print debug information')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.DEBUG if args.debug else logging.INFO)
+    main(args)
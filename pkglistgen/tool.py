@@ -1,6 +1,7 @@
 import ToolBase
 import glob
 import logging
+import multiprocessing
 import os
 import re
 import solv
@@ -26,6 +27,7 @@ from osclib.conf import str2bool
 from osclib.core import repository_path_expand
 from osclib.core import repository_arch_state
 from osclib.cache_manager import CacheManager
+from osclib.headerstore import HeaderStore
 from osclib.pkglistgen_comments import PkglistComments
 from osclib.repomirror import RepoMirror
 
@@ -34,6 +36,7 @@ from urllib.parse import urlparse
 from pkglistgen import file_utils
 from pkglistgen.engine import Engine
 from pkglistgen.group import Group
+from pkglistgen.solv_segments import SolvSegments
 
 SCRIPT_PATH = os.path.dirname(os.path.realpath(__file__))
 
@@ -48,6 +51,17 @@ class MismatchedRepoException(Exception):
     """raised on repos that restarted building"""
 
 
+# Group being solved by PkgListGen.solve_architectures(), inherited by forked workers.
+_solving_group = None
+
+
+def _solve_arch_worker(args):
+    arch, use_recommends = args
+    # Pools were prepared before forking, do not query the states again.
+    _solving_group.pkglist.check_repo_states = False
+    return arch, _solving_group.solve_arch(arch, use_recommends)
+
+
 class PkgListGen(ToolBase.ToolBase):
 
     def __init__(self):
@@ -64,6 +78,9 @@ class PkgListGen(ToolBase.ToolBase):
         self.input_dir = '.'
         self.output_dir = '.'
         self.lockjobs = dict()
+        self.pools = dict()
+        self.repo_states = dict()
+        self.check_repo_states = True
         self.ignore_broken = False
         self.unwanted = set()
         self.output = None
@@ -71,6 +88,11 @@ class PkgListGen(ToolBase.ToolBase):
         self.filtered_architectures = None
         self.dry_run = False
         self.all_architectures = None
+        self.mirror_workers = 1
+        self.solve_workers = 1
+        self.batch_solve = False
+        self.full_solv_rebuild = False
+        self.solv_rebuild_interval = SolvSegments.REBUILD_INTERVAL
 
     def filter_architectures(self, architectures):
         self.filtered_architectures = sorted(list(set(architectures) & set(self.all_architectures)))
@@ -267,7 +289,55 @@ class PkgListGen(ToolBase.ToolBase):
         for p in tocheck_locales - all_grouped:
             self.logger.warning('package %s provides supported locale but is not grouped', p)
 
+    def solve_architectures(self, group, use_recommends):
+        """
+        Solve group for each of the filtered architectures.
+
+        With solve_workers > 1 the architectures are solved by forked worker
+        processes. The pools are prepared beforehand so the workers share them.
+        """
+        archs = self.filtered_architectures
+        if self.solve_workers <= 1 or len(archs) <= 1:
+            return {arch: group.solve_arch(arch, use_recommends) for arch in archs}
+
+        for arch in archs:
+            self.prepare_pool(arch, False)
+            self.prepare_pool(arch, True)
+
+        global _solving_group
+        _solving_group = group
+        try:
+            context = multiprocessing.get_context('fork')
+            with context.Pool(min(self.solve_workers, len(archs))) as pool:
+                return dict(pool.map(_solve_arch_worker, [(arch, use_recommends) for arch in archs]))
+        finally:
+            _solving_group = None
+
     def prepare_pool(self, arch, ignore_conflicts):
+        # check back the repo state to avoid suprises
+        if self.check_repo_states or arch not in self.repo_states:
+            self.repo_states[arch] = tuple(repository_arch_state(self.apiurl, project, reponame, arch)
+                                           for project, reponame in self.repos)
+        states = self.repo_states[arch]
+
+        # Pools are reused across groups as loading the solv files and computing the
+        # file provides dominates otherwise. The solver does not modify the pool.
+        key = (arch, ignore_conflicts, states, frozenset(self.locales))
+        if key in self.pools:
+            pool, self.lockjobs[arch] = self.pools[key]
+            return pool
+
+        for other in list(self.pools):
+            if other[:2] == key[:2]:
+                # Repository or locales changed during the run, drop the stale pool so
+                # that at most two pools are kept per architecture.
+                del self.pools[other]
+
+        pool = self._prepare_pool(arch, ignore_conflicts, states)
+        self.pools[key] = (pool, self.lockjobs[arch])
+        return pool
+
+    def _prepare_pool(self, arch, ignore_conflicts, states):
         pool = solv.Pool()
         # the i586 DVD is really a i686 one
         if arch == 'i586':
@@ -278,10 +348,8 @@ class PkgListGen(ToolBase.ToolBase):
         self.lockjobs[arch] = []
         solvables = set()
 
-        for project, reponame in self.repos:
+        for (project, reponame), state in zip(self.repos, states):
             repo = pool.add_repo(project)
-            # check back the repo state to avoid suprises
-            state = repository_arch_state(self.apiurl, project, reponame, arch)
             if state is None:
                 continue
             s = f'repo-{project}-{reponame}-{arch}-{state}.solv'
@@ -408,19 +476,18 @@ class PkgListGen(ToolBase.ToolBase):
 
         self.logger.debug('updating %s', d)
 
-        rm = RepoMirror(self.apiurl)
-        rm.mirror(d, project, repo, arch)
+        rm = RepoMirror(self.apiurl, workers=self.mirror_workers, packed=True)
+        changes = rm.mirror(d, project, repo, arch)
 
-        files = [os.path.join(d, f)
-                 for f in os.listdir(d) if f.endswith('.rpm')]
+        # Only the headers added or removed since the last run are passed to rpms2solv
+        # unless a full rebuild is requested or due.
         suffix = f'.{os.getpid()}.tmp'
-        fh = open(solv_file + suffix, 'w')
-        p = subprocess.Popen(
-            ['rpms2solv', '-m', '-', '-0'], stdin=subprocess.PIPE, stdout=fh)
-        p.communicate(bytes('\0'.join(files), 'utf-8'))
-        fh.close()
-        if p.wait() != 0:
-            raise Exception("rpm2solv failed")
+        with SolvSegments(d, self.solv_rebuild_interval) as segments:
+            if self.full_solv_rebuild:
+                segments.rebuild(HeaderStore(d))
+            else:
+                segments.update(HeaderStore(d), changes)
+            segments.write(solv_file + suffix)
         os.rename(solv_file + suffix, solv_file)
 
         # Create hash file now that solv creation is complete.
@@ -440,7 +507,7 @@ class PkgListGen(ToolBase.ToolBase):
                 # reworking a fair bit since the state needs to be tracked.
                 solv_file = os.path.join(CACHEDIR, repo_solv_name)
                 solv_file_hash = f'{solv_file}::{state}'
-                if os.path.exists(solv_file) and os.path.exists(solv_file_hash):
+                if not self.full_solv_rebuild and os.path.exists(solv_file) and os.path.exists(solv_file_hash):
                     # Solve file exists and hash unchanged, skip updating solv.
                     self.logger.debug('skipping solv generation for {} due to matching state {}'.format(
                         '/'.join([project, repo, arch]), state))
@@ -672,6 +739,11 @@ class PkgListGen(ToolBase.ToolBase):
     ):
         self.all_architectures = target_config.get('pkglistgen-archs').split(' ')
         self.use_newest_version = str2bool(target_config.get('pkglistgen-use-newest-version', 'False'))
+        self.mirror_workers = int(target_config.get('pkglistgen-mirror-workers', 1))
+        self.solve_workers = int(target_config.get('pkglistgen-solve-workers', 1))
+        self.batch_solve = str2bool(target_config.get('pkglistgen-batch-solve', 'False'))
+        self.solv_rebuild_interval = int(target_config.get('pkglistgen-solv-rebuild-interval',
+                                                           SolvSegments.REBUILD_INTERVAL))
         self.repos = self.expand_repos(project, main_repo)
         logging.debug(f'[{scope}] {project}/{main_repo}: update and solve')
 
@@ -832,6 +904,8 @@ class PkgListGen(ToolBase.ToolBase):
                 self.write_all_groups()
 
             summary = self.make_summary()
+            # Solving is done, free the pools before loading the old repositories.
+            self.pools.clear()
 
         if stop_after_solve:
             return
@@ -23,6 +23,9 @@ from urllib.parse import urljoin, urlparse
 
 logger = logging.getLogger()
 
+# Metadata is streamed to disk in chunks of this size.
+METADATA_CHUNK_SIZE = 1024 * 1024
+
 
 def dump_solv_build(baseurl):
     """Determine repo format and build string from remote repository."""
@@ -62,6 +65,54 @@ def dump_solv_build(baseurl):
     raise Exception(baseurl + 'includes no build number')
 
 
+def metadata_cache_path(algorithm, checksum):
+    return os.path.join(CacheManager.directory('update_repo_handler', 'metadata'), f'{algorithm}-{checksum}')
+
+
+def download_metadata(url, algorithm=None, checksum=None):
+    """
+    Stream url to a file, hashing the chunks as they arrive, and return the
+    file rewound for libsolv. If the expected checksum is known the download
+    is verified and kept in a cache keyed by the checksum, so that unchanged
+    metadata is only downloaded once.
+    """
+    if checksum:
+        path = metadata_cache_path(algorithm, checksum)
+        if os.path.exists(path):
+            logger.debug(f'using cached {url}')
+            # Keep the entry from being pruned by CacheManager.
+            os.utime(path)
+            return open(path, 'rb')
+        f = tempfile.NamedTemporaryFile(dir=os.path.dirname(path), prefix='.', delete=False)
+    else:
+        f = tempfile.TemporaryFile()
+
+    try:
+        sha = hashlib.new(algorithm) if algorithm else None
+        with requests.get(url, stream=True) as response:
+            if response.status_code != requests.codes.ok:
+                raise Exception(url + ' does not exist')
+            for chunk in response.iter_content(chunk_size=METADATA_CHUNK_SIZE):
+                f.write(chunk)
+                if sha:
+                    sha.update(chunk)
+        f.flush()
+
+        if checksum and sha.hexdigest() != checksum:
+            raise Exception(f'checksums do not match {sha.hexdigest()} != {checksum}')
+    except Exception:
+        f.close()
+        if checksum:
+            os.unlink(f.name)
+        raise
+
+    if checksum:
+        # The descriptor stays valid and is handed to libsolv below.
+        os.rename(f.name, path)
+    f.seek(0)
+    return f
+
+
 def parse_repomd(repo, baseurl):
     url = urljoin(baseurl, 'repodata/repomd.xml')
     repomd = requests.get(url)
@@ -72,39 +123,34 @@ def parse_repomd(repo, baseurl):
     root = ET.fromstring(repomd.content)
     primary_element = root.find('.//r:data[@type="primary"]', ns)
     location = primary_element.find('r:location', ns).get('href')
-    sha256_or_512 = 0
     try:
         sha_expected = primary_element.find('r:checksum[@type="sha512"]', ns).text
-        sha256_or_512 = 512
+        algorithm = 'sha512'
     except AttributeError:
         sha_expected = primary_element.find('r:checksum[@type="sha256"]', ns).text
-        sha256_or_512 = 256
-
-    f = tempfile.TemporaryFile()
-    f.write(repomd.content)
-    f.flush()
-    os.lseek(f.fileno(), 0, os.SEEK_SET)
-    repo.add_repomdxml(solv.xfopen_fd(None, f.fileno()), 0)
-    url = urljoin(baseurl, location)
-    with requests.get(url, stream=True) as primary:
-        if primary.status_code != requests.codes.ok:
-            raise Exception(url + ' does not exist')
-        if sha256_or_512 == 512:
-            sha = hashlib.sha512(primary.content).hexdigest()
-        else:
-            sha = hashlib.sha256(primary.content).hexdigest()
-
-        if sha != sha_expected:
-            raise Exception(f'checksums do not match {sha} != {sha_expected}')
+        algorithm = 'sha256'
 
-        os.lseek(f.fileno(), 0, os.SEEK_SET)
-        f.write(primary.content)
+    with tempfile.TemporaryFile() as f:
+        f.write(repomd.content)
         f.flush()
         os.lseek(f.fileno(), 0, os.SEEK_SET)
+        repo.add_repomdxml(solv.xfopen_fd(None, f.fileno()), 0)
+
+    url = urljoin(baseurl, location)
+    with download_metadata(url, algorithm, sha_expected) as f:
         repo.add_rpmmd(solv.xfopen_fd(url, f.fileno()), None, 0)
-        return True
+    return True
+
 
-    return False
+def susetags_checksum(repo, filename):
+    "Return the algorithm and checksum of filename listed in the susetags content file."
+    di = repo.Dataiterator_meta(solv.SUSETAGS_FILE_NAME, filename, solv.Dataiterator.SEARCH_STRING)
+    di.prepend_keyname(solv.SUSETAGS_FILE)
+    for d in di:
+        checksum = d.parentpos().lookup_checksum(solv.SUSETAGS_FILE_CHECKSUM)
+        if checksum:
+            return checksum.typestr(), checksum.hex()
+    return None, None
 
 
 def parse_susetags(repo, baseurl):
@@ -113,11 +159,11 @@ def parse_susetags(repo, baseurl):
     if content.status_code != requests.codes.ok:
         return False
 
-    f = tempfile.TemporaryFile()
-    f.write(content.content)
-    f.flush()
-    os.lseek(f.fileno(), 0, os.SEEK_SET)
-    repo.add_content(solv.xfopen_fd(None, f.fileno()), 0)
+    with tempfile.TemporaryFile() as f:
+        f.write(content.content)
+        f.flush()
+        os.lseek(f.fileno(), 0, os.SEEK_SET)
+        repo.add_content(solv.xfopen_fd(None, f.fileno()), 0)
 
     defvendorid = repo.meta.lookup_id(solv.SUSETAGS_DEFAULTVENDOR)
     descrdir = repo.meta.lookup_str(solv.SUSETAGS_DESCRDIR)
@@ -125,22 +171,15 @@ def parse_susetags(repo, baseurl):
         descrdir = 'suse/setup/descr'
 
     url = urljoin(baseurl, descrdir + '/packages.gz')
-    with requests.get(url, stream=True) as packages:
-        if packages.status_code != requests.codes.ok:
-            raise Exception(url + ' does not exist')
-
-        os.lseek(f.fileno(), 0, os.SEEK_SET)
-        f.write(packages.content)
-        f.flush()
-        os.lseek(f.fileno(), 0, os.SEEK_SET)
+    algorithm, checksum = susetags_checksum(repo, 'packages.gz')
+    with download_metadata(url, algorithm, checksum) as f:
         try:
             repo.add_susetags(solv.xfopen_fd(url, f.fileno()), defvendorid, None,
                               solv.Repo.REPO_NO_INTERNALIZE | solv.Repo.SUSETAGS_RECORD_SHARES)
         except TypeError:
             logger.error(f"Failed to add susetags for {url}")
             return False
-        return True
-    return False
+    return True
 
 
 def dump_solv(name, baseurl):
@@ -5,11 +5,11 @@ import hashlib
 import logging
 import os
 import os.path
-import subprocess
 import sys
 import tempfile
 import cmdln
 import dateutil.parser
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 from urllib.parse import urlencode
 
@@ -23,7 +23,7 @@ from osclib.conf import Config
 from osclib.core import (http_DELETE, http_GET, makeurl,
                          repository_path_expand, repository_path_search,
                          target_archs, source_file_load, source_file_ensure)
-from osclib.repochecks import mirror, parsed_installcheck, CorruptRepos
+from osclib.repochecks import followup_installcheck, mirror, parsed_installcheck, write_packages
 from osclib.comments import CommentAPI
 
 
@@ -34,6 +34,7 @@ class RepoChecker():
         self.store_package = None
         self.rebuild = None
         self.comment = None
+        self.workers = 1
 
     def parse_store(self, project_package):
         if project_package:
@@ -53,9 +54,21 @@ class RepoChecker():
             self.logger.debug(f'{project} has no relevant architectures')
             return None
 
-        for arch in archs:
-            self.arch = arch
-            state = self.check_pra(project, repository, arch)
+        # Mirroring is bound by the network and installcheck by the CPU, so
+        # the next architectures are mirrored while the current one is checked.
+        repository_pairs = repository_path_expand(self.apiurl, project, repository)
+        with ThreadPoolExecutor(max_workers=self.workers) as mirrors, \
+                ThreadPoolExecutor(max_workers=self.workers) as checks:
+            parsed = dict()
+            for arch in archs:
+                mirrored = [mirrors.submit(mirror, self.apiurl, pair_project, pair_repository, arch)
+                            for pair_project, pair_repository in repository_pairs]
+                parsed[arch] = checks.submit(self.installcheck, arch, mirrored)
+
+            # the state is updated one architecture after the other, in order
+            for arch in archs:
+                self.arch = arch
+                state = self.check_pra(project, repository, arch, parsed[arch].result())
 
         if self.comment:
             self.create_comments(state)
@@ -105,7 +118,7 @@ class RepoChecker():
             commentapi.add_comment(project_name=self.project, package_name=package, comment=newcomment)
 
     def _split_and_filter(self, output):
-        output = output.split("\n")
+        output = list(output)
         for lnr, line in enumerate(output):
             if line.startswith('FOLLOWUP'):
                 # there can be multiple lines with missing providers
@@ -161,7 +174,33 @@ class RepoChecker():
             if source not in oldstate[code]:
                 oldstate[code][source] = str(datetime.now())
 
-    def check_pra(self, project, repository, arch):
+    def installcheck(self, arch, mirrored):
+        "Run installcheck on the repositories once the futures of mirrored are done."
+        directories = []
+        primaryxmls = []
+        for future in mirrored:
+            path = future.result()
+            if os.path.isdir(path):
+                directories.append(path)
+            else:
+                primaryxmls.append(path)
+
+        with tempfile.TemporaryDirectory(prefix='repochecker') as dir:
+            pfile = os.path.join(dir, 'packages')
+
+            catalog = write_packages(dir, directories)
+            target_packages = catalog.get(directories[0], {})
+
+            parsed = parsed_installcheck([pfile] + primaryxmls, arch, target_packages, [])
+
+        followup_installcheck(parsed)
+
+        for package in parsed:
+            parsed[package]['output'] = self._split_and_filter(parsed[package]['output'])
+
+        return parsed
+
+    def check_pra(self, project, repository, arch, parsed):
         config = Config.get(self.apiurl, project)
 
         oldstate = None
@@ -180,53 +219,6 @@ class RepoChecker():
         if not isinstance(oldstate['leafs'], dict):
             oldstate['leafs'] = {}
 
-        repository_pairs = repository_path_expand(self.apiurl, project, repository)
-        directories = []
-        primaryxmls = []
-        for pair_project, pair_repository in repository_pairs:
-            mirrored = mirror(self.apiurl, pair_project, pair_repository, arch)
-            if os.path.isdir(mirrored):
-                directories.append(mirrored)
-            else:
-                primaryxmls.append(mirrored)
-
-        parsed = dict()
-        with tempfile.TemporaryDirectory(prefix='repochecker') as dir:
-            pfile = os.path.join(dir, 'packages')
-
-            SCRIPT_PATH = os.path.dirname(os.path.realpath(__file__))
-            script = os.path.join(SCRIPT_PATH, 'write_repo_susetags_file.pl')
-            parts = ['perl', script, dir] + directories
-
-            p = subprocess.run(parts)
-            if p.returncode:
-                # technically only 126, but there is no other value atm -
-                # so if some other perl error happens, we don't continue
-                raise CorruptRepos
-
-            target_packages = {}
-            with open(os.path.join(dir, 'catalog.yml')) as file:
-                catalog = yaml.safe_load(file)
-                if catalog is not None:
-                    target_packages = catalog.get(directories[0], [])
-
-            parsed = parsed_installcheck([pfile] + primaryxmls, arch, target_packages, [])
-
-        for package in parsed:
-            parsed[package]['output'] = "\n".join(parsed[package]['output'])
-
-        # let's risk a N*N algorithm in the hope that we have a limited N
-        for package1 in parsed:
-            output = parsed[package1]['output']
-            for package2 in parsed:
-                if package1 == package2:
-                    continue
-                output = output.replace(parsed[package2]['output'], 'FOLLOWUP(' + package2 + ')')
-            parsed[package1]['output'] = output
-
-        for package in parsed:
-            parsed[package]['output'] = self._split_and_filter(parsed[package]['output'])
-
         url = makeurl(self.apiurl, ['build', project, '_result'], {'repository': repository, 'arch': arch})
         root = ET.parse(http_GET(url)).getroot()
         buildresult = dict()
@@ -373,6 +365,8 @@ class CommandLineInterface(ToolBase.CommandLineInterface):
     @cmdln.option('-r', '--repo', dest='repo', help='Repository to check')
     @cmdln.option('--add-comments', dest='comments', action='store_true', help='Create comments about issues')
     @cmdln.option('--no-rebuild', dest='norebuild', action='store_true', help='Only track issues, do not rebuild')
+    @cmdln.option('-j', '--workers', type=int, default=1,
+                  help='number of repositories mirrored and architectures checked at once')
     def do_check(self, subcmd, opts, project):
         """${cmd_name}: Rebuild packages in rebuild=local projects
 
@@ -381,6 +375,7 @@ class CommandLineInterface(ToolBase.CommandLineInterface):
         """
         self.tool.rebuild = not opts.norebuild
         self.tool.comment = opts.comments
+        self.tool.workers = opts.workers
         self.tool.parse_store(opts.store)
         self.tool.apiurl = conf.config['apiurl']
         self.tool.check(project, opts.repo)
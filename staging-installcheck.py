@@ -19,7 +19,7 @@ from osclib.core import (builddepinfo, depends_on, duplicated_binaries_in_repo,
                          fileinfo_ext_all, repository_arch_state,
                          repository_path_expand, target_archs)
 
-from osclib.repochecks import installcheck, mirror
+from osclib.repochecks import installcheck, installcheck_base, mirror
 from osclib.stagingapi import StagingAPI
 from osclib.memoize import memoize
 
@@ -234,13 +234,19 @@ class InstallChecker(object):
             # hit the first repository in the target project (if existant)
             target_pair = None
             directories = []
+            base_pairs = []
             for pair_project, pair_repository in repository_pairs:
                 # ignore repositories only inherited for config
-                if repository_arch_state(self.api.apiurl, pair_project, pair_repository, arch):
+                state = repository_arch_state(self.api.apiurl, pair_project, pair_repository, arch)
+                if state:
                     if not target_pair and pair_project == api.project:
                         target_pair = [pair_project, pair_repository]
 
-                    directories.append(mirror(self.api.apiurl, pair_project, pair_repository, arch))
+                    if target_pair and directories:
+                        base_pairs.append((pair_project, pair_repository, state))
+                    else:
+                        directories.append(mirror(self.api.apiurl, pair_project, pair_repository, arch))
+            base = self.installcheck_base(base_pairs, arch) if base_pairs else None
 
             if not api.is_adi_project(project):
                 # For "leaky" ring packages in letter stagings, where the
@@ -259,7 +265,7 @@ class InstallChecker(object):
                 result_comment.append(check.comment)
                 result = False
 
-            check = self.install_check(directories, arch, whitelist, ignore_conflicts)
+            check = self.install_check(directories, arch, whitelist, ignore_conflicts, base)
             if not check.success:
                 self.logger.warning('Install check failed')
                 result_comment.append(check.comment)
@@ -358,9 +364,19 @@ class InstallChecker(object):
         # Trick to prioritize x86_64.
         return sorted(archs, reverse=True)
 
-    def install_check(self, directories, arch, whitelist, ignored_conflicts):
+    def installcheck_base(self, pairs, arch):
+        """
+        Packages of the target project repositories, which are the same for all
+        stagings, built once per repository state and layered below the packages
+        of each staging. The repositories are only mirrored to build it.
+        """
+        key = [arch] + [f'{project}/{repository}/{state}' for project, repository, state in pairs]
+        return installcheck_base(key, lambda: [mirror(self.api.apiurl, project, repository, arch)
+                                               for project, repository, _ in pairs])
+
+    def install_check(self, directories, arch, whitelist, ignored_conflicts, base=None):
         self.logger.info(f"install check: start (whitelist:{','.join(whitelist)})")
-        parts = installcheck(directories, arch, whitelist, ignored_conflicts)
+        parts = installcheck(directories, arch, whitelist, ignored_conflicts, base)
         if len(parts):
             header = f'### [install check & file conflicts for {arch}]'
             return CheckResult(False, header + '\n\n' + ('\n' + ('-' * 80) + '\n\n').join(parts))
@@ -1,5 +1,12 @@
 import logging
+import threading
+import unittest
+from io import BytesIO
+from unittest import mock
+from urllib.parse import parse_qs, urlsplit
 from . import OBSLocal
+from lxml import etree as ET
+from osc.core import Request
 from osclib.comments import CommentAPI
 from ReviewBot import ReviewBot
 import random
@@ -163,3 +170,85 @@ class TestReviewBotComment(OBSLocal.TestCase):
     def comments_filtered(self, bot):
         comments = self.api.get_comments(project_name=PROJECT)
         return self.api.comment_find(comments, bot)
+
+
+class ConcurrentBot(ReviewBot):
+    concurrent_safe = True
+
+    def __init__(self, *args, **kwargs):
+        super(ConcurrentBot, self).__init__(*args, **kwargs)
+        self.override_allow = False
+        self.reviews = []
+
+    def check_action_submit(self, req, a):
+        # Only passes once all workers check a request at the same time.
+        self.barrier.wait()
+        self.review_messages['accepted'] = f'ok {self.request.reqid}'
+        self.review_messages['declined'] = f'failed {self.action.tgt_package}'
+        return req.reqid != '3'
+
+    def _set_review(self, req, state):
+        self.reviews.append((threading.current_thread(), req.reqid, state, self.review_messages[state]))
+
+
+class TestReviewBotConcurrent(unittest.TestCase):
+    def setUp(self):
+        self.bot = ConcurrentBot('http://reviewbot.example.com', logger=logging.getLogger('ConcurrentBot'))
+        for reqid in range(1, 5):
+            request = Request()
+            request.read(ET.fromstring(f"""<request id="{reqid}">
+                <action type="submit">
+                    <source project="devel" package="p{reqid}" rev="1"/>
+                    <target project="openSUSE:Factory" package="p{reqid}"/>
+                </action>
+                <state name="review" who="user" when="2024-01-01T00:00:00"/>
+            </request>"""))
+            self.bot.requests.append(request)
+
+    def test_check_requests(self):
+        self.bot.workers = 4
+        self.bot.barrier = threading.Barrier(4, timeout=30)
+        self.assertEqual(self.bot.check_requests(), 0)
+
+        main = threading.current_thread()
+        self.assertEqual(self.bot.reviews, [
+            (main, '1', 'accepted', 'ok 1'),
+            (main, '2', 'accepted', 'ok 2'),
+            (main, '3', 'declined', 'failed p3'),
+            (main, '4', 'accepted', 'ok 4'),
+        ])
+        # The state of the requests did not leak into the bot.
+        self.assertIsNone(self.bot.request)
+        self.assertEqual(self.bot.review_messages, ReviewBot.DEFAULT_REVIEW_MESSAGES)
+
+    def test_check_requests_serial(self):
+        self.bot.barrier = threading.Barrier(1)
+        self.assertEqual(self.bot.check_requests(), 0)
+        self.assertEqual([review[1:] for review in self.bot.reviews], [
+            ('1', 'accepted', 'ok 1'),
+            ('2', 'accepted', 'ok 2'),
+            ('3', 'declined', 'failed p3'),
+            ('4', 'accepted', 'ok 4'),
+        ])
+        self.assertEqual(self.bot.request.reqid, '4')
+
+    def test_check_requests_unsafe(self):
+        # Bots not declared concurrent_safe check one request at a time.
+        self.bot.concurrent_safe = False
+        self.bot.workers = 4
+        self.bot.barrier = threading.Barrier(1)
+        self.assertEqual(self.bot.check_requests(), 0)
+        self.assertEqual([review[2] for review in self.bot.reviews],
+                         ['accepted', 'accepted', 'declined', 'accepted'])
+        self.assertEqual(self.bot.request.reqid, '4')
+
+
+class TestReviewBotSearch(unittest.TestCase):
+    def test_search_review_ids(self):
+        bot = ReviewBot('http://reviewbot.example.com', logger=logging.getLogger('ReviewBot'), user='bot')
+        with mock.patch('osclib.core.http_GET', return_value=BytesIO(b'<collection/>')) as http_GET:
+            bot.set_request_ids_search_review(['1', '2'])
+        match = parse_qs(urlsplit(http_GET.call_args[0][0]).query)['match'][0]
+        self.assertEqual(match, "(state/@name='review' and review[@by_user='bot' and @state='new'])"
+                                " and (@id=1 or @id=2)")
+        self.assertEqual(bot.requests, [])
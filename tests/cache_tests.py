@@ -0,0 +1,187 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+import unittest
+from unittest import mock
+from urllib.error import HTTPError
+
+from osc import conf
+from osclib.cache import Cache
+from osclib.cache import http_request
+from osclib.cache_manager import CacheManager
+
+APIURL = 'http://cachetest.example.com'
+
+
+class TestCache(unittest.TestCase):
+    backend = 'file'
+
+    def setUp(self):
+        conf.config['debug'] = False
+        CacheManager.test = True
+        os.environ['OSRT_CACHE_BACKEND'] = self.backend
+        Cache.CACHE_DIR = None
+        Cache.init('cache-tests-' + self.backend)
+        Cache.delete_all()
+        Cache.last_updated[APIURL] = {'__oldest': '2016-12-18T11:49:37Z'}
+
+    def tearDown(self):
+        Cache.delete_all()
+        Cache.CACHE_DIR = None
+        del os.environ['OSRT_CACHE_BACKEND']
+
+    def put(self, url, text, headers=None):
+        return Cache.put(url, BytesIOLike(text, headers)).read()
+
+    def test_put_get(self):
+        url = f'{APIURL}/source/openSUSE:Factory/_meta'
+        self.assertIsNone(Cache.get(url))
+        self.assertEqual(self.put(url, b'<project/>'), b'<project/>')
+        self.assertEqual(Cache.get(url).read(), b'<project/>')
+
+    def test_unmatched(self):
+        url = f'{APIURL}/request/1'
+        self.assertEqual(self.put(url, b'<request/>'), b'<request/>')
+        self.assertIsNone(Cache.get(url))
+
+    def test_expired(self):
+        url = f'{APIURL}/source/openSUSE:Factory/_meta'
+        self.put(url, b'<project/>')
+        ttl = Cache.PATTERNS[r'/source/([^/]+)/_meta$']
+        try:
+            Cache.PATTERNS[r'/source/([^/]+)/_meta$'] = -1
+            self.assertIsNone(Cache.get(url))
+        finally:
+            Cache.PATTERNS[r'/source/([^/]+)/_meta$'] = ttl
+
+    def test_delete(self):
+        url = f'{APIURL}/source/openSUSE:Factory/_meta'
+        other = f'{APIURL}/source/openSUSE:Leap:15.6/_meta'
+        self.put(url, b'<project/>')
+        self.put(other, b'<project/>')
+        Cache.delete(url)
+        self.assertIsNone(Cache.get(url))
+        self.assertIsNotNone(Cache.get(other))
+
+    def test_delete_project(self):
+        meta = f'{APIURL}/source/openSUSE:Factory/_meta'
+        link = f'{APIURL}/source/openSUSE:Factory/nano/_link'
+        other = f'{APIURL}/source/openSUSE:Leap:15.6/_meta'
+        self.put(meta, b'<project/>')
+        self.put(link, b'<link/>')
+        self.put(other, b'<project/>')
+        Cache.delete_project(APIURL, 'openSUSE:Factory')
+        self.assertIsNone(Cache.get(meta))
+        self.assertIsNone(Cache.get(link))
+        self.assertIsNotNone(Cache.get(other))
+
+    def test_revalidate(self):
+        url = f'{APIURL}/source/openSUSE:Factory/_meta'
+        self.put(url, b'<project/>', {'ETag': '"abc"'})
+        self.assertEqual(Cache.conditional_headers(url), {'If-None-Match': '"abc"'})
+
+        def not_modified(method, url, headers, data, file):
+            self.assertEqual(headers['If-None-Match'], '"abc"')
+            raise HTTPError(url, 304, 'Not Modified', {}, None)
+
+        ttl = Cache.PATTERNS[r'/source/([^/]+)/_meta$']
+        revalidated = Cache.stats['revalidated']
+        try:
+            Cache.PATTERNS[r'/source/([^/]+)/_meta$'] = -1
+            with mock.patch('osc.core._http_request', not_modified, create=True):
+                self.assertEqual(http_request('GET', url).read(), b'<project/>')
+        finally:
+            Cache.PATTERNS[r'/source/([^/]+)/_meta$'] = ttl
+
+        self.assertEqual(Cache.stats['revalidated'], revalidated + 1)
+        self.assertEqual(Cache.get(url).read(), b'<project/>')
+
+    def test_revalidate_modified(self):
+        url = f'{APIURL}/source/openSUSE:Factory/_meta'
+        self.put(url, b'<project/>', {'ETag': '"abc"'})
+
+        def modified(method, url, headers, data, file):
+            return BytesIOLike(b'<project title="new"/>', {'ETag': '"def"'})
+
+        ttl = Cache.PATTERNS[r'/source/([^/]+)/_meta$']
+        try:
+            Cache.PATTERNS[r'/source/([^/]+)/_meta$'] = -1
+            with mock.patch('osc.core._http_request', modified, create=True):
+                self.assertEqual(http_request('GET', url).read(), b'<project title="new"/>')
+        finally:
+            Cache.PATTERNS[r'/source/([^/]+)/_meta$'] = ttl
+
+        self.assertEqual(Cache.conditional_headers(url), {'If-None-Match': '"def"'})
+        self.assertEqual(Cache.get(url).read(), b'<project title="new"/>')
+
+    def test_threads(self):
+        url = f'{APIURL}/source/openSUSE:Factory/nano/_link'
+        bodies = [b'<link project="%d">' % i + b' ' * 100000 + b'</link>' for i in range(8)]
+        hit = Cache.stats['hit']
+
+        def work(i):
+            reads = []
+            for _ in range(20):
+                self.put(url, bodies[i], {'ETag': f'"{i}"'})
+                data = Cache.get(url)
+                if data is not None:
+                    reads.append(data.read())
+            return reads
+
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            reads = [body for result in executor.map(work, range(8)) for body in result]
+
+        # Never a partially written entry.
+        self.assertTrue(reads)
+        for body in reads:
+            self.assertIn(body, bodies)
+        self.assertEqual(Cache.stats['hit'], hit + len(reads))
+        self.assertIn(Cache.get(url).read(), bodies)
+
+    def test_last_updated_load_threads(self):
+        apiurl = 'http://latest.example.com'
+        Cache.last_updated.pop(apiurl, None)
+        latest_updated = b'<latest_updated><project name="openSUSE:Factory" updated="2024-05-02T10:00:00Z"/></latest_updated>'
+        with mock.patch('osc.core.http_GET', side_effect=lambda url: BytesIO(latest_updated)) as http_GET:
+            with ThreadPoolExecutor(max_workers=8) as executor:
+                list(executor.map(lambda _: Cache.last_updated_load(apiurl), range(8)))
+        self.assertEqual(http_GET.call_count, 1)
+        self.assertEqual(Cache.last_updated[apiurl]['openSUSE:Factory'], '2024-05-02T10:00:00Z')
+
+    def test_last_updated_packages(self):
+        latest_updated = BytesIO(b"""<latest_updated>
+            <package name="bash" project="openSUSE:Factory" updated="2024-05-03T10:00:00Z"/>
+            <project name="openSUSE:Factory" updated="2024-05-02T10:00:00Z"/>
+            <package name="bash" project="openSUSE:Factory" updated="2024-05-01T10:00:00Z"/>
+            <package name="vim" project="editors" updated="2024-04-30T10:00:00Z"/>
+        </latest_updated>""")
+        apiurl = 'http://latest.example.com'
+        Cache.last_updated.pop(apiurl, None)
+        with mock.patch('osc.core.http_GET', return_value=latest_updated):
+            Cache.last_updated_load(apiurl)
+
+        self.assertEqual(Cache.last_updated[apiurl], {
+            'openSUSE:Factory': '2024-05-03T10:00:00Z',
+            'editors': '2024-04-30T10:00:00Z',
+            '__oldest': '2024-04-30T10:00:00Z',
+        })
+        self.assertEqual(Cache.last_updated_packages[apiurl], {
+            ('openSUSE:Factory', 'bash'): '2024-05-03T10:00:00Z',
+            ('openSUSE:Factory', None): '2024-05-02T10:00:00Z',
+            ('editors', 'vim'): '2024-04-30T10:00:00Z',
+        })
+
+
+class TestCacheSQLite(TestCache):
+    backend = 'sqlite'
+
+
+class BytesIOLike(object):
+    """Mimic the non-seekable response returned by osc.core.http_request()."""
+
+    def __init__(self, text, headers=None):
+        self.text = text
+        self.headers = headers or {}
+
+    def read(self):
+        return self.text
@@ -0,0 +1,157 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from osclib.fileconflicts import FileIndex
+
+PACKAGES = """\
+=Ver: 2.0
+=Pkg: filesystem 1 1 x86_64
++Flx:
+40755 0 root:root /usr
+40755 0 root:root /usr/bin
+40755 0 root:root /usr/lib
+120777 0 root:root /bin -> usr/bin
+120777 0 root:root /lib -> usr/lib
+-Flx:
++Prv:
+filesystem = 1-1
+-Prv:
+=Pkg: foo 1 1 x86_64
++Flx:
+100755 0 root:root /bin/foo
+100644 0 root:root /etc/foo.conf
+40755 0 root:root /usr/share/foo
+100644 0 root:root /usr/share/foo/data
+100644 0 root:root /opt/thing
+-Flx:
++Prv:
+foo = 1-1
+-Prv:
+=Pkg: bar 1 1 x86_64
++Flx:
+100755 0 root:root /usr/bin/foo
+100600 0 root:root /etc/foo.conf
+100644 0 root:root /usr/share/foo
+40755 0 root:root /opt/thing
+100644 0 root:root /opt/thing/x
+120777 0 root:root /usr/lib/libx.so -> libx.so.1
+-Flx:
++Prv:
+bar = 1-1
+-Prv:
+=Pkg: baz 1 1 x86_64
++Flx:
+100755 0 root:root /usr/bin/foo
+120777 0 root:root /usr/lib/libx.so -> libx.so.2
+100644 100 root:root /var/ghost
+40755 100 root:root /var/ghostdir
+-Flx:
++Prv:
+baz = 1-1
+-Prv:
++Con:
+bar < 2
+-Con:
+=Pkg: qux 1 1 x86_64
++Flx:
+100755 0 root:root /usr/bin/foo
+100644 0 root:root /var/ghost
+20644 0 root:root /var/ghostdir
+-Flx:
++Obs:
+foo
+-Obs:
+=Pkg: lib-32bit 1 1 x86_64
++Flx:
+100644 0 root:root /usr/lib/libz.so.1
+-Flx:
+=Pkg: lib 1 1 i586
++Flx:
+100644 0 root:root /usr/lib/libz.so.1
+-Flx:
++Prv:
+lib = 1
+-Prv:
+=Pkg: multi 1 1 x86_64
++Flx:
+100644 0 root:root /usr/share/multi
+-Flx:
+=Pkg: multi 1 1 i586
++Flx:
+100644 0 root:root /usr/share/multi
+-Flx:
+"""
+
+CONFLICTS = [
+    {'between': [['bar', '1', '1', 'x86_64'], ['foo', '1', '1', 'x86_64']], 'conflicts': '/usr/bin/foo'},
+    {'between': [['bar', '1', '1', 'x86_64'], ['qux', '1', '1', 'x86_64']], 'conflicts': '/usr/bin/foo'},
+    {'between': [['baz', '1', '1', 'x86_64'], ['foo', '1', '1', 'x86_64']], 'conflicts': '/usr/bin/foo'},
+    {'between': [['baz', '1', '1', 'x86_64'], ['qux', '1', '1', 'x86_64']], 'conflicts': '/usr/bin/foo'},
+    {'between': [['bar', '1', '1', 'x86_64'], ['foo', '1', '1', 'x86_64']],
+     'conflicts': '/etc/foo.conf\n'
+                  '/usr/share/foo [mode mismatch: -644 root:root, d755 root:root]\n'
+                  '/opt/thing [mode mismatch: d755 root:root, -644 root:root]'},
+    {'between': [['baz', '1', '1', 'x86_64'], ['qux', '1', '1', 'x86_64']],
+     'conflicts': '/var/ghost [mode mismatch: g -644 root:root, -644 root:root]\n'
+                  '/var/ghostdir [mode mismatch: d755 root:root, c644 root:root]'},
+]
+
+IMPLICIT = """\
+=Pkg: a 1 1 noarch
++Flx:
+100644 0 root:root /srv/data
+-Flx:
+=Pkg: b 1 1 noarch
++Flx:
+100644 0 root:root /srv/data/x/y
+-Flx:
+=Pkg: c 1 1 noarch
++Flx:
+100644 0 root:root /srv/other/z
+120777 0 root:root /srv/link -> other
+-Flx:
+=Pkg: d 1 1 noarch
++Flx:
+100644 0 root:root /srv/link/w
+-Flx:
+"""
+
+
+def index(packages):
+    index = FileIndex()
+    index.update(packages.splitlines())
+    return index
+
+
+class TestFileConflicts(unittest.TestCase):
+    # Expected results are those of the findfileconflicts script.
+
+    def test_conflicts(self):
+        self.assertEqual(index(PACKAGES).conflicts(), CONFLICTS)
+
+    def test_implicit_directories(self):
+        self.assertEqual(index(IMPLICIT).conflicts(), [
+            {'between': [['a', '1', '1', 'noarch'], ['b', '1', '1', 'noarch']],
+             'conflicts': '/srv/data [mode mismatch: -644 root:root, d755 root:root]'},
+            {'between': [['c', '1', '1', 'noarch'], ['d', '1', '1', 'noarch']],
+             'conflicts': '/srv/link [mode mismatch: l777 root:root -> other, d755 root:root]'},
+        ])
+
+    def test_update(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, 'index')
+        index(PACKAGES).save(path)
+
+        # Drop bar and change baz to no longer contain /usr/bin/foo, which
+        # foo and qux only share because qux obsoletes foo.
+        packages = PACKAGES.split('=Pkg: bar')[0] + '=Pkg: baz' + PACKAGES.split('=Pkg: baz')[1]
+        packages = packages.replace('100755 0 root:root /usr/bin/foo\n120777', '120777')
+
+        updated = FileIndex.load(path)
+        updated.update(packages.splitlines())
+        self.assertNotIn('bar 1 1 x86_64', updated.packages)
+        self.assertEqual(updated.conflicts(), index(packages).conflicts())
+        self.assertEqual(updated.conflicts(), [CONFLICTS[5]])
@@ -0,0 +1,116 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from osclib.headerstore import HeaderStore
+
+MD5_BASH = 'a' * 32
+MD5_VIM = 'b' * 32
+MD5_ZSH = 'c' * 32
+
+
+class TestHeaderStore(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def files(self):
+        return sorted(os.listdir(self.directory))
+
+    def test_add_remove(self):
+        store = HeaderStore(self.directory)
+        store.add(MD5_BASH, 'bash-5.2-1.1.x86_64', b'bash header')
+        store.add(MD5_VIM, 'vim-9.0-1.1.x86_64', b'vim header')
+        store.remove(MD5_BASH)
+        store.add(MD5_ZSH, 'zsh-5.9-1.1.x86_64', b'zsh header')
+
+        for store in (store, HeaderStore(self.directory)):
+            self.assertEqual(sorted(store), [MD5_VIM, MD5_ZSH])
+            self.assertNotIn(MD5_BASH, store)
+            self.assertEqual(store.read(MD5_VIM), b'vim header')
+            self.assertEqual(store.read(MD5_ZSH), b'zsh header')
+            self.assertEqual(store.entries[MD5_ZSH].filename, 'zsh-5.9-1.1.x86_64.rpm')
+            self.assertEqual(store.dead, len(b'bash header'))
+            self.assertFalse(store.needs_compaction())
+
+    def test_replace(self):
+        store = HeaderStore(self.directory)
+        store.add(MD5_BASH, 'bash-5.2-1.1.x86_64', b'bash header')
+        store.add(MD5_BASH, 'bash-5.2-1.1.x86_64', b'new bash header')
+
+        store = HeaderStore(self.directory)
+        self.assertEqual(store.read(MD5_BASH), b'new bash header')
+        self.assertEqual(store.dead, len(b'bash header'))
+
+    def test_compact(self):
+        store = HeaderStore(self.directory)
+        store.add(MD5_BASH, 'bash', b'bash header')
+        store.add(MD5_VIM, 'vim', b'vim header')
+        store.add(MD5_ZSH, 'zsh', b'zsh header')
+        store.remove(MD5_BASH)
+        store.remove(MD5_ZSH)
+        self.assertTrue(store.needs_compaction())
+
+        store.compact()
+        self.assertEqual(store.generation, 1)
+        self.assertEqual(store.dead, 0)
+        self.assertEqual(self.files(), ['headers.1.pack', 'headers.idx'])
+        self.assertEqual(os.path.getsize(store.pack_path), len(b'vim header'))
+
+        store.add(MD5_ZSH, 'zsh', b'zsh header')
+        for store in (store, HeaderStore(self.directory)):
+            self.assertEqual(store.generation, 1)
+            self.assertEqual(sorted(store), [MD5_VIM, MD5_ZSH])
+            self.assertEqual(store.read(MD5_VIM), b'vim header')
+            self.assertEqual(store.read(MD5_ZSH), b'zsh header')
+            self.assertEqual(store.dead, 0)
+
+    def test_interrupted_compact(self):
+        store = HeaderStore(self.directory)
+        store.add(MD5_BASH, 'bash', b'bash header')
+        store.add(MD5_VIM, 'vim', b'vim header')
+        store.remove(MD5_BASH)
+        # Index of the next generation not yet switched to.
+        with open(os.path.join(self.directory, 'headers.1.pack'), 'wb') as f:
+            f.write(b'vim')
+        with open(store.index_path + '.new', 'w') as f:
+            f.write(f'= 1\n+ {MD5_VIM} vim 0 10\n')
+
+        store = HeaderStore(self.directory)
+        self.assertEqual(store.generation, 0)
+        self.assertEqual(list(store), [MD5_VIM])
+        self.assertEqual(store.read(MD5_VIM), b'vim header')
+
+        store.compact()
+        store = HeaderStore(self.directory)
+        self.assertEqual(store.generation, 1)
+        self.assertEqual(store.read(MD5_VIM), b'vim header')
+        self.assertEqual(self.files(), ['headers.1.pack', 'headers.idx'])
+
+    def test_interrupted_add(self):
+        store = HeaderStore(self.directory)
+        store.add(MD5_BASH, 'bash', b'bash header')
+        store.add(MD5_VIM, 'vim', b'vim header')
+        # Pack not flushed and last index line only partly written.
+        with open(store.pack_path, 'r+b') as f:
+            f.truncate(len(b'bash header') + 3)
+        with open(store.index_path, 'a') as f:
+            f.write(f'+ {MD5_ZSH} zsh')
+
+        with self.assertLogs('HeaderStore', 'WARNING'):
+            store = HeaderStore(self.directory)
+        self.assertEqual(list(store), [MD5_BASH])
+        self.assertEqual(store.read(MD5_BASH), b'bash header')
+
+    def test_export(self):
+        store = HeaderStore(self.directory)
+        store.add(MD5_BASH, 'bash', b'bash header')
+        store.add(MD5_VIM, 'vim', b'vim header')
+
+        destdir = os.path.join(self.directory, 'export')
+        os.mkdir(destdir)
+        paths = store.export([MD5_VIM], destdir)
+        self.assertEqual(paths, {MD5_VIM: os.path.join(destdir, f'{MD5_VIM}-vim.rpm')})
+        with open(paths[MD5_VIM], 'rb') as f:
+            self.assertEqual(f.read(), b'vim header')
@@ -0,0 +1,145 @@
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+from osclib import memoize as memoize_module
+from osclib.memoize import MemoizeStore
+from osclib.memoize import memoize
+
+
+class TestMemoizeStore(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.path = os.path.join(self.directory, 'store.sqlite')
+
+    def store(self, ttl=3600, slots=4, nclean=2):
+        return MemoizeStore(self.path, ttl, slots, nclean)
+
+    def keys(self, store):
+        return sorted(row[0] for row in store.connection.execute('SELECT key FROM memoize'))
+
+    def test_get_set(self):
+        store = self.store()
+        self.assertIsNone(store.get('a'))
+        store.set('a', 1.0, {'value': [1]})
+        self.assertEqual(store.get('a'), (1.0, {'value': [1]}))
+        store.delete('a')
+        self.assertIsNone(store.get('a'))
+
+    def test_eviction(self):
+        store = self.store()
+        for i, key in enumerate('abc'):
+            store.set(key, 1000.0 + i, key)
+        self.assertEqual(store.count, 3)
+
+        # Reaching the slots removes the nclean oldest entries.
+        store.set('d', 1003.0, 'd')
+        self.assertEqual(self.keys(store), ['c', 'd'])
+        self.assertEqual(store.count, 2)
+
+        # Replacing only counts towards the limit until recounted.
+        store.set('c', 1004.0, 'c')
+        store.set('c', 1005.0, 'c')
+        self.assertEqual(self.keys(store), ['c', 'd'])
+        self.assertEqual(store.count, 2)
+
+    def test_expired_on_open(self):
+        store = self.store()
+        store.set('old', 1.0, 'old')
+        store.set('new', 2e10, 'new')
+
+        store = self.store()
+        self.assertEqual(self.keys(store), ['new'])
+        self.assertEqual(store.count, 1)
+
+    def test_reopen(self):
+        store = self.store()
+        store.set('a', 2e10, 'a')
+        store.set('b', 2e10, 'b')
+
+        store = self.store()
+        self.assertEqual(store.get('a'), (2e10, 'a'))
+        self.assertEqual(store.count, 2)
+        store.clear()
+        self.assertEqual(store.count, 0)
+        self.assertIsNone(self.store().get('b'))
+
+    def test_threads(self):
+        store = self.store(slots=100)
+        store.set('main', 2e10, 'main')
+
+        def work(i):
+            store.set(str(i), 2e10, i)
+            results[i] = store.get('main')
+
+        results = {}
+        threads = [threading.Thread(target=work, args=(i,)) for i in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(results, {i: (2e10, 'main') for i in range(4)})
+        self.assertEqual(self.keys(store), ['0', '1', '2', '3', 'main'])
+
+
+class TestMemoize(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        patcher = mock.patch.object(memoize_module, 'CACHEDIR', self.directory)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.calls = 0
+
+    def compute(self, a):
+        self.calls += 1
+        return [a, self.calls]
+
+    def test_ttl(self):
+        cached = memoize(ttl=60)(self.compute)
+        with mock.patch('osclib.memoize.time', return_value=1000.0):
+            self.assertEqual(cached(1), [1, 1])
+            self.assertEqual(cached(1), [1, 1])
+            self.assertEqual(cached(2), [2, 2])
+        with mock.patch('osclib.memoize.time', return_value=1059.0):
+            self.assertEqual(cached(1), [1, 1])
+        with mock.patch('osclib.memoize.time', return_value=1061.0):
+            self.assertEqual(cached(1), [1, 3])
+        self.assertTrue(os.path.exists(os.path.join(self.directory, 'compute.sqlite')))
+
+    def test_invalidate(self):
+        class Lookup(object):
+            def __str__(self):
+                return 'lookup'
+
+            @memoize(add_invalidate=True)
+            def compute(_self, a):
+                return self.compute(a)
+
+        lookup = Lookup()
+        self.assertEqual(lookup.compute(1), [1, 1])
+        self.assertEqual(lookup.compute(2), [2, 2])
+        self.assertEqual(lookup.compute(1), [1, 1])
+
+        lookup._invalidate_compute(1)
+        self.assertEqual(lookup.compute(1), [1, 3])
+        self.assertEqual(lookup.compute(2), [2, 2])
+
+        lookup._invalidate_all()
+        self.assertEqual(lookup.compute(2), [2, 4])
+
+    def test_session(self):
+        @memoize(session=True)
+        def cached(a):
+            return self.compute(a)
+
+        self.assertEqual(cached(1), [1, 1])
+        self.assertEqual(cached(1), [1, 1])
+        memoize_module.memoize_session_reset()
+        self.assertEqual(cached(1), [1, 2])
+        self.assertFalse(os.listdir(self.directory))
@@ -0,0 +1,339 @@
+import copy
+import os
+import shutil
+import tempfile
+import unittest
+from datetime import datetime
+from unittest import mock
+
+from lxml import etree as ET
+
+import metrics_release  # noqa: F401 metrics must be imported after it.
+import metrics
+from metrics import Point
+from metrics_requests import RequestStore
+
+PROJECT = 'openSUSE:Factory'
+
+
+def request_xml(request_id, created, final, state='accepted'):
+    return ET.fromstring(f"""<request id="{request_id}">
+  <action type="submit"/>
+  <state name="{state}" who="user" when="{final}"/>
+  <history who="user" when="{created}"><description>Request created</description></history>
+  <history who="user" when="{final}"><description>Request got {state}</description></history>
+</request>""")
+
+
+def when(value):
+    return metrics.timestamp(metrics.parse_when(value))
+
+
+def start(value):
+    "Start of the points deleted by walk_points() since value."
+    return datetime.utcfromtimestamp(when(value)).isoformat() + 'Z'
+
+
+class FakeClient(object):
+    "Records the deletes and writes of walk_points()."
+
+    def __init__(self):
+        self.deletes = []
+        self.writes = []
+
+    def delete_api(self):
+        return mock.Mock(delete=lambda **kwargs: self.deletes.append(kwargs))
+
+    def write_api(self, write_options):
+        return mock.Mock(write=lambda bucket, record, write_precision: self.writes.extend(copy.deepcopy(record)))
+
+    def points(self, measurement):
+        return [(point['time'], point['fields']) for point in self.writes if point['measurement'] == measurement]
+
+
+class TestRequestStore(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.path = os.path.join(self.directory, 'store', 'requests.sqlite')
+
+    def test_store(self):
+        with RequestStore(self.path) as store:
+            self.assertEqual(store.high_water(), 0)
+            self.assertTrue(store.changed(1, '2024-01-02T00:00:00'))
+            store.put(3, '2024-01-02T00:00:00', request_xml(3, '2024-01-01T00:00:00', '2024-01-02T00:00:00'),
+                      [['total', {}, {'open': 1}, 10, True]])
+            store.put(1, '2024-01-03T00:00:00', request_xml(1, '2024-01-01T00:00:00', '2024-01-03T00:00:00'),
+                      [['request', {}, {'total': 1}, 20, False]])
+            store.commit()
+
+        with RequestStore(self.path) as store:
+            self.assertEqual(store.high_water(), 3)
+            self.assertFalse(store.changed(3, '2024-01-02T00:00:00'))
+            self.assertTrue(store.changed(3, '2024-01-04T00:00:00'))
+            self.assertEqual(sorted(store.points()), [
+                ['request', {}, {'total': 1}, 20, False], ['total', {}, {'open': 1}, 10, True]])
+            self.assertEqual(list(store.outdated()), [])
+
+    def test_outdated(self):
+        with RequestStore(self.path) as store:
+            store.put(1, '2024-01-02T00:00:00', request_xml(1, '2024-01-01T00:00:00', '2024-01-02T00:00:00'), [])
+            store.commit()
+
+        with mock.patch.object(RequestStore, 'VERSION', RequestStore.VERSION + 1), RequestStore(self.path) as store:
+            self.assertTrue(store.changed(1, '2024-01-02T00:00:00'))
+            outdated = list(store.outdated())
+            self.assertEqual([request_id for request_id, _ in outdated], [1])
+            self.assertEqual(outdated[0][1].find('state').get('when'), '2024-01-02T00:00:00')
+
+            store.put(1, '2024-01-02T00:00:00', outdated[0][1], [])
+            self.assertEqual(list(store.outdated()), [])
+            self.assertFalse(store.changed(1, '2024-01-02T00:00:00'))
+
+    def test_meta(self):
+        with RequestStore(self.path) as store:
+            self.assertIsNone(store.meta_get('fetched'))
+            store.meta_set('fetched', '2024-01-01T00:00:00')
+            store.meta_set('unwritten', '10')
+            store.meta_set('unwritten', None)
+
+        with RequestStore(self.path) as store:
+            self.assertEqual(store.meta_get('fetched'), '2024-01-01T00:00:00')
+            self.assertIsNone(store.meta_get('unwritten'))
+
+
+class TestIngestRequests(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.store = RequestStore(os.path.join(self.directory, 'requests.sqlite'))
+        self.addCleanup(self.store.close)
+        self.requests = []
+        self.queries = []
+        patcher = mock.patch('metrics.search_paginated_generator', side_effect=self.search)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def search(self, apiurl, queries, request):
+        self.queries.append(request)
+        return list(self.requests)
+
+    def ingest(self):
+        client = FakeClient()
+        with mock.patch('sys.stdout'):
+            wrote = metrics.ingest_requests(client, mock.Mock(), PROJECT, self.store)
+        return client, wrote
+
+    def test_ingest(self):
+        self.requests = [
+            request_xml(1, '2024-01-01T00:00:00', '2024-01-03T00:00:00'),
+            request_xml(2, '2024-01-02T00:00:00', '2024-01-05T00:00:00'),
+        ]
+        client, wrote = self.ingest()
+        self.assertNotIn('@id>', self.queries[0])
+        self.assertEqual(client.points('total'), [
+            (when('2024-01-01T00:00:00'), {'backlog': 1, 'open': 1}),
+            (when('2024-01-02T00:00:00'), {'backlog': 2, 'open': 2}),
+            (when('2024-01-03T00:00:00'), {'backlog': 1, 'open': 1}),
+            (when('2024-01-05T00:00:00'), {'backlog': 0, 'open': 0}),
+        ])
+        self.assertEqual(wrote, 6)
+        self.assertEqual({delete['start'] for delete in client.deletes}, {'1970-01-01T00:00:00Z'})
+        self.assertIsNotNone(self.store.meta_get('fetched'))
+        self.assertIsNone(self.store.meta_get('unwritten'))
+
+        # Only the changed request 2 and the new request 3 are ingested.
+        self.requests = [
+            request_xml(1, '2024-01-01T00:00:00', '2024-01-03T00:00:00'),
+            request_xml(2, '2024-01-02T00:00:00', '2024-01-04T00:00:00', 'revoked'),
+            request_xml(3, '2024-01-06T00:00:00', '2024-01-07T00:00:00'),
+        ]
+        with mock.patch('metrics.ingest_request', wraps=metrics.ingest_request) as ingest_request:
+            client, wrote = self.ingest()
+        self.assertEqual([call.args[2].id for call in ingest_request.call_args_list], ['2', '3'])
+        self.assertIn(f"@id>2 or state/@when>='{self.store.meta_get('fetched')}'", self.queries[1])
+
+        # Earlier deltas are added up but only points from the earliest change are replaced.
+        since = when('2024-01-02T00:00:00')
+        self.assertEqual({delete['start'] for delete in client.deletes}, {start('2024-01-02T00:00:00')})
+        self.assertEqual(client.points('total'), [
+            (since, {'backlog': 2, 'open': 2}),
+            (when('2024-01-03T00:00:00'), {'backlog': 1, 'open': 1}),
+            (when('2024-01-04T00:00:00'), {'backlog': 0, 'open': 0}),
+            (when('2024-01-06T00:00:00'), {'backlog': 1, 'open': 1}),
+            (when('2024-01-07T00:00:00'), {'backlog': 0, 'open': 0}),
+        ])
+        self.assertTrue(all(point['time'] >= since for point in client.writes))
+        self.assertEqual(wrote, len(client.writes))
+
+        # Nothing changed so nothing is written.
+        client, wrote = self.ingest()
+        self.assertEqual(wrote, 0)
+        self.assertEqual(client.writes, [])
+
+    def test_version(self):
+        self.requests = [request_xml(1, '2024-01-01T00:00:00', '2024-01-03T00:00:00')]
+        self.ingest()
+        self.requests = []
+        with mock.patch.object(RequestStore, 'VERSION', RequestStore.VERSION + 1):
+            client, wrote = self.ingest()
+        self.assertEqual(wrote, 3)
+        self.assertEqual({delete['start'] for delete in client.deletes}, {start('2024-01-01T00:00:00')})
+
+    def test_interrupted(self):
+        self.requests = [request_xml(1, '2024-01-01T00:00:00', '2024-01-03T00:00:00')]
+        self.ingest()
+        self.requests = [request_xml(2, '2024-01-02T00:00:00', '2024-01-05T00:00:00')]
+        with mock.patch('metrics.walk_points', side_effect=RuntimeError('influxdb gone')):
+            with self.assertRaises(RuntimeError):
+                self.ingest()
+        self.assertEqual(self.store.meta_get('unwritten'), str(when('2024-01-02T00:00:00')))
+
+        # The next run writes the points although the request is unchanged.
+        client, wrote = self.ingest()
+        self.assertEqual([time for time, _ in client.points('request')],
+                         [when('2024-01-03T00:00:00'), when('2024-01-05T00:00:00')])
+        self.assertEqual({delete['start'] for delete in client.deletes}, {start('2024-01-02T00:00:00')})
+        self.assertIsNone(self.store.meta_get('unwritten'))
+
+
+class TestWalkPoints(unittest.TestCase):
+    def test_since(self):
+        points = [
+            Point('total', {}, {'open': 1}, 10, True),
+            Point('request', {}, {'total': 5}, 15, False),
+            Point('total', {}, {'open': 1}, 20, True),
+            Point('total', {}, {'open': 1}, 20, True),
+            Point('request', {}, {'total': 7}, 20, False),
+            Point('staging', {'id': 'A'}, {'count': 1}, 25, True),
+            Point('staging', {'id': 'B'}, {'count': 1}, 25, True),
+            Point('total', {}, {'open': -1}, 30, True),
+        ]
+        client = FakeClient()
+        wrote = metrics.walk_points(client, points, PROJECT, since=20)
+
+        # Points at the same time are merged and the earlier delta is added.
+        self.assertEqual(client.points('total'), [(20, {'open': 3}), (30, {'open': 2})])
+        self.assertEqual(client.points('request'), [(20, {'total': 7})])
+        self.assertEqual(client.points('staging'), [(25, {'count': 1}), (25, {'count': 1})])
+        self.assertEqual(wrote, 5)
+        self.assertEqual(sorted(delete['predicate'] for delete in client.deletes), [
+            '_measurement="request"', '_measurement="staging"', '_measurement="total"'])
+        self.assertEqual({(delete['start'], delete['bucket']) for delete in client.deletes},
+                         {('1970-01-01T00:00:20Z', PROJECT)})
+
+
+class TestPointsSorted(unittest.TestCase):
+    def points(self):
+        # Many ties, within and across runs, identified by the index field.
+        times = [5, 3, 5, 1, 3, 5, 2, 1, 4, 3, 5, 2, 1, 3, 4, 5, 1]
+        return [Point('total', {}, {'index': index}, time, True) for index, time in enumerate(times)]
+
+    def test_in_memory(self):
+        expected = sorted(self.points(), key=lambda point: point.time)
+        self.assertEqual(metrics.points_sorted(self.points()), expected)
+
+    def test_spilled(self):
+        expected = sorted(self.points(), key=lambda point: point.time)
+        for run_size in (1, 2, 3, 4, 16, 17):
+            with mock.patch.object(metrics, 'POINTS_SPILL_CHUNK', 2):
+                self.assertEqual(list(metrics.points_sorted(self.points(), run_size)), expected, run_size)
+
+    def test_spill_load(self):
+        run = self.points()[:5]
+        self.assertEqual(list(metrics.points_load(metrics.points_spill(run))),
+                         sorted(self.points()[:5], key=lambda point: point.time))
+
+    def test_empty(self):
+        self.assertEqual(list(metrics.points_sorted([], 2)), [])
+
+
+class TestIngestRequest(unittest.TestCase):
+    def setUp(self):
+        for patcher in (mock.patch.object(metrics, 'points', []),
+                        mock.patch.object(metrics, 'who_workaround_swap', 0, create=True),
+                        mock.patch.object(metrics, 'who_workaround_miss', 0, create=True)):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+        self.api = mock.Mock(is_adi_project=lambda project: ':adi:' in project,
+                             extract_staging_short=lambda project: project.split(':Staging:')[1])
+        with open(os.path.join(os.path.dirname(__file__), 'fixtures', 'metrics', 'request.xml'), 'rb') as f:
+            self.request = ET.parse(f).getroot()
+
+    def test_record(self):
+        record = metrics.request_record(self.request)
+        self.assertEqual((record.id, record.type, record.state_when, record.priority),
+                         ('4242', 'submit', '2024-03-10T12:00:00', 'important'))
+        self.assertEqual([review.attributes.get('by_project') for review in record.reviews],
+                         [None, None, 'openSUSE:Factory:Staging:adi:12', 'openSUSE:Factory:Staging:B',
+                          'openSUSE:Factory:Staging:C'])
+        self.assertEqual(record.reviews[2].history, [
+            metrics.HistoryRecord('2024-03-03T09:00:00', 'staging-bot', 'ready to accept', 'Review got accepted')])
+        self.assertEqual(record.reviews[4].history, [])
+        self.assertEqual(record.history[2], metrics.HistoryRecord(
+            '2024-03-04T00:00:00', 'dimstar', 'Needed for the next snapshot',
+            'Request got a new priority: moderate => important'))
+
+    def test_points(self):
+        metrics.ingest_request(self.api, PROJECT, metrics.request_record(self.request))
+
+        def p(measurement, tags, fields, time, delta):
+            return Point(measurement, tags, fields, when(time), delta)
+
+        request_tags = {'type': 'adi', 'whitelisted': False}
+        staging_tags = {'state': 'accepted', 'who_completed': 'dimstar', 'key': ['factory-staging'],
+                        'type': 'group', 'by_group': 'factory-staging'}
+        user_tags = {'state': 'accepted', 'who_completed': 'licensedigger', 'key': ['licensedigger'],
+                     'type': 'user', 'by_user': 'licensedigger'}
+        self.assertEqual(metrics.points, [
+            p('total', {'event': 'create'}, {'backlog': 1, 'open': 1}, '2024-03-01T10:00:00', True),
+            p('total', {'event': 'close'}, {'backlog': -1, 'open': -1}, '2024-03-10T12:00:00', True),
+            p('ready', {}, {'count': 1}, '2024-03-03T09:00:00', True),
+            p('ready', {}, {'count': -1}, '2024-03-10T12:00:00', True),
+            p('request_staged_first', request_tags, {'value': 79200.0}, '2024-03-02T08:00:00', False),
+            p('request', request_tags, {'total': 784800.0, 'staged_count': 1, 'ready': 615600.0,
+                                        'staged_first': 79200.0}, '2024-03-10T12:00:00', False),
+            # Staged in adi:12 by the user of the exact history match.
+            p('staging', {'id': 'adi:12', 'type': 'adi', 'event': 'select'}, {'count': 1},
+              '2024-03-02T08:00:00', True),
+            p('total', {'event': 'select'}, {'backlog': -1, 'staged': 1}, '2024-03-02T08:00:00', True),
+            p('user', dict(request_tags, event='select', user='dimstar', number=1), {'count': 1},
+              '2024-03-02T08:00:00', False),
+            p('staging', {'id': 'adi:12', 'type': 'adi', 'event': 'unselect'}, {'count': -1},
+              '2024-03-03T09:00:00', True),
+            p('total', {'event': 'unselect'}, {'backlog': 1, 'staged': -1}, '2024-03-03T09:00:00', True),
+            # Staged in B by the user of the match without seconds.
+            p('staging', {'id': 'B', 'type': 'letter', 'event': 'select'}, {'count': 1},
+              '2024-03-05T10:00:30', True),
+            p('total', {'event': 'select'}, {'backlog': -1, 'staged': 1}, '2024-03-05T10:00:30', True),
+            p('user', dict(request_tags, event='select', user='anna', number=2), {'count': 1},
+              '2024-03-05T10:00:30', False),
+            p('staging', {'id': 'B', 'type': 'letter', 'event': 'unselect'}, {'count': -1},
+              '2024-03-05T20:00:00', True),
+            p('total', {'event': 'unselect'}, {'backlog': 1, 'staged': -1}, '2024-03-05T20:00:00', True),
+            # Staged in C without history falling back to the reviewer, unselected when accepted.
+            p('staging', {'id': 'C', 'type': 'letter', 'event': 'select'}, {'count': 1},
+              '2024-03-06T00:00:00', True),
+            p('total', {'event': 'select'}, {'backlog': -1, 'staged': 1}, '2024-03-06T00:00:00', True),
+            p('user', dict(request_tags, event='select', user='staging-bot', number=3), {'count': 1},
+              '2024-03-06T00:00:00', False),
+            p('staging', {'id': 'C', 'type': 'letter', 'event': 'unselect'}, {'count': -1},
+              '2024-03-10T12:00:00', True),
+            p('total', {'event': 'unselect'}, {'backlog': 1, 'staged': -1}, '2024-03-10T12:00:00', True),
+            p('review', staging_tags, {'open_for': 79200.0}, '2024-03-02T08:00:00', False),
+            p('review_count', staging_tags, {'count': 1}, '2024-03-01T10:00:00', True),
+            p('review_count', staging_tags, {'count': -1}, '2024-03-02T08:00:00', True),
+            p('review', user_tags, {'open_for': 3600.0}, '2024-03-01T11:00:00', False),
+            p('review_count', user_tags, {'count': 1}, '2024-03-01T10:00:00', True),
+            p('review_count', user_tags, {'count': -1}, '2024-03-01T11:00:00', True),
+            p('priority', {'level': 'important'}, {'count': 1}, '2024-03-04T00:00:00', True),
+            p('priority', {'level': 'important'}, {'count': -1}, '2024-03-10T12:00:00', True),
+        ])
+        self.assertEqual(metrics.who_workaround_swap, 2)
+        self.assertEqual(metrics.who_workaround_miss, 1)
+
+    def test_not_stageable(self):
+        self.request.find('action').set('type', 'maintenance_incident')
+        metrics.ingest_request(self.api, PROJECT, metrics.request_record(self.request))
+        self.assertEqual(metrics.points, [])
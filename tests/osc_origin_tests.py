@@ -0,0 +1,144 @@
+import importlib.util
+import os
+import shutil
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+import yaml
+
+from osclib.cache import Cache
+
+APIURL = 'https://api.example.com'
+PROJECT = 'openSUSE:Leap:16.0'
+ORIGINS = ['SUSE:SLFO:Main', 'openSUSE:Factory']
+
+spec = importlib.util.spec_from_file_location(
+    'osc_origin', os.path.join(os.path.dirname(__file__), '..', 'osc-origin.py'))
+osc_origin = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(osc_origin)
+
+
+def timestamp(seconds):
+    return time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(seconds))
+
+
+class TestOriginLookupIncremental(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.now = time.time()
+        # Generated a day ago.
+        self.generated = self.now - 60 * 60 * 24
+        self.packages = ['bash', 'gcc', 'vim', 'zsh']
+        self.last_updated = [
+            ('openSUSE:Factory', 'vim', self.now - 60),
+            ('home:user', 'bash', self.generated - 60 * 60),
+            ('openSUSE:Factory', None, self.generated - 60 * 60),
+        ]
+        self.oldest = self.now - 60 * 60 * 24 * 7
+        self.recomputed = []
+        Cache.last_updated.pop(APIURL, None)
+        Cache.last_updated_packages.pop(APIURL, None)
+
+        module = osc_origin
+        for patcher in (
+            mock.patch.object(module, 'osrt_origin_lookup_file', side_effect=self.lookup_file),
+            mock.patch.object(module, 'osrt_origin_lookup_packages', side_effect=self.lookup_packages),
+            mock.patch.object(module, 'project_locked', return_value=False),
+            mock.patch.object(module, 'package_list_kind_filtered', side_effect=lambda *args: self.packages),
+            mock.patch.object(module, 'config_load', return_value={'origins': []}),
+            mock.patch.object(module, 'config_origin_list', return_value=ORIGINS + ['*~']),
+            mock.patch.object(Cache, 'last_updated_load', side_effect=self.last_updated_load),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+        self.write_lookup({
+            'bash': {'origin': 'openSUSE:Factory', 'revisions': [1]},
+            'gcc': {'origin': 'SUSE:SLFO:Main+', 'revisions': [2]},
+            'vim': {'origin': 'openSUSE:Factory', 'revisions': [3]},
+            'zsh': {'origin': 'SUSE:SLFO:Main', 'revisions': [4]},
+        })
+
+    def lookup_file(self, project, previous=False):
+        return os.path.join(self.directory, project + ('.previous' if previous else '') + '.yaml')
+
+    def lookup_packages(self, apiurl, project, packages):
+        self.recomputed.append(list(packages))
+        return {package: {'origin': 'recomputed', 'revisions': []} for package in packages}
+
+    def last_updated_load(self, apiurl):
+        Cache.last_updated[apiurl] = {'__oldest': timestamp(self.oldest)}
+        Cache.last_updated_packages[apiurl] = {
+            (project, package): timestamp(updated) for project, package, updated in self.last_updated}
+
+    def write_lookup(self, lookup):
+        path = self.lookup_file(PROJECT)
+        with open(path, 'w') as f:
+            yaml.dump(lookup, f, default_flow_style=False)
+        os.utime(path, (self.generated, self.generated))
+
+    def lookup(self):
+        return osc_origin.osrt_origin_lookup(APIURL, PROJECT, force_refresh=True, quiet=True, incremental=True)
+
+    def test_updated_packages(self):
+        since = self.generated - osc_origin.OSRT_ORIGIN_LOOKUP_UPDATED_MARGIN
+        self.assertEqual(osc_origin.osrt_origin_updated_packages(APIURL, {PROJECT}, since), {'vim'})
+        # Older updates are covered.
+        self.assertEqual(osc_origin.osrt_origin_updated_packages(APIURL, {PROJECT}, self.oldest + 1),
+                         {'vim', 'bash'})
+        # Unless the project itself was updated.
+        self.assertIsNone(osc_origin.osrt_origin_updated_packages(APIURL, {'openSUSE:Factory'}, self.oldest + 1))
+        # Or latest_updated does not reach back far enough.
+        self.assertIsNone(osc_origin.osrt_origin_updated_packages(APIURL, {PROJECT}, self.oldest - 1))
+
+    def test_incremental(self):
+        self.packages = ['bash', 'fish', 'gcc', 'vim', 'zsh']
+        with mock.patch('sys.stderr'):
+            lookup = self.lookup()
+
+        # New, pending and updated packages are recomputed.
+        self.assertEqual(self.recomputed, [['fish', 'gcc', 'vim']])
+        self.assertEqual(lookup, {
+            'bash': {'origin': 'openSUSE:Factory', 'revisions': [1]},
+            'fish': {'origin': 'recomputed', 'revisions': []},
+            'gcc': {'origin': 'recomputed', 'revisions': []},
+            'vim': {'origin': 'recomputed', 'revisions': []},
+            'zsh': {'origin': 'SUSE:SLFO:Main', 'revisions': [4]},
+        })
+
+        # Timestamped with the start of the generation and kept as previous.
+        path = self.lookup_file(PROJECT)
+        self.assertGreaterEqual(os.stat(path).st_mtime, int(self.now))
+        self.assertEqual(osc_origin.osrt_origin_lookup_load(path), lookup)
+        self.assertEqual(osc_origin.osrt_origin_lookup_load(self.lookup_file(PROJECT, True))['vim'],
+                         {'origin': 'openSUSE:Factory', 'revisions': [3]})
+
+    def test_removed(self):
+        self.packages = ['bash', 'zsh']
+        with mock.patch('sys.stderr'):
+            lookup = self.lookup()
+        self.assertEqual(self.recomputed, [[]])
+        self.assertEqual(sorted(lookup), ['bash', 'zsh'])
+
+    def test_origin_updated(self):
+        self.last_updated.append(('SUSE:SLFO:Main', None, self.now - 60))
+        lookup = self.lookup()
+        self.assertEqual(self.recomputed, [self.packages])
+        self.assertEqual(set(entry['origin'] for entry in lookup.values()), {'recomputed'})
+
+    def test_oldest(self):
+        self.oldest = self.generated
+        self.lookup()
+        self.assertEqual(self.recomputed, [self.packages])
+
+    def test_flat(self):
+        self.write_lookup({'bash': 'openSUSE:Factory'})
+        self.lookup()
+        self.assertEqual(self.recomputed, [self.packages])
+
+    def test_not_incremental(self):
+        osc_origin.osrt_origin_lookup(APIURL, PROJECT, force_refresh=True, quiet=True)
+        self.assertEqual(self.recomputed, [self.packages])
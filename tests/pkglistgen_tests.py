@@ -0,0 +1,171 @@
+import hashlib
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+import solv
+
+from osc import conf
+from osclib.cache_manager import CacheManager
+from pkglistgen.group import Group
+from pkglistgen.tool import PkgListGen
+from pkglistgen.update_repo_handler import download_metadata
+from pkglistgen.update_repo_handler import metadata_cache_path
+
+ARCHS = ['aarch64', 'x86_64']
+
+# name: (requires, recommends)
+PACKAGES = {
+    'bash': (['libc'], ['bash-completion']),
+    'bash-completion': (['bash'], []),
+    'libc': ([], []),
+    'vim': (['libc', 'vim-data'], []),
+    'vim-data': ([], []),
+    'broken': (['missing'], []),
+}
+
+
+class TestPkgListGenSolve(unittest.TestCase):
+    def setUp(self):
+        conf.get_config(override_conffile=os.path.join(os.path.dirname(__file__), 'test.oscrc'),
+                        override_no_keyring=True)
+        self.directory = tempfile.mkdtemp()
+        self.cwd = os.getcwd()
+        os.chdir(self.directory)
+        for arch in ARCHS:
+            self.write_solv(f'repo-openSUSE:Factory-standard-{arch}-state.solv', arch)
+
+        patcher = mock.patch('pkglistgen.tool.repository_arch_state', return_value='state')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        shutil.rmtree(self.directory)
+
+    def write_solv(self, path, arch):
+        pool = solv.Pool()
+        repo = pool.add_repo('openSUSE:Factory')
+        for name, (requires, recommends) in PACKAGES.items():
+            solvable = repo.add_solvable()
+            solvable.name = name
+            solvable.evr = '1-1'
+            solvable.arch = arch
+            solvable.add_provides(pool.Dep(name))
+            for dep in requires:
+                solvable.add_requires(pool.Dep(dep))
+            for dep in recommends:
+                solvable.add_recommends(pool.Dep(dep))
+        repo.internalize()
+        fp = solv.xfopen(path, 'w')
+        repo.write(fp)
+        fp.close()
+
+    def solve(self, workers, batch=False, packages=None):
+        tool = PkgListGen()
+        tool.all_architectures = ARCHS
+        tool.filter_architectures(ARCHS)
+        tool.use_newest_version = False
+        tool.repos = [('openSUSE:Factory', 'standard')]
+        tool.solve_workers = workers
+        tool.batch_solve = batch
+
+        group = Group('base', tool)
+        group.parse_yml(packages or ['bash', 'vim', 'broken', 'nonexistent'])
+        group.solve(use_recommends=True)
+        return group
+
+    def test_parallel_matches_serial(self):
+        serial = self.solve(1)
+        parallel = self.solve(len(ARCHS))
+
+        self.assertIn('libc', serial.solved_packages['*'])
+        self.assertIn('broken', serial.unresolvable['x86_64'])
+        self.assertEqual(serial.not_found, {'nonexistent': set(ARCHS)})
+        for attribute in ['solved_packages', 'srcpkgs', 'recommends', 'suggested', 'unresolvable', 'not_found']:
+            self.assertEqual(getattr(serial, attribute), getattr(parallel, attribute), attribute)
+
+    def test_batch_matches_serial(self):
+        packages = ['bash', 'vim', 'nonexistent']
+        serial = self.solve(1, packages=packages)
+        batch = self.solve(1, batch=True, packages=packages)
+
+        self.assertEqual(batch.solved_packages['*']['vim-data'], 'base:vim')
+        for attribute in ['solved_packages', 'srcpkgs', 'recommends', 'not_found']:
+            self.assertEqual(getattr(serial, attribute), getattr(batch, attribute), attribute)
+
+    def test_batch_fallback(self):
+        # Problems are attributed by solving the packages one by one.
+        serial = self.solve(1)
+        batch = self.solve(1, batch=True)
+
+        self.assertIn('broken', batch.unresolvable['x86_64'])
+        for attribute in ['solved_packages', 'srcpkgs', 'recommends', 'unresolvable', 'not_found']:
+            self.assertEqual(getattr(serial, attribute), getattr(batch, attribute), attribute)
+
+    def test_pool_cache(self):
+        tool = PkgListGen()
+        tool.all_architectures = ARCHS
+        tool.filter_architectures(ARCHS)
+        tool.use_newest_version = False
+        tool.repos = [('openSUSE:Factory', 'standard')]
+
+        pool = tool.prepare_pool('x86_64', False)
+        self.assertIs(tool.prepare_pool('x86_64', False), pool)
+        self.assertIsNot(tool.prepare_pool('x86_64', True), pool)
+        self.assertIsNot(tool.prepare_pool('aarch64', False), pool)
+        self.assertIs(tool.prepare_pool('x86_64', False), pool)
+        self.assertEqual(len(tool.pools), 3)
+
+        # Changed locales replace the pool of the architecture.
+        tool.locales = {'de'}
+        locale_pool = tool.prepare_pool('x86_64', False)
+        self.assertIsNot(locale_pool, pool)
+        self.assertIs(tool.prepare_pool('x86_64', False), locale_pool)
+        self.assertEqual(len(tool.pools), 3)
+
+        # As does a repository state changed during the run.
+        self.write_solv('repo-openSUSE:Factory-standard-x86_64-changed.solv', 'x86_64')
+        with mock.patch('pkglistgen.tool.repository_arch_state', return_value='changed'):
+            changed_pool = tool.prepare_pool('x86_64', False)
+        self.assertIsNot(changed_pool, locale_pool)
+        self.assertEqual(sorted(key[:3] for key in tool.pools), [
+            ('aarch64', False, ('state',)), ('x86_64', False, ('changed',)), ('x86_64', True, ('state',))])
+
+
+class TestDownloadMetadata(unittest.TestCase):
+    URL = 'http://download.example.com/repodata/primary.xml.zst'
+    CONTENT = b'primary' * 1000
+
+    def setUp(self):
+        CacheManager.test = True
+        self.checksum = hashlib.sha256(self.CONTENT).hexdigest()
+        self.addCleanup(self.remove, metadata_cache_path('sha256', self.checksum))
+
+    def remove(self, path):
+        if os.path.exists(path):
+            os.unlink(path)
+
+    def get(self, content=CONTENT):
+        response = mock.MagicMock(status_code=200)
+        response.__enter__.return_value = response
+        response.iter_content.return_value = [content[i:i + 1000] for i in range(0, len(content), 1000)]
+        return mock.patch('requests.get', return_value=response)
+
+    def test_cached(self):
+        with self.get() as get:
+            with download_metadata(self.URL, 'sha256', self.checksum) as f:
+                self.assertEqual(f.read(), self.CONTENT)
+            with download_metadata(self.URL, 'sha256', self.checksum) as f:
+                self.assertEqual(f.read(), self.CONTENT)
+        self.assertEqual(get.call_count, 1)
+
+    def test_checksum_mismatch(self):
+        with self.get(b'corrupt'):
+            with self.assertRaises(Exception):
+                download_metadata(self.URL, 'sha256', self.checksum)
+        self.assertFalse(os.path.exists(metadata_cache_path('sha256', self.checksum)))
+        directory = os.path.dirname(metadata_cache_path('sha256', self.checksum))
+        self.assertEqual([f for f in os.listdir(directory) if self.checksum in f or f.startswith('.')], [])
@@ -0,0 +1,91 @@
+import importlib.util
+import os
+import time
+import unittest
+from datetime import datetime
+from io import BytesIO
+from unittest import mock
+
+import yaml
+
+PROJECT = 'openSUSE:Factory:Rings:1-MinimalX'
+ARCHS = ['aarch64', 'ppc64le', 's390x', 'x86_64']
+
+spec = importlib.util.spec_from_file_location(
+    'project_installcheck', os.path.join(os.path.dirname(__file__), '..', 'project-installcheck.py'))
+project_installcheck = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(project_installcheck)
+
+
+def result(url):
+    arch = url.split('arch=')[1]
+    return BytesIO(f"""<resultlist>
+  <result project="{PROJECT}" repository="standard" arch="{arch}" state="published">
+    <status package="bash" code="succeeded"/>
+    <status package="vim" code="succeeded"/>
+    <status package="zsh" code="{'failed' if arch == 's390x' else 'succeeded'}"/>
+  </result>
+</resultlist>""".encode())
+
+
+class TestProjectInstallcheck(unittest.TestCase):
+    def setUp(self):
+        self.stored = {}
+        self.order = []
+        module = project_installcheck
+        for patcher in (
+            mock.patch.object(module, 'target_archs', return_value=ARCHS),
+            mock.patch.object(module, 'repository_path_expand',
+                              return_value=[(PROJECT, 'standard'), ('openSUSE:Factory', 'standard')]),
+            mock.patch.object(module, 'mirror', side_effect=self.mirror),
+            mock.patch.object(module.RepoChecker, 'installcheck', autospec=True, side_effect=self.installcheck),
+            mock.patch.object(module.Config, 'get', return_value={}),
+            mock.patch.object(module, 'http_GET', side_effect=result),
+            mock.patch.object(module, 'source_file_load', side_effect=lambda *args: self.stored.get(args[3])),
+            mock.patch.object(module, 'source_file_ensure', side_effect=self.store),
+            mock.patch.object(module, 'datetime', wraps=datetime, now=lambda: datetime(2024, 1, 1)),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def mirror(self, apiurl, project, repository, arch):
+        return f'/mirror/{project}/{repository}/{arch}'
+
+    def installcheck(self, checker, arch, mirrored):
+        paths = [future.result() for future in mirrored]
+        self.assertEqual(paths, [f'/mirror/{PROJECT}/standard/{arch}', f'/mirror/openSUSE:Factory/standard/{arch}'])
+        # Later architectures finish first.
+        time.sleep(0.02 * (len(ARCHS) - ARCHS.index(arch)))
+        parsed = {'vim': {'source': 'vim', 'output': [f'vim-9.0.{arch} nothing provides libfoo']}}
+        if arch != 'x86_64':
+            parsed['zsh'] = {'source': 'zsh', 'output': [f'zsh-5.9.{arch} nothing provides libbar']}
+        return parsed
+
+    def store(self, apiurl, project, package, filename, state_yaml, comment):
+        self.order.append(comment.split('/')[-1])
+        self.stored[filename] = state_yaml
+
+    def check(self, workers):
+        self.stored = {}
+        self.order = []
+        checker = project_installcheck.RepoChecker()
+        checker.apiurl = 'https://api.example.com'
+        checker.dryrun = False
+        checker.rebuild = False
+        checker.workers = workers
+        checker.parse_store('openSUSE:Factory:Staging/dashboard')
+        checker.check(PROJECT, 'standard')
+        self.assertEqual(self.order, ARCHS)
+        return self.stored[f'rebuildpacs.{PROJECT}-standard.yaml']
+
+    def test_workers_match_serial(self):
+        serial = self.check(1)
+        state = yaml.safe_load(serial)
+        self.assertEqual(sorted(state['check']), sorted(
+            [f'{PROJECT}/standard/{arch}/vim' for arch in ARCHS] +
+            [f'{PROJECT}/standard/{arch}/zsh' for arch in ('aarch64', 'ppc64le')]))
+        self.assertEqual(state['check'][f'{PROJECT}/standard/x86_64/vim'], {
+            'problem': ['vim-9.0.x86_64 nothing provides libfoo'], 'rebuild': '2024-01-01 00:00:00'})
+        self.assertEqual(list(state['failed']), [f'{PROJECT}/standard/s390x/zsh'])
+
+        self.assertEqual(self.check(len(ARCHS)), serial)
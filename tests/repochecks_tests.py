@@ -0,0 +1,55 @@
+import unittest
+
+from osclib.repochecks import followup_installcheck
+
+
+def problem(*output):
+    return {'problem': 'unused', 'output': list(output), 'source': 'unused'}
+
+
+def missing(package):
+    return f'nothing provides libfoo.so.1()(64bit) needed by {package}-1-1.x86_64'
+
+
+def requires(package, dependency):
+    return f'package {package}-1-1.x86_64 requires {dependency}, but none of the providers can be installed'
+
+
+class TestFollowupInstallcheck(unittest.TestCase):
+    def test_followup(self):
+        parsed = followup_installcheck({
+            'libfoo-tools': problem(missing('libfoo-tools')),
+            'bar': problem(requires('bar', 'libfoo-tools'), missing('libfoo-tools')),
+            'baz': problem(requires('baz', 'bar'), requires('bar', 'libfoo-tools'), missing('libfoo-tools')),
+            'partial': problem(missing('libfoo-tools') + ' and more'),
+        })
+        self.assertEqual(parsed['libfoo-tools']['output'], [missing('libfoo-tools')])
+        self.assertEqual(parsed['bar']['output'], [requires('bar', 'libfoo-tools'), 'FOLLOWUP(libfoo-tools)'])
+        # The longest complete output wins.
+        self.assertEqual(parsed['baz']['output'], [requires('baz', 'bar'), 'FOLLOWUP(bar)'])
+        # Only whole lines are matched.
+        self.assertEqual(parsed['partial']['output'], [missing('libfoo-tools') + ' and more'])
+
+    def test_identical(self):
+        parsed = followup_installcheck({
+            'a': problem(missing('libfoo')),
+            'b': problem(missing('libfoo')),
+            'c': problem(missing('libfoo')),
+        })
+        self.assertEqual(parsed['a']['output'], [missing('libfoo')])
+        self.assertEqual(parsed['b']['output'], ['FOLLOWUP(a)'])
+        self.assertEqual(parsed['c']['output'], ['FOLLOWUP(a)'])
+
+    def test_many(self):
+        # A broken core library failing thousands of packages used to take
+        # minutes when comparing every pair of packages.
+        parsed = {'libfoo1': problem(missing('libfoo1'))}
+        for i in range(5000):
+            parsed[f'package{i}'] = problem(requires(f'package{i}', 'libfoo1'), missing('libfoo1'))
+            parsed[f'package{i}-devel'] = problem(requires(f'package{i}-devel', f'package{i}'),
+                                                  requires(f'package{i}', 'libfoo1'), missing('libfoo1'))
+
+        followup_installcheck(parsed)
+        self.assertEqual(parsed['package4999']['output'], [requires('package4999', 'libfoo1'), 'FOLLOWUP(libfoo1)'])
+        self.assertEqual(parsed['package4999-devel']['output'],
+                         [requires('package4999-devel', 'package4999'), 'FOLLOWUP(package4999)'])
@@ -0,0 +1,162 @@
+import hashlib
+import itertools
+import os
+import shutil
+import tempfile
+import unittest
+from io import BytesIO
+from unittest import mock
+from urllib.parse import parse_qs, urlsplit
+
+from osclib.headerstore import HeaderStore
+from osclib.repomirror import RepoMirror
+
+APIURL = 'https://api.example.com'
+
+
+def header(binary):
+    return f'header of {binary}'.encode()
+
+
+def hdrmd5(binary):
+    return hashlib.md5(header(binary)).hexdigest()
+
+
+def filename(binary):
+    return f'{hdrmd5(binary)}-{binary}.rpm'
+
+
+def cpio(binaries):
+    "Build a cpioheaders stream like served by OBS for binaries."
+    def entry(name, content):
+        fields = [0, 0o100644, 0, 0, 1, 0, len(content), 0, 0, 0, 0, len(name) + 1, 0]
+        data = b'070701' + b''.join(b'%08x' % field for field in fields) + name.encode() + b'\0'
+        data += b'\0' * ((4 - len(data) % 4) % 4)
+        return data + content + b'\0' * ((4 - len(content) % 4) % 4)
+
+    data = b''.join(entry(f'{binary}-{hdrmd5(binary)}', header(binary)) for binary in binaries)
+    return data + entry('TRAILER!!!', b'')
+
+
+def binaryversions(binaries):
+    xml = ''.join(f'<binary name="{binary}.rpm" hdrmd5="{hdrmd5(binary)}"/>' for binary in binaries)
+    return BytesIO(f'<binaryversionlist>{xml}</binaryversionlist>'.encode())
+
+
+class TestRepoMirror(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.remote = []
+        self.batches = []
+        patcher = mock.patch('osclib.repomirror.http_GET', side_effect=self.http_GET)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def http_GET(self, url):
+        query = parse_qs(urlsplit(url).query)
+        if query['view'] == ['binaryversions']:
+            return binaryversions(self.remote)
+        self.batches.append(query['binary'])
+        return BytesIO(cpio(query['binary']))
+
+    def files(self):
+        return sorted(os.listdir(self.directory))
+
+    def test_batch_size_adapt(self):
+        mirror = RepoMirror(APIURL)
+        mirror._batch_size_adapt(mirror.batch_size, 1)
+        self.assertEqual(mirror.batch_size, RepoMirror.BATCH_SIZE * 2)
+        # Neither too fast nor too slow.
+        mirror._batch_size_adapt(mirror.batch_size, RepoMirror.BATCH_SECONDS)
+        self.assertEqual(mirror.batch_size, RepoMirror.BATCH_SIZE * 2)
+        # Partial batches are ignored.
+        mirror._batch_size_adapt(1, 1000)
+        self.assertEqual(mirror.batch_size, RepoMirror.BATCH_SIZE * 2)
+
+        for _ in range(10):
+            mirror._batch_size_adapt(mirror.batch_size, 1)
+        self.assertEqual(mirror.batch_size, RepoMirror.BATCH_SIZE_MAX)
+        for _ in range(10):
+            mirror._batch_size_adapt(mirror.batch_size, 1000)
+        self.assertEqual(mirror.batch_size, RepoMirror.BATCH_SIZE_MIN)
+
+    def test_download_grow(self):
+        binaries = [f'package{i}' for i in range(100)]
+        mirror = RepoMirror(APIURL)
+        mirror.batch_size = 10
+        mirror._download(self.directory, 'openSUSE:Factory', 'standard', 'x86_64', binaries)
+
+        self.assertEqual([len(batch) for batch in self.batches], [10, 20, 40, 30])
+        self.assertEqual(self.files(), sorted(filename(binary) for binary in binaries))
+
+    def test_download_shrink(self):
+        binaries = [f'package{i}' for i in range(100)]
+        mirror = RepoMirror(APIURL)
+        mirror.batch_size = 40
+        # Every batch takes 50 seconds.
+        with mock.patch('osclib.repomirror.time.monotonic', side_effect=itertools.count(step=50)):
+            mirror._download(self.directory, 'openSUSE:Factory', 'standard', 'x86_64', binaries)
+
+        self.assertEqual([len(batch) for batch in self.batches], [40, 20, 10, 10, 10, 10])
+        self.assertEqual(len(self.files()), 100)
+
+    def test_download_workers(self):
+        binaries = [f'package{i}' for i in range(100)]
+        mirror = RepoMirror(APIURL, workers=4, packed=True)
+        mirror.batch_size = 10
+        store = HeaderStore(self.directory)
+        mirror._download(self.directory, 'openSUSE:Factory', 'standard', 'x86_64', binaries, store)
+
+        self.assertEqual(sorted(itertools.chain(*self.batches)), sorted(binaries))
+        self.assertEqual(set(store), {hdrmd5(binary) for binary in binaries})
+        self.assertEqual(store.read(hdrmd5('package7')), header('package7'))
+        self.assertEqual(self.files(), ['headers.0.pack', 'headers.idx'])
+
+    def test_resume(self):
+        # Left behind by an interrupted mirror.
+        with open(os.path.join(self.directory, '.batch-1.cpio'), 'wb') as f:
+            f.write(cpio(['bash', 'gone']))
+        with open(os.path.join(self.directory, '.batch-2.cpio.part'), 'wb') as f:
+            f.write(cpio(['vim'])[:50])
+        with open(os.path.join(self.directory, filename('zsh') + '.part'), 'wb') as f:
+            f.write(b'header')
+
+        remotebins = {filename(binary): binary for binary in ('bash', 'vim', 'zsh')}
+        mirror = RepoMirror(APIURL)
+        remaining = mirror._resume(self.directory, remotebins)
+
+        self.assertEqual(remaining, {filename('vim'): 'vim', filename('zsh'): 'zsh'})
+        self.assertEqual(self.files(), [filename('bash')])
+
+    def test_resume_packed(self):
+        with open(os.path.join(self.directory, '.batch-1.cpio'), 'wb') as f:
+            f.write(cpio(['bash', 'vim']))
+
+        store = HeaderStore(self.directory)
+        remotebins = {filename(binary): binary for binary in ('bash', 'zsh')}
+        mirror = RepoMirror(APIURL, packed=True)
+        remaining = mirror._resume(self.directory, remotebins, store)
+
+        self.assertEqual(remaining, {filename('zsh'): 'zsh'})
+        self.assertEqual(list(store), [hdrmd5('bash')])
+
+    def test_mirror(self):
+        self.remote = ['bash', 'vim', 'zsh']
+        with open(os.path.join(self.directory, filename('old')), 'wb') as f:
+            f.write(header('old'))
+        with open(os.path.join(self.directory, '.batch-1.cpio'), 'wb') as f:
+            f.write(cpio(['bash']))
+
+        mirror = RepoMirror(APIURL)
+        changes = mirror.mirror(self.directory, 'openSUSE:Factory', 'standard', 'x86_64')
+
+        self.assertEqual(sorted(changes.added), sorted(hdrmd5(binary) for binary in self.remote))
+        self.assertEqual(changes.removed, [hdrmd5('old')])
+        # Only those not resumed are downloaded.
+        self.assertEqual(self.batches, [['vim', 'zsh']])
+        self.assertEqual(self.files(), sorted(['.lock'] + [filename(binary) for binary in self.remote]))
+
+        changes = mirror.mirror(self.directory, 'openSUSE:Factory', 'standard', 'x86_64')
+        self.assertEqual(changes, ([], []))
+        self.assertEqual(len(self.batches), 1)
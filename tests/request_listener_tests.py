@@ -0,0 +1,131 @@
+import json
+import logging
+import threading
+import time
+import unittest
+from unittest import mock
+
+from osclib.request_listener import RequestListener
+
+PREFIX = 'opensuse'
+
+
+def method(tag=1):
+    return mock.Mock(delivery_tag=tag, routing_key=f'{PREFIX}.obs.request.change')
+
+
+class TestRequestListener(unittest.TestCase):
+    def setUp(self):
+        self.checked = []
+        self.listener = RequestListener(PREFIX, logging.getLogger('RequestListener'), self.workfunc, 600)
+        self.addCleanup(self.listener.executor.shutdown)
+        self.listener._connection = mock.Mock()
+        self.listener._channel = mock.Mock()
+        self.listener.queue_name = 'queue'
+        self.ioloop = self.listener._connection.ioloop
+        self.ioloop.call_later.side_effect = lambda interval, callback: f'timer-{interval}'
+
+    def workfunc(self, ids):
+        self.checked.append(ids)
+
+    def message(self, body, tag=1):
+        if not isinstance(body, str):
+            body = json.dumps(body)
+        self.listener.on_message(self.listener._channel, method(tag), None, body)
+
+    def still_alive(self):
+        self.listener.still_alive()
+        if self.listener.working:
+            self.listener.working.result()
+
+    def test_routing_keys(self):
+        self.assertEqual(self.listener.routing_keys(), [f'{PREFIX}.obs.request.*', f'{PREFIX}.obs.review.*'])
+
+    def test_on_message(self):
+        self.listener._timer_id = 'timer'
+        self.message({'number': 42}, tag=1)
+        self.message({'number': 7}, tag=2)
+        self.message({'number': 42}, tag=3)
+        self.message('not json', tag=4)
+        self.message({'state': 'new'}, tag=5)
+
+        self.assertEqual(self.listener.requests_to_check, {'42', '7'})
+        self.assertEqual([c.args[0] for c in self.listener._channel.basic_ack.call_args_list], [1, 2, 3, 4, 5])
+        # Only the first request shortens the timer to collect the batch.
+        self.ioloop.remove_timeout.assert_called_once_with('timer')
+        self.ioloop.call_later.assert_called_once_with(RequestListener.DELAY, self.listener.still_alive)
+
+    def test_interval(self):
+        now = time.time()
+        self.listener.sweep_next = now + 60
+        self.assertAlmostEqual(self.listener.interval(), 60, delta=1)
+        # Capped by the still alive interval.
+        self.listener.sweep_next = now + 1000
+        self.assertEqual(self.listener.interval(), 300)
+        # Sweep overdue.
+        self.listener.sweep_next = now - 60
+        self.assertEqual(self.listener.interval(), 0)
+
+        self.listener.requests_to_check.add('42')
+        self.assertEqual(self.listener.interval(), RequestListener.DELAY)
+
+        self.listener.requests_to_check = set()
+        self.listener.working = mock.Mock(done=lambda: False)
+        self.assertEqual(self.listener.interval(), RequestListener.DELAY)
+
+    def test_start_consuming(self):
+        self.listener.sweep_next = time.time() + 600
+        self.listener.start_consuming()
+        self.assertEqual(self.listener.sweep_next, 0)
+        self.listener._channel.basic_consume.assert_called_once_with(
+            'queue', self.listener.on_message, auto_ack=False)
+        # First timer hit is immediate and sweeps.
+        self.ioloop.call_later.assert_called_once_with(0, self.listener.still_alive)
+        self.still_alive()
+        self.assertEqual(self.checked, [None])
+
+    def test_still_alive(self):
+        self.listener.requests_to_check.add('42')
+        self.still_alive()
+        # Due sweep covers the pending requests.
+        self.assertEqual(self.checked, [None])
+        self.assertEqual(self.listener.requests_to_check, set())
+        self.assertGreater(self.listener.sweep_next, time.time())
+
+        self.still_alive()
+        self.assertEqual(self.checked, [None])
+
+        self.message({'number': 100})
+        self.message({'number': 9})
+        self.still_alive()
+        self.assertEqual(self.checked, [None, ['9', '100']])
+
+    def test_still_alive_busy(self):
+        started = threading.Event()
+        release = threading.Event()
+
+        def workfunc(ids):
+            started.set()
+            release.wait(10)
+            self.checked.append(ids)
+        self.listener.workfunc = workfunc
+
+        self.listener.still_alive()
+        started.wait(10)
+        # The ioloop is not blocked and collects events for the next call.
+        self.message({'number': 42})
+        self.listener.still_alive()
+        self.assertEqual(self.listener.requests_to_check, {'42'})
+
+        release.set()
+        self.listener.working.result()
+        self.listener.workfunc = self.workfunc
+        self.still_alive()
+        self.assertEqual(self.checked, [None, ['42']])
+
+    def test_work_exception(self):
+        self.listener.workfunc = mock.Mock(side_effect=ValueError('broken'))
+        with self.assertLogs('RequestListener', 'ERROR'):
+            self.still_alive()
+        # Still alive after the failure.
+        self.assertEqual(self.ioloop.call_later.call_count, 1)
@@ -0,0 +1,59 @@
+import unittest
+from io import BytesIO
+from unittest import mock
+from urllib.parse import parse_qs, urlsplit
+
+from osclib import core
+from osclib.core import request_cache_invalidate
+from osclib.core import request_get
+from osclib.core import requests_get
+from osclib.core import requests_search
+
+APIURL = 'https://api.example.com'
+
+
+def collection(url):
+    query = parse_qs(urlsplit(url).query)
+    if 'ids' in query:
+        ids = [request_id for request_id in query['ids'][0].split(',') if request_id != '404']
+    else:
+        ids = ['7', '8']
+    requests = ''.join(f'<request id="{request_id}"><state name="review"/></request>' for request_id in ids)
+    return BytesIO(f'<collection>{requests}</collection>'.encode())
+
+
+class TestRequests(unittest.TestCase):
+    def setUp(self):
+        mock.patch.object(core, 'REQUEST_BATCH_SIZE', 2).start()
+        mock.patch.dict(core.REQUEST_STATS, {'calls': 0, 'avoided': 0}).start()
+        mock.patch.dict(core._request_cache, clear=True).start()
+        self.http_GET = mock.patch('osclib.core.http_GET', side_effect=collection).start()
+        self.addCleanup(mock.patch.stopall)
+
+    def test_requests_get(self):
+        requests = requests_get(APIURL, [3, '1', 404, 2])
+        self.assertEqual([request.reqid for request in requests], ['3', '1', '2'])
+        self.assertEqual(self.http_GET.call_count, 2)
+        self.assertEqual(core.REQUEST_STATS, {'calls': 2, 'avoided': 2})
+
+        # Served from the cache.
+        self.assertEqual(request_get(APIURL, 1).reqid, '1')
+        self.assertIsNone(request_get(APIURL, 404))
+        self.assertEqual(self.http_GET.call_count, 3)
+        self.assertEqual(core.REQUEST_STATS, {'calls': 3, 'avoided': 3})
+
+        request_cache_invalidate(APIURL, 1)
+        self.assertEqual(request_get(APIURL, '1').reqid, '1')
+        self.assertEqual(self.http_GET.call_count, 4)
+
+    def test_requests_search(self):
+        requests = requests_search(APIURL, "state/@name='review'")
+        self.assertEqual([request.reqid for request in requests], ['7', '8'])
+        self.assertEqual(request_get(APIURL, 8).reqid, '8')
+        self.assertEqual(self.http_GET.call_count, 1)
+
+    def test_expired(self):
+        with mock.patch.object(core, 'REQUEST_CACHE_TTL', -1):
+            request_get(APIURL, 1)
+        request_get(APIURL, 1)
+        self.assertEqual(self.http_GET.call_count, 2)
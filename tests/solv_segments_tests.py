@@ -0,0 +1,231 @@
+import hashlib
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+import solv
+
+from osclib.headerstore import HeaderStore
+from osclib.repomirror import MirrorChanges
+from pkglistgen.solv_segments import SolvSegments
+from pkglistgen.tool import PkgListGen
+
+
+def hdrmd5(name):
+    return hashlib.md5(name.encode()).hexdigest()
+
+
+class FakeRpms2solv(object):
+    "Stands in for rpms2solv by adding a solvable named after each header file."
+
+    calls = []
+
+    def __init__(self, args, stdin, stdout):
+        self.path = stdout.name
+
+    def communicate(self, data):
+        paths = data.decode('utf-8').split('\0')
+        FakeRpms2solv.calls.append(len(paths))
+        pool = solv.Pool()
+        repo = pool.add_repo('rpms2solv')
+        for path in paths:
+            solvable = repo.add_solvable()
+            solvable.name = os.path.basename(path)[33:-4]
+            solvable.evr = '1-1'
+            solvable.arch = 'x86_64'
+        repo.internalize()
+        fp = solv.xfopen(self.path, 'w')
+        repo.write(fp)
+        fp.close()
+
+    def wait(self):
+        return 0
+
+
+def solv_names(path):
+    pool = solv.Pool()
+    repo = pool.add_repo('test')
+    repo.add_solv(path)
+    return sorted(solvable.name for solvable in repo.solvables)
+
+
+class TestSolvSegments(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.store = HeaderStore(self.directory)
+        FakeRpms2solv.calls = []
+        for patcher in (mock.patch('pkglistgen.solv_segments.subprocess.Popen', FakeRpms2solv),
+                        mock.patch.object(SolvSegments, 'SEGMENT_SIZE', 2)):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def add(self, *names):
+        for name in names:
+            self.store.add(hdrmd5(name), name, name.encode())
+        return [hdrmd5(name) for name in names]
+
+    def remove(self, *names):
+        for name in names:
+            self.store.remove(hdrmd5(name))
+        return [hdrmd5(name) for name in names]
+
+    def names(self, segments):
+        path = os.path.join(self.directory, 'test.solv')
+        segments.write(path)
+        return solv_names(path)
+
+    def segment_files(self):
+        return sorted(f for f in os.listdir(self.directory) if f.startswith('segment-'))
+
+    def rebuilt(self):
+        "Names and segments of a full rebuild from the headers of the store."
+        directory = os.path.join(self.directory, 'rebuild')
+        os.mkdir(directory)
+        with SolvSegments(directory) as segments:
+            segments.rebuild(self.store)
+            path = os.path.join(directory, 'test.solv')
+            segments.write(path)
+            return solv_names(path), segments.segments
+
+    def test_update_matches_rebuild(self):
+        added = self.add('bash', 'vim', 'zsh', 'fish', 'tcsh')
+        with SolvSegments(self.directory) as segments:
+            segments.update(self.store, MirrorChanges(added, []))
+            self.assertEqual(FakeRpms2solv.calls, [2, 2, 1])
+            self.assertEqual(self.names(segments), ['bash', 'fish', 'tcsh', 'vim', 'zsh'])
+
+        removed = self.remove('vim')
+        added = self.add('dash', 'ksh', 'mksh')
+        FakeRpms2solv.calls = []
+        with SolvSegments(self.directory) as segments:
+            segments.update(self.store, MirrorChanges(added, removed))
+            # Only the segment of vim is regenerated next to the added ones.
+            self.assertEqual(FakeRpms2solv.calls, [1, 2, 1])
+            self.assertEqual(segments.steps, 2)
+            names = self.names(segments)
+
+        self.assertEqual(names, ['bash', 'dash', 'fish', 'ksh', 'mksh', 'tcsh', 'zsh'])
+        self.assertEqual(names, self.rebuilt()[0])
+        self.assertEqual(self.segment_files(), [f'segment-{i}.solv' for i in (1, 2, 3, 4, 5)])
+
+    def test_remove_segment(self):
+        added = self.add('bash', 'vim', 'zsh')
+        with SolvSegments(self.directory) as segments:
+            segments.update(self.store, MirrorChanges(added, []))
+
+        removed = self.remove('bash', 'vim')
+        FakeRpms2solv.calls = []
+        with SolvSegments(self.directory) as segments:
+            segments.update(self.store, MirrorChanges([], removed))
+            self.assertEqual(FakeRpms2solv.calls, [])
+            self.assertEqual(segments.segments, {'1': [hdrmd5('zsh')]})
+            self.assertEqual(self.names(segments), ['zsh'])
+        self.assertEqual(self.segment_files(), ['segment-1.solv'])
+
+    def test_stale_manifest(self):
+        added = self.add('bash', 'vim', 'zsh')
+        with SolvSegments(self.directory) as segments:
+            segments.update(self.store, MirrorChanges(added, []))
+
+        # Headers mirrored by a run interrupted before updating the segments.
+        self.add('fish')
+        FakeRpms2solv.calls = []
+        with SolvSegments(self.directory) as segments:
+            segments.update(self.store, MirrorChanges([], []))
+            self.assertEqual(FakeRpms2solv.calls, [2, 2])
+            self.assertEqual(segments.steps, 0)
+            self.assertEqual(self.names(segments), ['bash', 'fish', 'vim', 'zsh'])
+
+    def test_interrupted_write(self):
+        added = self.add('bash', 'vim', 'zsh')
+        with SolvSegments(self.directory) as segments:
+            segments.update(self.store, MirrorChanges(added, []))
+
+        # Killed while writing a segment and the manifest.
+        os.unlink(segments.segment_path('1'))
+        with open(segments.segment_path('0') + '.tmp', 'w') as f:
+            f.write('partial')
+        with open(segments.manifest_path + '.tmp', 'w') as f:
+            f.write('{"segm')
+
+        with SolvSegments(self.directory) as segments:
+            segments.update(self.store, MirrorChanges([], []))
+            self.assertEqual(self.names(segments), ['bash', 'vim', 'zsh'])
+            self.assertEqual(sorted(segments.segments), ['2', '3'])
+        self.assertFalse(os.path.exists(segments.manifest_path + '.tmp'))
+        self.assertEqual(self.segment_files(), ['segment-2.solv', 'segment-3.solv'])
+
+    def test_rebuild_interval(self):
+        added = self.add('bash', 'vim', 'zsh')
+        with SolvSegments(self.directory, rebuild_interval=3) as segments:
+            segments.update(self.store, MirrorChanges(added, []))
+        for name in ('fish', 'tcsh'):
+            FakeRpms2solv.calls = []
+            with SolvSegments(self.directory, rebuild_interval=3) as segments:
+                segments.update(self.store, MirrorChanges(self.add(name), []))
+                steps = segments.steps
+        # The third update is due for a rebuild.
+        self.assertEqual(steps, 0)
+        self.assertEqual(FakeRpms2solv.calls, [2, 2, 1])
+        self.assertEqual(self.segment_files(), ['segment-3.solv', 'segment-4.solv', 'segment-5.solv'])
+
+
+class TestPkgListGenSolvRebuild(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.added = []
+        self.tool = PkgListGen()
+        self.tool.repos = [('openSUSE:Factory', 'standard')]
+        self.calls = {'rebuild': 0, 'update': 0}
+        for patcher in (mock.patch('pkglistgen.solv_segments.subprocess.Popen', FakeRpms2solv),
+                        mock.patch('pkglistgen.tool.CACHEDIR', self.directory),
+                        mock.patch('pkglistgen.tool.RepoMirror', return_value=mock.Mock(mirror=self.mirror)),
+                        mock.patch('pkglistgen.tool.repository_arch_state', side_effect=lambda *args: self.state),
+                        mock.patch.object(SolvSegments, 'rebuild', autospec=True, side_effect=self.count('rebuild')),
+                        mock.patch.object(SolvSegments, 'update', autospec=True, side_effect=self.count('update'))):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+        self.cwd = os.getcwd()
+        os.chdir(self.directory)
+        self.addCleanup(os.chdir, self.cwd)
+
+    def count(self, method):
+        original = getattr(SolvSegments, method)
+
+        def counted(*args):
+            self.calls[method] += 1
+            return original(*args)
+        return counted
+
+    def mirror(self, destdir, project, repo, arch):
+        "Mirror one new header per run."
+        name = f'package{len(self.added)}'
+        HeaderStore(destdir).add(hdrmd5(name), name, name.encode())
+        self.added.append(name)
+        return MirrorChanges([hdrmd5(name)], [])
+
+    def update(self, state):
+        self.state = state
+        self.tool.update_repos(['x86_64'])
+        return solv_names(os.path.join(self.directory, 'repo-openSUSE:Factory-standard-x86_64.solv'))
+
+    def test_rebuild_interval(self):
+        self.tool.solv_rebuild_interval = 2
+        self.update('1')
+        self.assertEqual(self.calls, {'rebuild': 0, 'update': 1})
+        self.assertEqual(self.update('1'), ['package0'])
+        self.assertEqual(self.calls, {'rebuild': 0, 'update': 1})
+        self.assertEqual(self.update('2'), ['package0', 'package1'])
+        self.assertEqual(self.calls, {'rebuild': 1, 'update': 2})
+
+    def test_full_solv_rebuild(self):
+        self.update('1')
+        self.tool.full_solv_rebuild = True
+        # Rebuilt even though the repository state did not change.
+        self.assertEqual(self.update('1'), ['package0', 'package1'])
+        self.assertEqual(self.calls, {'rebuild': 1, 'update': 1})
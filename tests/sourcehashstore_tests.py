@@ -0,0 +1,76 @@
+import shutil
+import tempfile
+import unittest
+from io import BytesIO
+from unittest import mock
+
+from osclib import core
+from osclib.core import package_source_hash
+from osclib.core import package_source_hash_histories
+from osclib.memoize import memoize_session_reset
+from osclib.sourcehashstore import SourceHashStore
+from osclib.util import sha1_short
+
+APIURL = 'https://api.example.com'
+HISTORY = {
+    'bash': ['a' * 32, 'b' * 32],
+    'vim': ['c' * 32],
+}
+
+
+def directory(url):
+    # Each revision contains a file with the srcmd5 as md5.
+    srcmd5 = url.split('rev=')[1].split('&')[0]
+    return BytesIO(f'<directory><entry name="bash.spec" md5="{srcmd5}"/></directory>'.encode())
+
+
+def commitlog(apiurl, project, package, revision, format):
+    entries = ''.join(f'<logentry srcmd5="{srcmd5}"/>' for srcmd5 in HISTORY[package])
+    return [f'<log>{entries}</log>']
+
+
+class TestSourceHashStore(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        mock.patch.object(SourceHashStore, '_default', SourceHashStore(self.directory)).start()
+        mock.patch('osclib.core.package_source_link_copy', return_value=False).start()
+        mock.patch('osclib.core.get_commitlog', side_effect=commitlog).start()
+        self.http_GET = mock.patch('osclib.core.http_GET', side_effect=directory).start()
+        self.addCleanup(mock.patch.stopall)
+        memoize_session_reset()
+
+    def test_revision_cached(self):
+        expected = sha1_short(['a' * 32])
+        self.assertEqual(package_source_hash(APIURL, 'openSUSE:Factory', 'bash', 'a' * 32), expected)
+        self.assertEqual(package_source_hash(APIURL, 'openSUSE:Factory', 'bash', 'a' * 32), expected)
+        self.assertEqual(self.http_GET.call_count, 1)
+
+        # Kept beyond the session.
+        memoize_session_reset()
+        self.assertEqual(package_source_hash(APIURL, 'openSUSE:Factory', 'bash', 'a' * 32), expected)
+        self.assertEqual(self.http_GET.call_count, 1)
+
+        store = SourceHashStore(self.directory)
+        self.assertEqual(store.get(APIURL, 'openSUSE:Factory', 'bash', 'a' * 32), expected)
+        self.assertIsNone(store.get(APIURL, 'openSUSE:Leap', 'bash', 'a' * 32))
+
+    def test_expanded_not_cached(self):
+        with mock.patch('osclib.core.package_source_link_copy', return_value=True):
+            package_source_hash(APIURL, 'openSUSE:Factory', 'bash', 'a' * 32)
+            memoize_session_reset()
+            package_source_hash(APIURL, 'openSUSE:Factory', 'bash', 'a' * 32)
+        self.assertEqual(self.http_GET.call_count, 2)
+
+    def test_histories(self):
+        histories = package_source_hash_histories(
+            APIURL, [('openSUSE:Factory', 'bash'), ('openSUSE:Factory', 'vim')], workers=2)
+        self.assertEqual(histories, {
+            ('openSUSE:Factory', 'bash'): [sha1_short(['a' * 32]), sha1_short(['b' * 32])],
+            ('openSUSE:Factory', 'vim'): [sha1_short(['c' * 32])],
+        })
+        self.assertEqual(self.http_GET.call_count, 3)
+
+        self.assertEqual(list(core.package_source_hash_history(APIURL, 'openSUSE:Factory', 'bash')),
+                         histories[('openSUSE:Factory', 'bash')])
+        self.assertEqual(self.http_GET.call_count, 3)
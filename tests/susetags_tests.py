@@ -0,0 +1,213 @@
+import os
+import shutil
+import struct
+import subprocess
+import tempfile
+import unittest
+
+from osclib import susetags
+from osclib.susetags import package_snippet, write_packages
+
+FIXTURES = os.path.join(os.path.dirname(__file__), 'fixtures', 'susetags')
+BUILD = '/usr/lib/build/Build/Rpm.pm'
+
+
+def rpm_header(tags):
+    "Build a bare RPM header like those mirrored by RepoMirror."
+    index = b''
+    store = b''
+    for tag, value in sorted(tags.items()):
+        if isinstance(value, str):
+            kind, count, data = 6, 1, value.encode() + b'\0'
+        elif isinstance(value[0], str):
+            kind, count, data = 8, len(value), b''.join(v.encode() + b'\0' for v in value)
+        elif tag == susetags.RPMTAG_FILEMODES:
+            kind, count, data = 3, len(value), struct.pack(f'>{len(value)}H', *value)
+        else:
+            store += b'\0' * ((4 - len(store) % 4) % 4)
+            kind, count, data = 4, len(value), struct.pack(f'>{len(value)}I', *value)
+        index += struct.pack('>IIiI', tag, kind, len(store), count)
+        store += data
+    return susetags.HEADER_MAGIC + b'\0' * 4 + struct.pack('>II', len(tags), len(store)) + index + store
+
+
+def package(name, source='bash', files=None, requires=None):
+    files = files or []
+    requires = requires or []
+    tags = {
+        susetags.RPMTAG_NAME: name,
+        susetags.RPMTAG_VERSION: '5.2',
+        susetags.RPMTAG_RELEASE: '1.1',
+        susetags.RPMTAG_ARCH: 'i686',
+        susetags.RPMTAG_SOURCERPM: f'{source}-5.2-1.1.src.rpm',
+        susetags.RPMTAG_PROVIDENAME: [name],
+        susetags.RPMTAG_PROVIDEFLAGS: [8],
+        susetags.RPMTAG_PROVIDEVERSION: ['5.2-1.1'],
+    }
+    if files:
+        tags[susetags.RPMTAG_BASENAMES] = [os.path.basename(f) for f, _ in files]
+        tags[susetags.RPMTAG_DIRNAMES] = sorted({os.path.dirname(f) + '/' for f, _ in files})
+        tags[susetags.RPMTAG_DIRINDEXES] = [tags[susetags.RPMTAG_DIRNAMES].index(os.path.dirname(f) + '/')
+                                            for f, _ in files]
+        tags[susetags.RPMTAG_FILEMODES] = [mode for _, mode in files]
+        tags[susetags.RPMTAG_FILEFLAGS] = [0] * len(files)
+        tags[susetags.RPMTAG_FILEUSERNAME] = ['root'] * len(files)
+        tags[susetags.RPMTAG_FILEGROUPNAME] = ['root'] * len(files)
+        tags[susetags.RPMTAG_FILELINKTOS] = ['bash' if mode == 0o120777 else '' for _, mode in files]
+    if requires:
+        tags[susetags.RPMTAG_REQUIRENAME] = [dep for dep, _, _ in requires]
+        tags[susetags.RPMTAG_REQUIREFLAGS] = [flags for _, flags, _ in requires]
+        tags[susetags.RPMTAG_REQUIREVERSION] = [version for _, _, version in requires]
+    return rpm_header(tags)
+
+
+class TestSusetags(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def mirror(self, name, headers):
+        directory = os.path.join(self.directory, name)
+        os.makedirs(directory, exist_ok=True)
+        for filename, header in headers.items():
+            with open(os.path.join(directory, filename), 'wb') as f:
+                f.write(header)
+        return directory
+
+    def test_package_snippet(self):
+        header = package('bash', files=[('/usr/bin/bash', 0o100755), ('/usr/bin/sh', 0o120777),
+                                        ('/usr/share/doc/bash/README', 0o100644)],
+                         requires=[('libc.so.6', 0, ''), ('this-is-only-for-build-envs', 0, ''),
+                                   ('libreadline', 12, '8')])
+        source, snippet = package_snippet(header)
+        self.assertEqual(source, 'bash')
+        self.assertEqual(snippet, '\n'.join([
+            '=Pkg: bash 5.2 1.1 i586',
+            '+Flx:',
+            '=Src: bash 5.2 1.1 src',
+            '100755 0 root:root /usr/bin/bash',
+            '120777 0 root:root /usr/bin/sh -> bash',
+            '100644 0 root:root /usr/share/doc/bash/README',
+            '-Flx:',
+            '+Prv:',
+            'bash = 5.2-1.1',
+            '/usr/bin/bash',
+            '/usr/bin/sh',
+            '-Prv:',
+            '+Con:',
+            '-Con:',
+            '+Req:',
+            'libc.so.6',
+            'libreadline >= 8',
+            '-Req:',
+            '+Obs:',
+            '-Obs:',
+            '+Rec:',
+            '-Rec:',
+            '+Sup:',
+            '-Sup:',
+            '+Enh:',
+            '-Enh:',
+            '+Sug:',
+            '-Sug:',
+        ]) + '\n')
+
+    def test_package_snippet_fixture(self):
+        with open(os.path.join(FIXTURES, 'bash.rpm'), 'rb') as f:
+            source, snippet = package_snippet(f.read())
+        self.assertEqual(source, 'bash:multibuild')
+        # As written by CreatePackageDescr::package_snippet().
+        with open(os.path.join(FIXTURES, 'bash.packages')) as f:
+            self.assertEqual(snippet, f.read())
+
+    @unittest.skipUnless(os.path.exists(BUILD), 'requires obs-build')
+    def test_package_snippet_perl(self):
+        directory = self.mirror('factory', {})
+        shutil.copy(os.path.join(FIXTURES, 'bash.rpm'), os.path.join(directory, f'{"b" * 32}-bash.rpm'))
+        expected = os.path.join(self.directory, 'perl')
+        os.mkdir(expected)
+        script = os.path.join(os.path.dirname(__file__), '..', 'write_repo_susetags_file.pl')
+        subprocess.check_call(['perl', script, expected, directory])
+
+        write_packages(self.directory, [directory])
+        with open(os.path.join(self.directory, 'packages')) as f, open(os.path.join(expected, 'packages')) as e:
+            packages = f.read()
+            self.assertEqual(packages, e.read())
+        with open(os.path.join(FIXTURES, 'bash.packages')) as f:
+            self.assertEqual(packages, '=Ver: 2.0\n' + f.read())
+
+    def test_corrupt(self):
+        with self.assertRaises(susetags.CorruptHeader):
+            package_snippet(b'garbage' * 10)
+
+    def test_write_packages(self):
+        staging = self.mirror('staging', {f'{"a" * 32}-bash.rpm': package('bash', source='bash-staging')})
+        factory = self.mirror('factory', {
+            f'{"b" * 32}-bash.rpm': package('bash'),
+            f'{"c" * 32}-vim.rpm': package('vim', source='vim'),
+        })
+
+        catalog = write_packages(self.directory, [staging, factory])
+        self.assertEqual(catalog, {staging: {'bash': 'bash-staging'}, factory: {'vim': 'vim'}})
+        with open(os.path.join(self.directory, 'packages')) as f:
+            packages = f.read()
+        self.assertTrue(packages.startswith('=Ver: 2.0\n=Pkg: bash 5.2 1.1 i586\n+Flx:\n=Src: bash-staging '))
+        self.assertIn('=Pkg: vim ', packages)
+        self.assertEqual(packages.count('=Pkg: '), 2)
+
+        # Headers are only parsed once, snippets of removed headers are dropped.
+        os.unlink(os.path.join(factory, f'{"c" * 32}-vim.rpm'))
+        with open(os.path.join(factory, f'{"b" * 32}-bash.rpm'), 'wb') as f:
+            f.write(b'not parsed again')
+        catalog = write_packages(self.directory, [factory])
+        self.assertEqual(catalog, {factory: {'bash': 'bash'}})
+        with susetags.SnippetCache(factory) as cache:
+            self.assertEqual(cache.connection.execute('SELECT COUNT(*) FROM snippets').fetchone()[0], 1)
+
+    def test_mark_used(self):
+        factory = self.mirror('factory', {f'{"b" * 32}-bash.rpm': package('bash')})
+        path = os.path.join(factory, f'{"b" * 32}-bash.rpm')
+        write_packages(self.directory, [factory])
+
+        # Served from the cache and still marked as used for CacheManager.
+        os.utime(path, (0, 0))
+        write_packages(self.directory, [factory])
+        self.assertGreater(os.stat(path).st_atime, 0)
+
+    def test_write_packages_corrupt(self):
+        factory = self.mirror('factory', {f'{"b" * 32}-bash.rpm': b'corrupt'})
+        with self.assertRaises(susetags.CorruptHeader):
+            write_packages(self.directory, [factory])
+        # Removed to be mirrored again.
+        self.assertEqual(os.listdir(factory), [susetags.SnippetCache.FILENAME])
+
+    def test_packages_base(self):
+        factory = self.mirror('factory', {
+            f'{"b" * 32}-bash.rpm': package('bash'),
+            f'{"c" * 32}-vim.rpm': package('vim', source='vim'),
+            f'{"d" * 32}-zsh.rpm': package('zsh', source='zsh'),
+        })
+        staging = self.mirror('staging', {f'{"a" * 32}-vim.rpm': package('vim', source='vim-staging')})
+
+        mirrored = []
+
+        def directories():
+            mirrored.append(factory)
+            return [factory]
+
+        base = susetags.PackagesBase(os.path.join(self.directory, 'base')).load_or_build(directories)
+        base = susetags.PackagesBase(os.path.join(self.directory, 'base')).load_or_build(directories)
+        self.assertEqual(mirrored, [factory])
+
+        output = os.path.join(self.directory, 'layered')
+        os.mkdir(output)
+        catalog = write_packages(output, [staging], base)
+        self.assertEqual(catalog, {staging: {'vim': 'vim-staging'}, factory: {'bash': 'bash', 'zsh': 'zsh'}})
+
+        expected = os.path.join(self.directory, 'expected')
+        os.mkdir(expected)
+        write_packages(expected, [staging, factory])
+        with open(os.path.join(output, 'packages'), 'rb') as f, open(os.path.join(expected, 'packages'), 'rb') as e:
+            self.assertEqual(f.read(), e.read())
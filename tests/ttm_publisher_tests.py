@@ -0,0 +1,95 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from ttm.publisher import ToTestPublisher
+
+SERVER = 'https://openqa.example.com'
+MODIFIED = 'Mon, 01 Jan 2024 00:00:00 GMT'
+
+
+class TestPublisherJobsComments(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        patcher = mock.patch('ttm.publisher.CacheManager.directory', return_value=self.directory)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.publisher = ToTestPublisher(mock.Mock(apiurl='https://api.example.com', debug=False,
+                                                   caching=False, dryrun=True))
+        self.publisher.project = mock.Mock(openqa_server=SERVER)
+        self.publisher.project.name = 'openSUSE:Factory'
+        self.publisher.openqa = mock.Mock()
+        self.publisher.openqa.do_request.side_effect = self.do_request
+        self.cache_path = os.path.join(self.directory, 'openSUSE:Factory.json')
+        self.modified = {}
+        self.requests = []
+
+    def do_request(self, request, parse=True):
+        self.assertFalse(parse)
+        job_id = int(request.url.split('/')[-2])
+        since = request.headers.get('If-Modified-Since')
+        self.requests.append((job_id, since))
+        if since and since == self.modified.get(job_id):
+            return mock.Mock(status_code=304, headers={})
+        headers = {'Last-Modified': self.modified[job_id]} if job_id in self.modified else {}
+        comments = [{'id': job_id, 'text': f'comment {job_id}'}]
+        return mock.Mock(status_code=200, headers=headers, json=lambda: comments)
+
+    def comments(self, job_ids):
+        with self.assertLogs(self.publisher.logger, 'INFO') as logs:
+            comments = self.publisher.jobs_comments(job_ids)
+        return comments, logs.output[0]
+
+    def cache(self):
+        with open(self.cache_path) as f:
+            return json.load(f)
+
+    def test_fetch(self):
+        self.modified = {1: MODIFIED}
+        comments, log = self.comments([1, 2])
+        self.assertEqual(comments, {1: [{'id': 1, 'text': 'comment 1'}], 2: [{'id': 2, 'text': 'comment 2'}]})
+        self.assertEqual(sorted(self.requests), [(1, None), (2, None)])
+        self.assertIn('0 requests saved', log)
+        self.assertEqual(self.cache(), {
+            '1': {'last_modified': MODIFIED, 'comments': [{'id': 1, 'text': 'comment 1'}]},
+            '2': {'last_modified': None, 'comments': [{'id': 2, 'text': 'comment 2'}]},
+        })
+
+    def test_not_modified(self):
+        self.modified = {1: MODIFIED}
+        self.comments([1, 2])
+        cache = self.cache()
+        cache['1']['comments'][0]['text'] = 'cached'
+        with open(self.cache_path, 'w') as f:
+            json.dump(cache, f)
+
+        self.requests = []
+        comments, log = self.comments([1, 2])
+        self.assertEqual(comments[1], [{'id': 1, 'text': 'cached'}])
+        # Only revalidated when openQA supplied Last-Modified.
+        self.assertEqual(sorted(self.requests), [(1, MODIFIED), (2, None)])
+        self.assertIn('1 requests saved', log)
+
+    def test_prune(self):
+        self.modified = {1: MODIFIED, 2: MODIFIED}
+        self.comments([1, 2])
+        self.requests = []
+        self.comments([2, 3])
+        self.assertEqual(sorted(self.requests), [(2, MODIFIED), (3, None)])
+        self.assertEqual(sorted(self.cache()), ['2', '3'])
+
+    def test_corrupt_cache(self):
+        self.modified = {1: MODIFIED}
+        for content in ('{"1": {"last_mod', '[1, 2]'):
+            with open(self.cache_path, 'w') as f:
+                f.write(content)
+            self.requests = []
+            comments, _ = self.comments([1])
+            self.assertEqual(comments, {1: [{'id': 1, 'text': 'comment 1'}]})
+            self.assertEqual(self.requests, [(1, None)])
+            self.assertEqual(sorted(self.cache()), ['1'])
@@ -0,0 +1,66 @@
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from ttm.releaser import ToTestReleaser
+from ttm.snapshot import ResultSnapshot
+
+PROJECT = 'openSUSE:Factory:ToTest:Images'
+RESULT = f"""<resultlist>
+  <result project="{PROJECT}" repository="images" arch="x86_64" code="published" state="published">
+    <status package="livecd" code="succeeded"/>
+    <status package="container" code="succeeded"/>
+    <status package="container:kde" code="succeeded"/>
+  </result>
+  <result project="{PROJECT}" repository="ports" arch="aarch64" code="building" state="building">
+    <status package="livecd" code="building"/>
+  </result>
+</resultlist>"""
+BINARIES = '<binarylist><binary filename="livecd-Snapshot1.iso" size="1000"/></binarylist>'
+
+
+def product(package, max_size=None):
+    return mock.Mock(build_prj=PROJECT, build_repo='images', package=package, archs=['x86_64'],
+                     max_size=max_size, needs_to_contain_product_version=False)
+
+
+class TestReleaserSnapshot(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+        # Dump a snapshot as taken from OBS and replay it offline.
+        api = mock.Mock()
+        api.makeurl.side_effect = lambda path, query=None: '/'.join(path)
+        api.retried_GET.side_effect = lambda url: mock.Mock(read=lambda: (BINARIES if 'livecd' in url else RESULT).encode())
+        snapshot = ResultSnapshot(api)
+        snapshot.project_result(PROJECT)
+        snapshot.binaries(PROJECT, 'images', 'x86_64', 'livecd')
+        self.assertEqual(api.retried_GET.call_count, 2)
+        path = os.path.join(self.directory, 'snapshot.yaml')
+        snapshot.dump(path)
+
+        self.releaser = ToTestReleaser(mock.Mock(apiurl='https://api.example.com', debug=False,
+                                                 caching=False, dryrun=True))
+        self.releaser.project = mock.Mock(products=[product('livecd', 2000), product('container')])
+        self.releaser.get_product_version = lambda: None
+        self.releaser.snapshot = ResultSnapshot.load(path)
+
+    def test_snapshotable(self):
+        self.assertTrue(self.releaser.is_snapshotable())
+        self.assertTrue(self.releaser.all_built_products_in_config())
+
+    def test_too_large(self):
+        self.releaser.project.products[0].max_size = 500
+        self.assertFalse(self.releaser.is_snapshotable())
+
+    def test_product_missing(self):
+        self.releaser.project.products.pop()
+        self.assertFalse(self.releaser.all_built_products_in_config())
+
+    def test_not_in_snapshot(self):
+        self.releaser.project.products.append(mock.Mock(build_prj='openSUSE:Factory', build_repo='images'))
+        with self.assertRaises(KeyError):
+            self.releaser.all_built_products_in_config()
@@ -46,6 +46,7 @@ class CommandLineInterface(ToolBase.CommandLineInterface):
         ToTestPublisher(self.tool).wait_for_published(project, opts.force)
 
     @cmdln.option('--force', action='store_true', help="Just release, don't check")
+    @cmdln.option('--dump-snapshot', metavar='FILE', help='dump the build results seen by the checks to FILE')
     def do_release(self, subcmd, opts, project):
         """${cmd_name}: check and release from project to ToTest
 
@@ -53,7 +54,11 @@ class CommandLineInterface(ToolBase.CommandLineInterface):
         ${cmd_option_list}
         """
 
-        if ToTestReleaser(self.tool).release(project, opts.force) == QAResult.failed:
+        releaser = ToTestReleaser(self.tool)
+        result = releaser.release(project, opts.force)
+        if opts.dump_snapshot:
+            releaser.snapshot.dump(opts.dump_snapshot)
+        if result == QAResult.failed:
             return 1
 
     def do_run(self, subcmd, opts, project):
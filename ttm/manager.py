@@ -16,6 +16,7 @@ from enum import IntEnum
 from lxml import etree as ET
 from osclib.stagingapi import StagingAPI
 from urllib.error import HTTPError
+from ttm.snapshot import ResultSnapshot
 from ttm.totest import ToTest
 
 
@@ -51,6 +52,7 @@ class ToTestManager(ToolBase.ToolBase):
     def setup(self, project):
         self.project = ToTest(project, self.apiurl)
         self.api = StagingAPI(self.apiurl, project=project)
+        self.snapshot = ResultSnapshot(self.api)
 
     def version_file(self, target):
         return f'version_{target}'
@@ -78,14 +80,12 @@ class ToTestManager(ToolBase.ToolBase):
                                   first_product.release_repo, first_product.archs[0])
 
     def binaries_of_product(self, project, product, repo, arch):
-        url = self.api.makeurl(['build', project, repo, arch, product])
         try:
-            f = self.api.retried_GET(url)
+            root = self.snapshot.binaries(project, repo, arch, product)
         except HTTPError:
             return []
 
         ret = []
-        root = ET.parse(f).getroot()
         for binary in root.findall('binary'):
             ret.append(binary.get('filename'))
 
@@ -148,14 +148,21 @@ class ToTestManager(ToolBase.ToolBase):
 
         """
 
+        url = self.api.makeurl(
+            ['build', project, '_result'], {'code': 'failed'})
+        f = self.api.retried_GET(url)
+        return self.repos_done(ET.parse(f).getroot(), codes)
+
+    def repos_done(self, root, codes=None):
+        """Return True if all repos of the build result are either published
+        or unpublished
+
+        """
+
         # coolo's experience says that 'finished' won't be
         # sufficient here, so don't try to add it :-)
         codes = ['published', 'unpublished'] if not codes else codes
 
-        url = self.api.makeurl(
-            ['build', project, '_result'], {'code': 'failed'})
-        f = self.api.retried_GET(url)
-        root = ET.parse(f).getroot()
         ready = True
         for repo in root.findall('result'):
             # ignore ports. 'factory' is used by arm for repos that are not
@@ -11,16 +11,23 @@
 
 
 import json
+import os
 import re
 import yaml
 import pika
+import requests
 import time
+from concurrent.futures import ThreadPoolExecutor
 
 import osc
 from osc.core import makeurl
+from osclib.cache_manager import CacheManager
 from ttm.manager import ToTestManager, NotFoundException, QAResult
 from openqa_client.client import OpenQA_Client
 
+# Number of failed jobs whose comments are fetched at the same time.
+COMMENTS_WORKERS = 8
+
 
 class ToTestPublisher(ToTestManager):
 
@@ -53,16 +60,16 @@ class ToTestPublisher(ToTestManager):
             self.logger.warning(f'we have only {len(jobs)} jobs')
             return QAResult.inprogress
 
+        failed_results = ('failed', 'incomplete', 'timeout_exceeded', 'skipped',
+                          'user_cancelled', 'obsoleted', 'parallel_failed')
+        jobs_comments = self.jobs_comments([job['id'] for job in jobs if job['result'] in failed_results])
+
         in_progress = False
         for job in jobs:
             # print json.dumps(job, sort_keys=True, indent=4)
-            if job['result'] in ('failed', 'incomplete', 'timeout_exceeded', 'skipped',
-                                 'user_cancelled', 'obsoleted', 'parallel_failed'):
+            if job['result'] in failed_results:
                 # print json.dumps(job, sort_keys=True, indent=4), jobname
-                url = makeurl(self.project.openqa_server,
-                              ['api', 'v1', 'jobs', str(job['id']), 'comments'])
-                f = self.api.retried_GET(url)
-                comments = json.load(f)
+                comments = jobs_comments[job['id']]
                 refs = set()
                 labeled = 0
                 to_ignore = False
@@ -242,6 +249,50 @@ class ToTestPublisher(ToTestManager):
 
         self.add_published_tag(group_id, current_snapshot)
 
+    def jobs_comments(self, job_ids):
+        """
+        Return the comments of the jobs by job id, fetched concurrently.
+
+        The comments of the previous run are kept per job together with the
+        Last-Modified header openQA sent for them. They are only transferred
+        again if openQA does not answer the revalidation with 304 Not Modified.
+        """
+        path = os.path.join(CacheManager.directory('ttm-openqa-comments'), f'{self.project.name}.json')
+        try:
+            with open(path) as f:
+                cache = json.load(f)
+        except (OSError, ValueError):
+            cache = {}
+        if not isinstance(cache, dict):
+            cache = {}
+
+        def fetch(job_id):
+            url = makeurl(self.project.openqa_server, ['api', 'v1', 'jobs', str(job_id), 'comments'])
+            cached = cache.get(str(job_id))
+            headers = {}
+            if cached and cached.get('last_modified'):
+                headers['If-Modified-Since'] = cached['last_modified']
+
+            response = self.openqa.do_request(requests.Request('GET', url, headers=headers), parse=False)
+            if 'If-Modified-Since' in headers and response.status_code == 304:
+                return cached, True
+
+            return {'last_modified': response.headers.get('Last-Modified'), 'comments': response.json()}, False
+
+        with ThreadPoolExecutor(max_workers=COMMENTS_WORKERS) as executor:
+            entries = dict(zip(job_ids, executor.map(fetch, job_ids)))
+
+        unchanged = sum(1 for _, not_modified in entries.values() if not_modified)
+        self.logger.info(f'fetched comments of {len(job_ids)} failed jobs, '
+                         f'{unchanged} requests saved as unchanged since the previous run')
+
+        # Only the jobs of the current snapshot are of interest next time.
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w') as f:
+            json.dump({str(job_id): entry for job_id, (entry, _) in entries.items()}, f)
+
+        return {job_id: entry['comments'] for job_id, (entry, _) in entries.items()}
+
     def find_openqa_results(self, snapshot):
         """Return the openqa jobs of a given snapshot and filter out the
         cloned jobs
@@ -10,7 +10,6 @@
 
 import re
 from collections import defaultdict
-from lxml import etree as ET
 
 from ttm.manager import ToTestManager, NotFoundException, QAResult
 
@@ -94,9 +93,7 @@ class ToTestReleaser(ToTestManager):
         if product.max_size is None:
             return True
 
-        url = self.api.makeurl(['build', product.build_prj, product.build_repo, arch, product.package])
-        f = self.api.retried_GET(url)
-        root = ET.parse(f).getroot()
+        root = self.snapshot.binaries(product.build_prj, product.build_repo, arch, product.package)
         for binary in root.findall('binary'):
             if not binary.get('filename', '').endswith('.iso'):
                 continue
@@ -131,13 +128,9 @@ class ToTestReleaser(ToTestManager):
         all_found = True
 
         # Get all results for the product repo from OBS
-        url = self.api.makeurl(['build', project, "_result"],
-                               {'repository': repository,
-                                'multibuild': 1})
-        f = self.api.retried_GET(url)
-        resultlist = ET.parse(f).getroot()
+        resultlist = self.snapshot.project_result(project)
 
-        for result in resultlist.findall('result'):
+        for result in resultlist.findall(f'result[@repository="{repository}"]'):
             arch = result.get('arch')
             for package in result.findall('status[@code="succeeded"]'):
                 packagename = package.get('package')
@@ -172,13 +165,11 @@ class ToTestReleaser(ToTestManager):
         # Collect a list of projects to check
         projects = set([p.build_prj for p in self.project.products])
         for prj in projects:
-            if not self.all_repos_done(prj):
+            prjresult = self.snapshot.project_result(prj)
+            if not self.repos_done(prjresult):
                 all_ok = False
                 continue
 
-            resultxml = self.api.retried_GET(self.api.makeurl(['build', prj, '_result']))
-            prjresult = ET.parse(resultxml).getroot()
-
             for product in self.project.products:
                 if product.build_prj != prj:
                     continue
@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+#
+# Distribute under GPLv2 or GPLv3
+
+import yaml
+from lxml import etree as ET
+
+
+class ResultSnapshot(object):
+    """
+    Build results and binary lists of the build projects as seen by one run.
+
+    Each is fetched from OBS only once so that all products are evaluated
+    from the same view. The snapshot can be dumped to a file and loaded again
+    without api to replay the checks offline, e.g. in tests and benchmarks.
+    """
+
+    def __init__(self, api=None, responses=None):
+        self.api = api
+        self.responses = responses if responses is not None else {}
+
+    def _get(self, key, path, query=None):
+        if key not in self.responses:
+            if self.api is None:
+                raise KeyError(f'{key} is not part of the snapshot')
+            self.responses[key] = self.api.retried_GET(self.api.makeurl(path, query)).read().decode('utf-8')
+        return ET.fromstring(self.responses[key].encode('utf-8'))
+
+    def project_result(self, project):
+        """Build results of all repositories and packages, including multibuild flavors."""
+        return self._get(f'result/{project}', ['build', project, '_result'], {'multibuild': 1})
+
+    def binaries(self, project, repository, arch, package):
+        return self._get(f'binaries/{project}/{repository}/{arch}/{package}',
+                         ['build', project, repository, arch, package])
+
+    def dump(self, filename):
+        with open(filename, 'w') as f:
+            yaml.safe_dump(self.responses, f, default_flow_style=False)
+
+    @classmethod
+    def load(cls, filename):
+        with open(filename, 'r') as f:
+            return cls(responses=yaml.safe_load(f))